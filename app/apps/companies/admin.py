@@ -9,7 +9,14 @@ from .services import activate_companies, deactivate_companies
 @admin.register(Company)
 class CompanyAdmin(admin.ModelAdmin):
     form = CompanyAdminForm
-    list_display = ("name", "domain", "is_active")
+    list_display = (
+        "name",
+        "domain",
+        "is_active",
+        "order_weight",
+        "max_orders_in_flight",
+        "order_queue",
+    )
     list_filter = ("is_active",)
     search_fields = ("name", "domain")
 
@@ -7,7 +7,14 @@ from .services import create_company
 class CompanyAdminForm(forms.ModelForm):
     class Meta:
         model = Company
-        fields = ("name", "domain", "is_active")
+        fields = (
+            "name",
+            "domain",
+            "is_active",
+            "order_weight",
+            "max_orders_in_flight",
+            "order_queue",
+        )
 
     def save(self, commit=True):
         instance = super().save(commit=False)
@@ -17,6 +24,9 @@ class CompanyAdminForm(forms.ModelForm):
                 name=instance.name,
                 domain=instance.domain,
                 is_active=instance.is_active,
+                order_weight=instance.order_weight,
+                max_orders_in_flight=instance.max_orders_in_flight,
+                order_queue=instance.order_queue,
             )
 
         if commit:
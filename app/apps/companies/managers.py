@@ -29,3 +29,10 @@ class TenantManager(models.Manager):
         This is a helper for tests and special cases.
         """
         return super().get_queryset().filter(company=tenant)
+
+    def for_all_tenants(self) -> QuerySet[Any]:
+        """
+        Returns an unfiltered queryset, for background jobs that work
+        across tenants.
+        """
+        return super().get_queryset()
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='max_orders_in_flight',
+            field=models.PositiveIntegerField(blank=True, help_text='Maximum number of orders dispatched to the workers at once. Leave empty for no limit.', null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='order_queue',
+            field=models.CharField(blank=True, help_text="Dedicated Celery queue for this company's orders. Leave empty to use the shared queue.", max_length=100),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='order_weight',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Share of the order processing capacity, relative to other companies.'),
+        ),
+    ]
@@ -12,6 +12,25 @@ class Company(models.Model):
         validators=[validate_subdomain_name],
     )
     is_active = models.BooleanField(default=True, verbose_name="Active")
+    # Order processing is shared fairly between companies, see
+    # apps.orders.scheduling
+    order_weight = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Share of the order processing capacity, relative to other "
+        "companies.",
+    )
+    max_orders_in_flight = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Maximum number of orders dispatched to the workers at once. "
+        "Leave empty for no limit.",
+    )
+    order_queue = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="Dedicated Celery queue for this company's orders. "
+        "Leave empty to use the shared queue.",
+    )
 
     def __str__(self) -> str:
         return self.name
@@ -6,9 +6,24 @@ from .validators import validate_subdomain_name
 
 
 @transaction.atomic
-def create_company(*, name: str, domain: str, is_active: bool = True) -> Company:
+def create_company(
+    *,
+    name: str,
+    domain: str,
+    is_active: bool = True,
+    order_weight: int = 1,
+    max_orders_in_flight: int | None = None,
+    order_queue: str = "",
+) -> Company:
     validate_subdomain_name(domain)
-    company = Company(name=name, domain=domain, is_active=is_active)
+    company = Company(
+        name=name,
+        domain=domain,
+        is_active=is_active,
+        order_weight=order_weight,
+        max_orders_in_flight=max_orders_in_flight,
+        order_queue=order_queue,
+    )
     company.full_clean()
     company.save()
     return company
@@ -1,21 +1,67 @@
+import datetime as dt
+from collections import defaultdict
+
 from core.thread_locals import get_current_tenant
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.db.models import Count, Q
+from django.utils import timezone
 from django.utils.html import format_html
 
+from apps.companies.models import Company
 from apps.users.roles import Role
 
-from .forms import OrderAdminForm
-from .models import Export, Order
-from .services import approve_order_service, create_order_service, retry_order_service
-from .tasks import generate_export_file_task
+from .admission import AdmissionDeniedError, admit_orders
+from .exports import ExportSpec
+from .forms import OrderActionForm, OrderAdminForm
+from .models import BulkOrderAction, Export, ExportShard, Order, OrderLine
+from .selectors import ORDER_SEARCH_FIELDS, search_orders
+from .services import (
+    approve_orders_service,
+    create_order_service,
+    retry_orders_service,
+    start_bulk_order_action_service,
+    start_export_service,
+    start_stock_allocation_service,
+)
+
+
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    fields = ("product", "quantity")
+    readonly_fields = ("product", "quantity")
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):  # noqa: ANN001, ANN201, ARG002
+        return False
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    search_fields = ("reference_code", "product__name", "created_by__user__username")
-    readonly_fields = ("reference_code", "created_at", "updated_at")
+    search_fields = ORDER_SEARCH_FIELDS
+    date_hierarchy = "created_at"
+    action_form = OrderActionForm
+    readonly_fields = (
+        "reference_code",
+        "created_at",
+        "updated_at",
+        "attempts",
+        "last_error",
+    )
     form = OrderAdminForm
 
+    def get_inlines(self, request, obj):  # noqa: ANN001, ANN201, ARG002
+        """Shows the lines of multi-line orders."""
+        if obj is not None and obj.has_lines:
+            return (OrderLineInline,)
+        return ()
+
+    def get_search_results(self, request, queryset, search_term):  # noqa: ANN001, ANN201, ARG002
+        """Searches like exports made from a search do, see search_orders."""
+        return search_orders(queryset, search_term), False
+
     def get_list_filter(self, request):
         """
         Dynamically sets the filters, showing 'company' only for superusers.
@@ -35,6 +81,7 @@ class OrderAdmin(admin.ModelAdmin):
             "quantity",
             "status",
             "has_been_processed",
+            "attempts",
             "created_by",
             "created_at",
         )
@@ -54,12 +101,22 @@ class OrderAdmin(admin.ModelAdmin):
         """
         if not change:  # Only on creation
             company = get_current_tenant()
-            create_order_service(
-                product=obj.product,
-                quantity=obj.quantity,
-                created_by=request.user.profile,
-                company=company,
-            )
+            try:
+                admit_orders(company=company, user_id=request.user.pk)
+                create_order_service(
+                    product=obj.product,
+                    quantity=obj.quantity,
+                    created_by=request.user.profile,
+                    company=company,
+                )
+            except AdmissionDeniedError as e:
+                self.message_user(
+                    request,
+                    f"{e} Retry in {e.retry_after} seconds.",
+                    level=messages.ERROR,
+                )
+            except ValueError as e:
+                self.message_user(request, str(e), level=messages.ERROR)
 
     def has_add_permission(self, request):
         return True
@@ -91,42 +148,189 @@ class OrderAdmin(admin.ModelAdmin):
 
         return qs.filter(company=profile.company)
 
+    def _start_in_background(
+        self,
+        request,  # noqa: ANN001
+        action: str,
+        order_ids: dict[int, list[int]],
+    ) -> bool:
+        """
+        Hands selections above ORDER_ADMIN_SYNC_LIMIT orders to a background
+        task, one per company. Returns whether it did.
+        """
+        total = sum(len(ids) for ids in order_ids.values())
+        if total <= settings.ORDER_ADMIN_SYNC_LIMIT:
+            return False
+        companies = Company.objects.in_bulk(order_ids.keys())
+        for company_id, ids in order_ids.items():
+            start_bulk_order_action_service(
+                action=action,
+                company=companies[company_id],
+                order_ids=ids,
+                requested_by=getattr(request.user, "profile", None),
+            )
+        self.message_user(
+            request,
+            f"{total} orders are being processed in the background. "
+            "Follow the progress under Bulk order actions.",
+        )
+        return True
+
+    @staticmethod
+    def _order_ids_by_company(queryset) -> dict[int, list[int]]:  # noqa: ANN001
+        order_ids: defaultdict[int, list[int]] = defaultdict(list)
+        for company_id, order_id in queryset.order_by("pk").values_list(
+            "company_id",
+            "pk",
+        ):
+            order_ids[company_id].append(order_id)
+        return order_ids
+
     def approve_selected_orders(self, orderadmin, request, queryset) -> None:  # noqa: ANN001
-        """Triggers processing for selected PENDING orders."""
-        for order in queryset:
-            approve_order_service(order=order)
+        """
+        Approves the selected PENDING and PROCESSING orders as a set: each
+        product is locked once and the statuses are written in bulk.
+        Backordered orders are left to wait for stock.
+        """
+        order_ids = self._order_ids_by_company(
+            queryset.filter(status__in=Order.APPROVABLE_STATUSES),
+        )
+        backordered = queryset.filter(status=Order.Status.BACKORDERED).count()
+        if backordered:
+            self.message_user(
+                request,
+                f"{backordered} backordered orders were skipped: they are "
+                "filled when their product is restocked.",
+                level=messages.WARNING,
+            )
+        action = BulkOrderAction.Action.APPROVE
+        if self._start_in_background(request, action, order_ids):
+            return
+        approved = failed = 0
+        companies = Company.objects.in_bulk(order_ids.keys())
+        for company_id, ids in order_ids.items():
+            result = approve_orders_service(
+                company=companies[company_id],
+                order_ids=ids,
+            )
+            approved += len(result["approved"])
+            failed += len(result["failed"])
         self.message_user(
             request,
-            f"{queryset.count()} orders have been queued for approval.",
+            f"{approved} orders have been approved, "
+            f"{failed} failed due to insufficient stock.",
         )
 
-    def retry_failed_orders(self, orderadmin, request, queryset) -> None:  # noqa: ANN001
-        """Resets and re-queues selected FAILED orders."""
-        failed_orders = queryset.filter(status=Order.Status.FAILED)
-        for order in failed_orders:
-            retry_order_service(order=order)
+    def allocate_product_stock(self, orderadmin, request, queryset) -> None:  # noqa: ANN001, ARG002
+        """
+        Shares the stock of the selected orders' products between all their
+        undispatched pending orders without a reservation, under
+        ORDER_ALLOCATION_POLICY, in a background task per product. Filled
+        orders are reserved and then processed as usual.
+        """
+        product_ids: defaultdict[int, set[int]] = defaultdict(set)
+        for company_id, product_id in queryset.filter(
+            status=Order.Status.PENDING,
+            product__isnull=False,
+        ).values_list("company_id", "product_id"):
+            product_ids[company_id].add(product_id)
+        companies = Company.objects.in_bulk(product_ids.keys())
+        for company_id, ids in product_ids.items():
+            start_stock_allocation_service(
+                company=companies[company_id],
+                product_ids=ids,
+            )
         self.message_user(
             request,
-            f"{failed_orders.count()} failed orders have been re-queued for processing.",  # noqa: E501
+            f"Stock allocation has been started for "
+            f"{sum(len(ids) for ids in product_ids.values())} products.",
         )
 
-    def export_selected_orders(self, orderadmin, request, queryset) -> None:
-        """Exports selected orders to a CSV file via a background task."""
-        if not queryset:
-            return
-        company = get_current_tenant()
-        export = Export.objects.create(
-            requested_by=request.user.profile,
-            company=company,
+    def retry_failed_orders(self, orderadmin, request, queryset) -> None:  # noqa: ANN001
+        """
+        Resets and re-queues the selected FAILED and dead-lettered orders as
+        a set, reserving stock once per product.
+        """
+        order_ids = self._order_ids_by_company(
+            queryset.filter(
+                status__in=[Order.Status.FAILED, Order.Status.DEAD_LETTER],
+            ),
         )
-        order_ids = list(queryset.values_list("id", flat=True))
-        generate_export_file_task.delay(
-            export_id=export.pk,
-            order_ids=order_ids,
-            company_id=company.pk,
+        action = BulkOrderAction.Action.RETRY
+        if self._start_in_background(request, action, order_ids):
+            return
+        retried = rejected = 0
+        companies = Company.objects.in_bulk(order_ids.keys())
+        for company_id, ids in order_ids.items():
+            result = retry_orders_service(
+                company=companies[company_id],
+                order_ids=ids,
+            )
+            retried += len(result["retried"])
+            rejected += len(result["rejected"])
+        if rejected:
+            self.message_user(
+                request,
+                f"{rejected} orders could not be retried: not enough stock.",
+                level=messages.WARNING,
+            )
+        self.message_user(
+            request,
+            f"{retried} failed orders have been re-queued for processing.",
         )
+
+    def export_selected_orders(self, orderadmin, request, queryset) -> None:  # noqa: ANN001
+        """
+        Exports the selected orders, in the format picked next to the
+        action, to a file written by a background task. An explicit
+        selection is at most a page of orders and is sent as ids; when all
+        orders matching the filters are selected, the export records the
+        filters instead.
+        """
+        if not queryset.exists():
+            return
+        spec: ExportSpec
+        if request.POST.get("select_across") == "1":
+            spec = self._export_filters(request)
+        else:
+            spec = {"ids": list(queryset.order_by("pk").values_list("pk", flat=True))}
+        try:
+            start_export_service(
+                company=get_current_tenant(),
+                spec=spec,
+                export_format=request.POST.get("export_format") or Export.Format.CSV,
+                requested_by=request.user.profile,
+            )
+        except ValueError as e:
+            self.message_user(request, str(e), level=messages.ERROR)
+            return
         self.message_user(request, "Export task has been started.")
 
+    @staticmethod
+    def _export_filters(request) -> ExportSpec:  # noqa: ANN001
+        """The changelist's filters, date range and search as an ExportSpec."""
+        params = request.GET
+        spec: ExportSpec = {}
+        if status := params.get("status__exact"):
+            spec["status"] = int(status)
+        if processed := params.get("has_been_processed__exact"):
+            spec["processed"] = processed == "1"
+        if year := params.get("created_at__year"):
+            # The bounds of the year, month or day picked, as the admin does
+            month, day = params.get("created_at__month"), params.get("created_at__day")
+            start = dt.datetime(int(year), int(month or 1), int(day or 1))  # noqa: DTZ001
+            if day:
+                end = start + dt.timedelta(days=1)
+            elif month:
+                end = (start + dt.timedelta(days=32)).replace(day=1)
+            else:
+                end = start.replace(year=start.year + 1)
+            spec["created_from"] = timezone.make_aware(start).isoformat()
+            spec["created_to"] = timezone.make_aware(end).isoformat()
+        if search := params.get(SEARCH_VAR):
+            spec["search"] = search
+        return spec
+
     def get_actions(self, request):  # noqa: ANN001, ANN201
         """
         Dynamically determine which actions are available based on user role.
@@ -140,7 +344,7 @@ class OrderAdmin(admin.ModelAdmin):
 
         user = request.user
 
-        # Only allow admins and superusers to approve or export
+        # Only allow admins and superusers to approve, allocate or export
         if user.is_superuser or (
             user.profile.role and user.profile.role.name == Role.ADMIN
         ):
@@ -149,6 +353,11 @@ class OrderAdmin(admin.ModelAdmin):
                 "approve_selected_orders",
                 "Approve selected orders",
             )
+            actions["allocate_product_stock"] = (
+                self.allocate_product_stock,
+                "allocate_product_stock",
+                "Allocate stock of the selected orders' products",
+            )
             actions["export_selected_orders"] = (
                 self.export_selected_orders,
                 "export_selected_orders",
@@ -165,6 +374,17 @@ class OrderAdmin(admin.ModelAdmin):
         return actions
 
 
+class ExportShardInline(admin.TabularInline):
+    model = ExportShard
+    fields = ("index", "first_pk", "last_pk", "status", "row_count")
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):  # noqa: ANN001, ANN201, ARG002
+        return False
+
+
 @admin.register(Export)
 class ExportAdmin(admin.ModelAdmin):
     list_display = (
@@ -172,9 +392,14 @@ class ExportAdmin(admin.ModelAdmin):
         "company",
         "requested_by",
         "status",
+        "format",
+        "progress",
+        "row_count",
+        "byte_size",
         "created_at",
         "download_link",
     )
+    inlines = (ExportShardInline,)
     list_filter = ("status",)
 
     def get_queryset(self, request):  # noqa: ANN001, ANN201
@@ -186,11 +411,25 @@ class ExportAdmin(admin.ModelAdmin):
             super()
             .get_queryset(request)
             .select_related("company", "requested_by__user")
+            .annotate(
+                shards_total=Count("shards"),
+                shards_ready=Count(
+                    "shards",
+                    filter=Q(shards__status=Export.Status.READY),
+                ),
+            )
         )
         if request.user.is_superuser:
             return qs
         return qs.filter(company=request.user.profile.company)
 
+    @admin.display(description="Shards")
+    def progress(self, obj):  # noqa: ANN001, ANN201
+        """How many shards of a sharded export are written."""
+        if not obj.shards_total:
+            return "-"
+        return f"{obj.shards_ready} of {obj.shards_total}"
+
     def get_list_filter(self, request):
         """Show company filter only for superusers."""
         if request.user.is_superuser:
@@ -215,3 +454,48 @@ class ExportAdmin(admin.ModelAdmin):
 
     def has_delete_permission(self, request, obj=None) -> bool:  # noqa: ANN001, ARG002
         return True  # Allow superusers to clean up old exports if needed
+
+
+@admin.register(BulkOrderAction)
+class BulkOrderActionAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "action",
+        "status",
+        "progress",
+        "succeeded",
+        "rejected",
+        "requested_by",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("action", "status")
+    exclude = ("order_ids",)
+
+    def get_queryset(self, request):  # noqa: ANN001, ANN201
+        """Only the current user's company, unless the user is a superuser."""
+        qs = (
+            super()
+            .get_queryset(request)
+            .select_related("company", "requested_by__user")
+        )
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(company=request.user.profile.company)
+
+    @admin.display(description="Progress")
+    def progress(self, obj):  # noqa: ANN001, ANN201
+        return format_html(
+            '<progress value="{}" max="{}"></progress> {} / {}',
+            obj.processed,
+            obj.total or 1,
+            obj.processed,
+            obj.total,
+        )
+
+    # --- Bulk actions are only created via the OrderAdmin actions ---
+    def has_add_permission(self, request) -> bool:  # noqa: ANN001, ARG002
+        return False
+
+    def has_change_permission(self, request, obj=None) -> bool:  # noqa: ANN001, ARG002
+        return False
@@ -0,0 +1,150 @@
+"""
+Admission control for order creation.
+
+Every request that creates orders draws one token per order from two token
+buckets, one for the company and one for the user, kept in the shared
+cache so all web processes see the same buckets. A company whose backlog
+of PENDING orders is above ORDER_ADMISSION_MAX_BACKLOG is turned away until
+the workers catch up. Rejections carry the number of seconds to wait, which
+the API sends back as Retry-After.
+"""
+
+import contextlib
+import math
+import time
+from collections.abc import Iterator
+
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+
+from apps.companies.models import Company
+
+from .models import Order
+
+# How long to wait for another process to update a bucket
+LOCK_WAIT_SECONDS = 0.05
+LOCK_TIMEOUT_SECONDS = 1
+
+
+class AdmissionDeniedError(Exception):
+    def __init__(self, message: str, *, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    A bucket holding up to `capacity` tokens, refilled at `rate` tokens per
+    second. The level and the time of the last update are stored under `key`
+    and changed under a short lock taken with the cache's atomic `add`.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        *,
+        rate: float,
+        capacity: int,
+        cache: BaseCache | None = None,
+    ) -> None:
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.cache = cache or caches[settings.ORDER_RATE_LIMIT_CACHE]
+
+    def take(self, tokens: int = 1) -> float:
+        """
+        Takes `tokens` if the bucket holds them and returns 0, otherwise takes
+        nothing and returns the seconds until they would be available.
+        Requests larger than the bucket need it full.
+        """
+        tokens = min(tokens, self.capacity)
+        with self._lock():
+            level, now = self._level()
+            if level < tokens:
+                return (tokens - level) / self.rate
+            self._store(level - tokens, now)
+        return 0.0
+
+    def give_back(self, tokens: int = 1) -> None:
+        """Returns tokens taken for a request that was turned away after all."""
+        with self._lock():
+            level, now = self._level()
+            self._store(min(self.capacity, level + tokens), now)
+
+    def _level(self) -> tuple[float, float]:
+        now = time.time()
+        level, updated = self.cache.get(self.key, (self.capacity, now))
+        return min(self.capacity, level + (now - updated) * self.rate), now
+
+    def _store(self, level: float, now: float) -> None:
+        # A bucket left alone until it is full again can simply expire
+        timeout = math.ceil((self.capacity - level) / self.rate) + 1
+        self.cache.set(self.key, (level, now), timeout=timeout)
+
+    @contextlib.contextmanager
+    def _lock(self) -> Iterator[None]:
+        lock_key = f"{self.key}:lock"
+        deadline = time.monotonic() + LOCK_WAIT_SECONDS
+        while not (locked := self.cache.add(lock_key, 1, timeout=LOCK_TIMEOUT_SECONDS)):
+            if time.monotonic() > deadline:
+                # Fail open: a slightly inexact bucket beats a stuck request
+                break
+            time.sleep(0.001)
+        try:
+            yield
+        finally:
+            if locked:
+                self.cache.delete(lock_key)
+
+
+def get_pending_backlog(*, company: Company) -> int:
+    """
+    The company's number of PENDING orders, cached for
+    ORDER_ADMISSION_BACKLOG_CACHE_SECONDS so busy tenants do not count their
+    backlog on every request.
+    """
+    cache = caches[settings.ORDER_RATE_LIMIT_CACHE]
+    key = f"orders:backlog:{company.pk}"
+    backlog = cache.get(key)
+    if backlog is None:
+        backlog = (
+            Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+            .filter(status=Order.Status.PENDING)
+            .count()
+        )
+        cache.set(key, backlog, timeout=settings.ORDER_ADMISSION_BACKLOG_CACHE_SECONDS)
+    return backlog
+
+
+def admit_orders(*, company: Company, user_id: int, count: int = 1) -> None:
+    """
+    Lets a request creating `count` orders through, or raises
+    AdmissionDeniedError with the seconds to wait before retrying.
+    """
+    if get_pending_backlog(company=company) >= settings.ORDER_ADMISSION_MAX_BACKLOG:
+        msg = "Too many orders are waiting to be processed. Try again later."
+        raise AdmissionDeniedError(
+            msg,
+            retry_after=settings.ORDER_ADMISSION_RETRY_AFTER,
+        )
+
+    limits = settings.ORDER_RATE_LIMITS
+    tenant = TokenBucket(
+        f"orders:rate:company:{company.pk}",
+        rate=limits["TENANT"]["RATE"],
+        capacity=limits["TENANT"]["BURST"],
+    )
+    user = TokenBucket(
+        f"orders:rate:user:{user_id}",
+        rate=limits["USER"]["RATE"],
+        capacity=limits["USER"]["BURST"],
+    )
+    wait = tenant.take(count)
+    if not wait:
+        wait = user.take(count)
+        if wait:
+            tenant.give_back(count)
+    if wait:
+        msg = "Orders are being created too fast. Try again later."
+        raise AdmissionDeniedError(msg, retry_after=math.ceil(wait))
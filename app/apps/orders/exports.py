@@ -0,0 +1,281 @@
+"""
+Streaming generation of order exports.
+
+Orders are read as plain tuples with `values_list(...).iterator()`, joined
+to their product's SKU in the same query, and written to a temporary file
+ORDER_EXPORT_CHUNK_SIZE rows at a time. Memory use depends on the chunk
+size, not on the number of orders exported, and the finished file is
+handed to the storage without being read back into memory.
+
+Besides CSV, exports may be gzip- or zstd-compressed CSV, NDJSON, or
+Parquet with a row group per chunk; each is written as the rows arrive.
+
+Exports of more than ORDER_EXPORT_SHARD_SIZE orders are split into ranges
+of consecutive ids, see plan_export_shards, written to part files by
+parallel workers and merged by merge_export_parts.
+
+Which orders an export covers is stored on the export as an ExportSpec,
+the filters the admin had applied, rather than as a list of order ids, so
+the task message stays small and the query can use the indexes.
+"""
+
+import contextlib
+import csv
+import gzip
+import importlib.util
+import io
+import itertools
+import json
+import shutil
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from typing import IO, TypedDict
+
+from django.conf import settings
+from django.db.models import Max, Min, QuerySet
+
+from apps.companies.models import Company
+
+from .models import Export, Order, OrderLine
+
+
+class ExportSpec(TypedDict, total=False):
+    """
+    The orders of an export, within its company. Every key is optional and
+    narrows the export; `ids` is only used for small explicit selections.
+    """
+
+    ids: list[int]
+    status: int
+    processed: bool
+    # ISO 8601 datetimes, from inclusive and to exclusive
+    created_from: str
+    created_to: str
+    # Words matched like the admin search box, see search_orders
+    search: str
+
+
+EXPORT_HEADER = ("Reference Code", "Product SKU", "Quantity", "Status", "Created At")
+# Field names of the NDJSON and Parquet formats
+EXPORT_FIELDS = ("reference_code", "product_sku", "quantity", "status", "created_at")
+
+# The modules the formats beyond the standard library need, installed by the
+# `exports` extra
+_FORMAT_BACKENDS = {
+    Export.Format.CSV_ZSTD: "zstandard",
+    Export.Format.PARQUET: "pyarrow",
+}
+
+_COLUMNS = ("pk", "reference_code", "product__sku", "quantity", "status", "created_at")
+
+
+def available_export_formats() -> list[tuple[str, str]]:
+    """The choices of Export.Format whose backend can be imported here."""
+    return [
+        (value, label)
+        for value, label in Export.Format.choices
+        if value not in _FORMAT_BACKENDS
+        or importlib.util.find_spec(_FORMAT_BACKENDS[value]) is not None
+    ]
+
+
+def _line_skus(*, company: Company, order_ids: list[int]) -> dict[int, str]:
+    """The SKUs of the lines of multi-line orders, joined by order id."""
+    skus: defaultdict[int, list[str]] = defaultdict(list)
+    if order_ids:
+        for order_id, sku in (
+            OrderLine.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+            .filter(order__in=order_ids)
+            .order_by("order_id", "product_id")
+            .values_list("order_id", "product__sku")
+        ):
+            skus[order_id].append(str(sku))
+    return {order_id: ";".join(order_skus) for order_id, order_skus in skus.items()}
+
+
+def iter_export_rows(
+    orders: QuerySet[Order],
+    *,
+    company: Company,
+    chunk_size: int | None = None,
+) -> Iterator[tuple]:
+    """
+    Yields the export rows of `orders` in id order. Only one chunk of rows
+    is held at a time, and each chunk costs at most one extra query, for
+    the lines of its multi-line orders.
+    """
+    chunk_size = chunk_size or settings.ORDER_EXPORT_CHUNK_SIZE
+    labels = dict(Order.Status.choices)
+    rows = orders.order_by("pk").values_list(*_COLUMNS).iterator(chunk_size=chunk_size)
+    for chunk in itertools.batched(rows, chunk_size):
+        # Multi-line orders have no product, they list the SKUs of their lines
+        line_skus = _line_skus(
+            company=company,
+            order_ids=[row[0] for row in chunk if row[2] is None],
+        )
+        for pk, reference_code, sku, quantity, status, created_at in chunk:
+            yield (
+                str(reference_code),
+                str(sku) if sku is not None else line_skus.get(pk, ""),
+                quantity,
+                labels[status],
+                created_at,
+            )
+
+
+def _text_row(row: tuple) -> tuple:
+    reference_code, sku, quantity, status, created_at = row
+    return (
+        reference_code,
+        sku,
+        quantity,
+        status,
+        created_at.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+
+
+def _write_csv(rows: Iterable[tuple], file: IO[bytes], *, header: bool) -> int:
+    text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    if header:
+        writer.writerow(EXPORT_HEADER)
+    count = 0
+    for row in rows:
+        writer.writerow(_text_row(row))
+        count += 1
+    text.flush()
+    # Leave `file` open for the caller
+    text.detach()
+    return count
+
+
+def _write_ndjson(rows: Iterable[tuple], file: IO[bytes]) -> int:
+    count = 0
+    for row in rows:
+        record = dict(zip(EXPORT_FIELDS, row, strict=True))
+        record["created_at"] = record["created_at"].isoformat()
+        file.write(json.dumps(record).encode() + b"\n")
+        count += 1
+    return count
+
+
+def _write_parquet(rows: Iterable[tuple], file: IO[bytes], chunk_size: int) -> int:
+    """Writes a Parquet row group per chunk of rows."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("reference_code", pa.string()),
+            ("product_sku", pa.string()),
+            ("quantity", pa.int64()),
+            ("status", pa.string()),
+            ("created_at", pa.timestamp("us", tz="UTC")),
+        ],
+    )
+    count = 0
+    with pq.ParquetWriter(file, schema) as writer:
+        for chunk in itertools.batched(rows, chunk_size):
+            records = [dict(zip(EXPORT_FIELDS, row, strict=True)) for row in chunk]
+            writer.write_table(pa.Table.from_pylist(records, schema=schema))
+            count += len(chunk)
+    return count
+
+
+@contextlib.contextmanager
+def _compressed(file: IO[bytes], export_format: str) -> Iterator[IO[bytes]]:
+    """`file`, compressed if the format asks for it, left open on exit."""
+    if export_format == Export.Format.CSV_GZIP:
+        with gzip.GzipFile(fileobj=file, mode="wb") as compressed:
+            yield compressed  # pyright: ignore[reportReturnType]
+    elif export_format == Export.Format.CSV_ZSTD:
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor()
+        with compressor.stream_writer(file, closefd=False) as compressed:
+            yield compressed  # pyright: ignore[reportReturnType]
+    else:
+        yield file
+
+
+def write_export(
+    rows: Iterable[tuple],
+    file: IO[bytes],
+    *,
+    export_format: str = Export.Format.CSV,
+    chunk_size: int | None = None,
+    header: bool = True,
+) -> int:
+    """
+    Writes `rows` from iter_export_rows to the binary `file` in one of
+    Export.Format, as they arrive. Returns the number of rows written.
+    Parquet needs pyarrow and zstd needs zstandard, see the `exports` extra.
+    `header=False` leaves out the CSV header, for all parts but the first.
+    """
+    if export_format == Export.Format.NDJSON:
+        return _write_ndjson(rows, file)
+    if export_format == Export.Format.PARQUET:
+        chunk_size = chunk_size or settings.ORDER_EXPORT_CHUNK_SIZE
+        return _write_parquet(rows, file, chunk_size)
+    with _compressed(file, export_format) as compressed:
+        return _write_csv(rows, compressed, header=header)
+
+
+def plan_export_shards(
+    orders: QuerySet[Order],
+    *,
+    shard_size: int,
+) -> list[tuple[int, int]]:
+    """
+    Splits `orders` into ranges of consecutive ids holding `shard_size`
+    orders each, the last one fewer, as inclusive (first, last) pairs. Each
+    boundary is found in SQL by a keyset query on the primary key index
+    that returns two ids, so no id list is ever held in memory.
+    """
+    bounds = orders.aggregate(first=Min("pk"), last=Max("pk"))
+    if bounds["first"] is None:
+        return []
+    pks = orders.order_by("pk").values_list("pk", flat=True)
+    ranges: list[tuple[int, int]] = []
+    first = bounds["first"]
+    while True:
+        # The shard's last id and the next shard's first one
+        edge = list(pks.filter(pk__gte=first)[shard_size - 1 : shard_size + 1])
+        if len(edge) < 2:
+            ranges.append((first, bounds["last"]))
+            return ranges
+        ranges.append((first, edge[0]))
+        first = edge[1]
+
+
+def _merge_parquet(parts: Iterable[IO[bytes]], file: IO[bytes]) -> None:
+    """Copies the row groups of the parts one at a time."""
+    import pyarrow.parquet as pq
+
+    writer = None
+    for part in parts:
+        parquet = pq.ParquetFile(part)
+        if writer is None:
+            writer = pq.ParquetWriter(file, parquet.schema_arrow)
+        for row_group in range(parquet.num_row_groups):
+            writer.write_table(parquet.read_row_group(row_group))
+    if writer is not None:
+        writer.close()
+
+
+def merge_export_parts(
+    parts: Iterable[IO[bytes]],
+    file: IO[bytes],
+    *,
+    export_format: str,
+) -> None:
+    """
+    Writes the part files of a sharded export, in order, as one file. Text
+    parts are appended as they are: gzip members and zstd frames may follow
+    each other, and only the first CSV part has a header.
+    """
+    if export_format == Export.Format.PARQUET:
+        _merge_parquet(parts, file)
+        return
+    for part in parts:
+        shutil.copyfileobj(part, file)
@@ -1,9 +1,30 @@
 from django import forms
+from django.contrib.admin.helpers import ActionForm
 
-from .models import Order
+from .exports import available_export_formats
+from .models import Export, Order
 
 
 class OrderAdminForm(forms.ModelForm):
     class Meta:
         model = Order
         fields = ["product", "quantity"]  # noqa: RUF012
+
+    def __init__(self, *args, **kwargs) -> None:  # noqa: ANN002, ANN003
+        super().__init__(*args, **kwargs)
+        # Orders added here are single-line; only the API creates multi-line
+        # orders
+        self.fields["product"].required = True
+
+
+class OrderActionForm(ActionForm):
+    """
+    The order admin's action bar, with the format of exports. Only formats
+    whose backend is installed are offered.
+    """
+
+    export_format = forms.ChoiceField(
+        choices=available_export_formats,
+        initial=Export.Format.CSV,
+        required=False,
+    )
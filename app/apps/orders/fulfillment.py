@@ -0,0 +1,369 @@
+"""
+Gateway for the external fulfillment call made while processing an order.
+
+The gateway runs calls on asyncio so a single worker can keep hundreds of
+them in flight. Concurrency is bounded per worker, every call gets a
+timeout, and a circuit breaker stops calling a backend that keeps failing.
+Backends are pluggable through the ORDER_FULFILLMENT setting.
+"""
+
+import asyncio
+import functools
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class FulfillmentError(Exception):
+    """The external fulfillment call did not succeed."""
+
+
+class FulfillmentTimeoutError(FulfillmentError):
+    """The external fulfillment call took longer than the configured timeout."""
+
+
+class CircuitOpenError(FulfillmentError):
+    """The circuit breaker is open, so the call was not attempted."""
+
+
+@dataclass(frozen=True)
+class FulfillmentRequest:
+    order_id: int
+    reference_code: uuid.UUID
+    # None for a multi-line order, whose (product id, quantity) pairs are in
+    # `lines`; one call covers the whole order
+    product_id: int | None
+    quantity: int
+    lines: tuple[tuple[int, int], ...] = ()
+
+
+class FulfillmentBackend(Protocol):
+    async def fulfill(self, request: FulfillmentRequest) -> None: ...
+
+
+# --- Latency distributions for the fake backend ---
+
+
+class LatencyDistribution(Protocol):
+    def sample(self, rng: random.Random) -> float: ...
+
+
+@dataclass(frozen=True)
+class ConstantLatency:
+    seconds: float
+
+    def sample(self, rng: random.Random) -> float:  # noqa: ARG002
+        return self.seconds
+
+
+@dataclass(frozen=True)
+class UniformLatency:
+    low: float
+    high: float
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.uniform(self.low, self.high)
+
+
+@dataclass(frozen=True)
+class LogNormalLatency:
+    """Long-tailed latency, typical of real HTTP APIs."""
+
+    median: float
+    sigma: float = 0.5
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.lognormvariate(math.log(self.median), self.sigma)
+
+
+LATENCY_DISTRIBUTIONS: dict[str, Callable[..., LatencyDistribution]] = {
+    "constant": ConstantLatency,
+    "uniform": UniformLatency,
+    "lognormal": LogNormalLatency,
+}
+
+
+class FakeFulfillmentBackend:
+    """
+    Local stand-in for the fulfillment API. It only sleeps, so it can be
+    used to benchmark the gateway with no network. Without options it
+    waits ORDER_EXTERNAL_CALL_SECONDS per call.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: str = "constant",
+        latency_options: dict[str, float] | None = None,
+        failure_rate: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        self.distribution = (
+            LATENCY_DISTRIBUTIONS[latency](**latency_options)
+            if latency_options is not None
+            else None
+        )
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+
+    def _latency(self) -> float:
+        if self.distribution is None:
+            return settings.ORDER_EXTERNAL_CALL_SECONDS
+        return self.distribution.sample(self.rng)
+
+    async def fulfill(self, request: FulfillmentRequest) -> None:
+        logger.info(
+            "Order %s: Simulating external API call...",
+            request.reference_code,
+        )
+        await asyncio.sleep(self._latency())
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            msg = f"Simulated fulfillment failure for order {request.reference_code}."
+            raise FulfillmentError(msg)
+        logger.info(
+            "Order %s: External call simulation finished.",
+            request.reference_code,
+        )
+
+
+# --- Circuit breaker ---
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    until `reset_timeout` seconds have passed. After that, the circuit is
+    half-open and lets exactly one trial call through, rejecting the others
+    as if it were open: a success closes the circuit, a failure re-opens it.
+    A trial that never reports back is replaced after another
+    `reset_timeout`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        *,
+        failure_threshold: int,
+        reset_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == self.HALF_OPEN:
+                # The trial call re-arms the timeout, so the calls made
+                # while it runs find the circuit open
+                self.opened_at = self.clock()
+            return state != self.OPEN
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        state = self.state
+        if state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if state != self.OPEN:
+                logger.warning("Fulfillment circuit breaker opened.")
+            self.opened_at = self.clock()
+
+
+# --- Gateway ---
+
+
+# A call waiting for a slot, and the loop it waits on
+_Waiter = tuple[asyncio.AbstractEventLoop, asyncio.Future]
+
+
+class ConcurrencyLimiter:
+    """
+    Bounds the calls in flight across every event loop of the process.
+    Each synchronous gateway call runs its own loop, which an
+    asyncio.Semaphore is bound to, so the limit of the whole worker needs a
+    thread-safe counter. Freed slots go to waiters in FIFO order.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._waiters: deque[_Waiter] = deque()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_use < self.limit and not self._waiters:
+                self.in_use += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                handed_over = waiter not in self._waiters
+                if not handed_over:
+                    self._waiters.remove(waiter)
+            # A slot handed over before the cancellation is given back here;
+            # one handed over after it is given back by `_hand_over`
+            if handed_over and waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self.in_use -= 1
+                return
+            loop, future = self._waiters.popleft()
+        # The slot passes to the waiter as is, so `in_use` does not change
+        loop.call_soon_threadsafe(self._hand_over, future)
+
+    def _hand_over(self, future: asyncio.Future) -> None:
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        self.release()
+
+
+class AsyncFulfillmentGateway:
+    def __init__(
+        self,
+        *,
+        backend: FulfillmentBackend,
+        max_concurrency: int,
+        timeout: float,
+        circuit_breaker: CircuitBreaker,
+    ) -> None:
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.circuit_breaker = circuit_breaker
+        # Shared by every call, so the limit holds for the whole worker
+        self.limiter = ConcurrencyLimiter(max_concurrency)
+
+    async def _fulfill(self, request: FulfillmentRequest) -> None:
+        async with self.limiter:
+            if not self.circuit_breaker.allow_request():
+                msg = (
+                    "Fulfillment circuit is open; "
+                    f"order {request.reference_code} was not sent."
+                )
+                raise CircuitOpenError(msg)
+            try:
+                async with asyncio.timeout(self.timeout):
+                    await self.backend.fulfill(request)
+            except TimeoutError as exc:
+                self.circuit_breaker.record_failure()
+                msg = (
+                    f"Fulfillment of order {request.reference_code} "
+                    f"timed out after {self.timeout}s."
+                )
+                raise FulfillmentTimeoutError(msg) from exc
+            except Exception as exc:
+                self.circuit_breaker.record_failure()
+                if isinstance(exc, FulfillmentError):
+                    raise
+                msg = f"Fulfillment of order {request.reference_code} failed: {exc}"
+                raise FulfillmentError(msg) from exc
+            self.circuit_breaker.record_success()
+
+    async def fulfill_many(
+        self,
+        requests: list[FulfillmentRequest],
+    ) -> list[FulfillmentError | None]:
+        """
+        Runs all calls concurrently. At most `max_concurrency` calls of the
+        gateway are in flight at a time, across all concurrent batches.
+        Returns one entry per request: None on success, else the error.
+        """
+        results = await asyncio.gather(
+            *(self._fulfill(request) for request in requests),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(
+                result,
+                FulfillmentError,
+            ):
+                raise result
+        return results  # pyright: ignore[reportReturnType]
+
+    def fulfill_many_sync(
+        self,
+        requests: list[FulfillmentRequest],
+    ) -> list[FulfillmentError | None]:
+        """Entry point for synchronous callers such as Celery tasks."""
+        if not requests:
+            return []
+        return asyncio.run(self.fulfill_many(requests))
+
+    def fulfill_sync(self, request: FulfillmentRequest) -> None:
+        """Fulfills a single request, raising FulfillmentError on failure."""
+        [error] = self.fulfill_many_sync([request])
+        if error is not None:
+            raise error
+
+
+@functools.cache
+def get_fulfillment_gateway() -> AsyncFulfillmentGateway:
+    """
+    Builds the gateway from the ORDER_FULFILLMENT setting. It is cached per
+    process so the circuit breaker state is shared by all tasks of a worker.
+    """
+    config: dict[str, Any] = settings.ORDER_FULFILLMENT
+    backend_class = import_string(config["BACKEND"])
+    return AsyncFulfillmentGateway(
+        backend=backend_class(**config.get("OPTIONS", {})),
+        max_concurrency=config["MAX_CONCURRENCY"],
+        timeout=config["TIMEOUT"],
+        circuit_breaker=CircuitBreaker(
+            failure_threshold=config["CIRCUIT_BREAKER_THRESHOLD"],
+            reset_timeout=config["CIRCUIT_BREAKER_RESET_TIMEOUT"],
+        ),
+    )
+
+
+@receiver(setting_changed)
+def reset_fulfillment_gateway(setting: str, **kwargs: object) -> None:  # noqa: ARG001
+    if setting == "ORDER_FULFILLMENT":
+        get_fulfillment_gateway.cache_clear()
@@ -0,0 +1,137 @@
+"""
+Idempotency keys for the order creation endpoints.
+
+A client that sends an `Idempotency-Key` header may repeat the request, e.g.
+after a timeout, and gets the original response back instead of new orders.
+Keys are stored per company for ORDER_IDEMPOTENCY_KEY_TTL_SECONDS with the
+fingerprint of the request and its response.
+
+The key row is inserted first, in the transaction that creates the orders,
+so the unique (company, key) index doubles as a lock: a concurrent repeat
+blocks on it until the first request commits, then replays its response.
+If the first request fails, its key is rolled back with its orders and the
+repeat runs normally. Responses are also kept in the cache, so most
+repeats never reach the database.
+"""
+
+import datetime as dt
+import hashlib
+import json
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from apps.companies.models import Company
+
+from .models import IdempotencyKey
+
+
+class IdempotencyKeyReusedError(Exception):
+    """The key was already used for a different request."""
+
+
+class StoredResponse(NamedTuple):
+    status: int
+    body: Any
+
+
+class _NotStoredError(Exception):
+    """The request failed, so its key must not be kept."""
+
+    def __init__(self, response: StoredResponse) -> None:
+        super().__init__()
+        self.response = response
+
+
+def _cache() -> BaseCache:
+    return caches[settings.ORDER_IDEMPOTENCY_CACHE]
+
+
+def _cache_key(company: Company, key: str) -> str:
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"orders:idempotency:{company.pk}:{digest}"
+
+
+def request_fingerprint(*, method: str, path: str, data: Any) -> str:  # noqa: ANN401
+    """A digest telling apart two requests sent with the same key."""
+    payload = json.dumps([method, path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _replay(stored: tuple[str, int, Any], fingerprint: str) -> StoredResponse:
+    stored_fingerprint, status, body = stored
+    if stored_fingerprint != fingerprint:
+        msg = "This Idempotency-Key was already used for a different request."
+        raise IdempotencyKeyReusedError(msg)
+    return StoredResponse(status, body)
+
+
+def run_idempotently(
+    *,
+    company: Company,
+    key: str,
+    fingerprint: str,
+    create: Callable[[], StoredResponse],
+) -> tuple[StoredResponse, bool]:
+    """
+    Calls `create` once per company and key, and stores its response if it
+    succeeded. A repeated request gets the stored response back. Returns
+    the response and whether it was replayed. Raises
+    IdempotencyKeyReusedError if the key came with a different request.
+    """
+    cache_key = _cache_key(company, key)
+    if (cached := _cache().get(cache_key)) is not None:
+        return _replay(cached, fingerprint), True
+
+    keys = IdempotencyKey.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    now = timezone.now()
+    ttl = settings.ORDER_IDEMPOTENCY_KEY_TTL_SECONDS
+    # An expired key may be used again
+    keys.filter(key=key, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = keys.create(
+                        company=company,
+                        key=key,
+                        fingerprint=fingerprint,
+                        expires_at=now + dt.timedelta(seconds=ttl),
+                    )
+            except IntegrityError:
+                record = None
+            if record is not None:
+                response = create()
+                if not 200 <= response.status < 300:
+                    raise _NotStoredError(response)
+                record.response_status = response.status
+                record.response_body = response.body
+                record.save(update_fields=["response_status", "response_body"])
+    except _NotStoredError as e:
+        return e.response, False
+
+    replayed = record is None
+    if record is None:
+        # Another request with this key committed first
+        record = keys.get(key=key)
+    stored = (record.fingerprint, record.response_status, record.response_body)
+    timeout = max(1, int((record.expires_at - timezone.now()).total_seconds()))
+    transaction.on_commit(
+        lambda: _cache().set(cache_key, stored, timeout=timeout),
+        robust=True,
+    )
+    return _replay(stored, fingerprint), replayed
+
+
+def purge_expired_idempotency_keys() -> int:
+    """Deletes the expired keys of all companies. Returns how many."""
+    deleted, _ = (
+        IdempotencyKey.objects.for_all_tenants()  # pyright: ignore[reportAttributeAccessIssue]
+        .filter(expires_at__lte=timezone.now())
+        .delete()
+    )
+    return deleted
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_export_company'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='batch_id',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:49
+
+from core.migration_operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The orders table is large: its indexes are built without blocking
+    # writes, which cannot happen in a transaction
+    atomic = False
+
+    dependencies = [
+        ('companies', '0002_order_scheduling'),
+        ('orders', '0008_outboxmessage'),
+        ('products', '0004_product_stock_shards'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='queue',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('dispatched_at__isnull', True), ('status', 1)), fields=['company', 'created_at'], name='orders_undispatched_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_order_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.IntegerField(choices=[(1, 'Pending'), (2, 'Processing'), (3, 'Approved'), (4, 'Failed'), (5, 'Dead Letter')]),
+        ),
+    ]
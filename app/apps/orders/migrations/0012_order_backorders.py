@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:01
+
+from core.migration_operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The orders table is large: its indexes are built without blocking
+    # writes, which cannot happen in a transaction
+    atomic = False
+
+    dependencies = [
+        ('companies', '0002_order_scheduling'),
+        ('orders', '0011_bulkorderaction'),
+        ('products', '0005_product_backorders'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='backordered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.IntegerField(choices=[(1, 'Pending'), (2, 'Processing'), (3, 'Approved'), (4, 'Failed'), (5, 'Dead Letter'), (6, 'Backordered')]),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 6)), fields=['product', 'backordered_at'], name='orders_backorder_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:22
+
+from core.migration_operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The orders table is large: its indexes are built without blocking
+    # writes, which cannot happen in a transaction
+    atomic = False
+
+    dependencies = [
+        ('companies', '0002_order_scheduling'),
+        ('orders', '0013_order_lines'),
+        ('products', '0005_product_backorders'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 2)), fields=['updated_at'], name='orders_processing_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('dispatched_at__isnull', False), ('status', 1)), fields=['dispatched_at'], name='orders_dispatched_idx'),
+        ),
+    ]
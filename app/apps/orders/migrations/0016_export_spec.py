@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='spec',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0016_export_spec'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='byte_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='format',
+            field=models.CharField(choices=[('csv', 'CSV'), ('csv.gz', 'CSV, gzip'), ('csv.zst', 'CSV, zstd'), ('ndjson', 'NDJSON'), ('parquet', 'Parquet')], default='csv', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='row_count',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0002_order_scheduling'),
+        ('orders', '0017_export_format'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('first_pk', models.PositiveBigIntegerField()),
+                ('last_pk', models.PositiveBigIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('row_count', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('file', models.FileField(blank=True, null=True, upload_to='exports/parts/')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='companies.company')),
+                ('export', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='orders.export')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('export', 'index'), name='orders_export_shard_unique_index')],
+            },
+        ),
+    ]
@@ -1,6 +1,11 @@
 import uuid
+from collections.abc import Iterable
+from typing import Any, ClassVar
 
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import QuerySet
+from django.utils import timezone
 
 from apps.companies.managers import TenantManager
 
@@ -11,9 +16,48 @@ class Order(models.Model):
         PROCESSING = 2
         APPROVED = 3
         FAILED = 4
+        # Ran out of automatic retries after transient errors
+        DEAD_LETTER = 5
+        # Waiting for a restock of a product with backorders enabled
+        BACKORDERED = 6
+
+    # The statuses each status may move to. PROCESSING -> PENDING is an
+    # automatic retry after a transient error.
+    TRANSITIONS: ClassVar[dict[int, frozenset[int]]] = {
+        Status.PENDING: frozenset(
+            {Status.PROCESSING, Status.APPROVED, Status.FAILED, Status.BACKORDERED},
+        ),
+        Status.PROCESSING: frozenset(
+            {
+                Status.APPROVED,
+                Status.FAILED,
+                Status.PENDING,
+                Status.DEAD_LETTER,
+                Status.BACKORDERED,
+            },
+        ),
+        Status.APPROVED: frozenset(),
+        Status.FAILED: frozenset({Status.PENDING}),
+        Status.DEAD_LETTER: frozenset({Status.PENDING}),
+        # Restocked backorders get a reservation and are processed again
+        Status.BACKORDERED: frozenset({Status.PENDING}),
+    }
+    # Statuses of orders that a worker or an admin may approve; backorders
+    # return to PENDING with fill_backorders_service, in their FIFO order
+    APPROVABLE_STATUSES: ClassVar[tuple[int, ...]] = (
+        Status.PENDING,
+        Status.PROCESSING,
+    )
 
     reference_code = models.UUIDField(default=uuid.uuid4)
-    product = models.ForeignKey(to="products.Product", on_delete=models.PROTECT)
+    # Single-line orders only; a multi-line order has no product and its
+    # quantity is the total of its lines, see OrderLine
+    product = models.ForeignKey(
+        to="products.Product",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
     quantity = models.IntegerField(default=0)
     status = models.IntegerField(choices=Status)  # pyright: ignore
     created_by = models.ForeignKey("users.Profile", on_delete=models.CASCADE)
@@ -21,11 +65,142 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     company = models.ForeignKey(to="companies.Company", on_delete=models.CASCADE)
     has_been_processed = models.BooleanField(default=False)
+    batch_id = models.UUIDField(null=True, blank=True, db_index=True)
+    # Whether the order currently holds a stock reservation on its product
+    stock_reserved = models.BooleanField(default=False)
+    # When the fair scheduler sent the order to the workers, see
+    # apps.orders.scheduling
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    # Processing attempts that hit a transient error, when the order may be
+    # processed again, and the last error seen
+    attempts = models.PositiveSmallIntegerField(default=0)
+    retry_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    # When the order joined its product's backorder queue
+    backordered_at = models.DateTimeField(null=True, blank=True)
     objects = TenantManager()
 
+    class Meta:
+        indexes = [  # noqa: RUF012
+            models.Index(
+                # The scheduler's backlogs: PENDING orders not dispatched yet
+                fields=["company", "created_at"],
+                condition=models.Q(status=1, dispatched_at__isnull=True),
+                name="orders_undispatched_idx",
+            ),
+            models.Index(
+                # The reaper's scans for orders abandoned by their worker:
+                # PROCESSING since, and dispatched but never claimed since
+                fields=["updated_at"],
+                condition=models.Q(status=2),
+                name="orders_processing_idx",
+            ),
+            models.Index(
+                fields=["dispatched_at"],
+                condition=models.Q(status=1, dispatched_at__isnull=False),
+                name="orders_dispatched_idx",
+            ),
+            models.Index(
+                # Each product's backorder queue: BACKORDERED orders, FIFO
+                fields=["product", "backordered_at"],
+                condition=models.Q(status=6),
+                name="orders_backorder_queue_idx",
+            ),
+        ]
+
     def __str__(self) -> str:
         return f"Order {self.reference_code}"
 
+    @property
+    def has_lines(self) -> bool:
+        """Whether this is a multi-line order, whose products are its lines."""
+        return self.product_id is None  # pyright: ignore[reportAttributeAccessIssue]
+
+    @classmethod
+    def sources_of(cls, status: int) -> list[int]:
+        """The statuses an order may move to `status` from."""
+        return [
+            source for source, targets in cls.TRANSITIONS.items() if status in targets
+        ]
+
+    @classmethod
+    def transition_orders(
+        cls,
+        orders: QuerySet["Order"],
+        status: int,
+        *,
+        from_statuses: Iterable[int] | None = None,
+        **fields: Any,  # noqa: ANN401
+    ) -> int:
+        """
+        Moves `orders` to `status` with one conditional UPDATE that only
+        matches rows still in a status allowed to move there, optionally
+        narrowed to `from_statuses`. `fields` are written in the same
+        statement. Returns the number of orders that moved.
+        """
+        sources = cls.sources_of(status)
+        if from_statuses is not None:
+            from_statuses = list(from_statuses)
+            if not set(from_statuses) <= set(sources):
+                msg = f"Orders cannot move from {from_statuses} to {status}."
+                raise ValueError(msg)
+            sources = from_statuses
+        return orders.filter(status__in=sources).update(
+            status=status,
+            updated_at=timezone.now(),
+            **fields,
+        )
+
+    def transition_to(
+        self,
+        status: int,
+        *,
+        from_statuses: Iterable[int] | None = None,
+        **fields: Any,  # noqa: ANN401
+    ) -> bool:
+        """
+        Compare-and-set of this order's status; see `transition_orders`.
+        Returns whether this call won the transition, in which case the
+        instance is updated as well. Only status, updated_at and `fields`
+        are written, so no lock on the row is needed.
+        """
+        orders = Order.objects.for_tenant(self.company_id).filter(pk=self.pk)  # pyright: ignore[reportAttributeAccessIssue]
+        if not self.transition_orders(
+            orders,
+            status,
+            from_statuses=from_statuses,
+            **fields,
+        ):
+            return False
+        self.status = status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+
+
+class OrderLine(models.Model):
+    """
+    One product of a multi-line order. The order is reserved, approved and
+    failed as a whole, so a line has no status of its own.
+    """
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="lines")
+    product = models.ForeignKey(to="products.Product", on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField()
+    company = models.ForeignKey(to="companies.Company", on_delete=models.CASCADE)
+    objects = TenantManager()
+
+    class Meta:
+        constraints = [  # noqa: RUF012
+            models.UniqueConstraint(
+                fields=["order", "product"],
+                name="orders_line_unique_product",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.quantity} x {self.product_id} of order {self.order_id}"  # pyright: ignore[reportAttributeAccessIssue]
+
 
 class Export(models.Model):
     class Status(models.TextChoices):
@@ -33,6 +208,14 @@ class Export(models.Model):
         READY = "ready", "Ready"
         FAILED = "failed", "Failed"
 
+    # Values double as the file extensions
+    class Format(models.TextChoices):
+        CSV = "csv", "CSV"
+        CSV_GZIP = "csv.gz", "CSV, gzip"
+        CSV_ZSTD = "csv.zst", "CSV, zstd"
+        NDJSON = "ndjson", "NDJSON"
+        PARQUET = "parquet", "Parquet"
+
     requested_by = models.ForeignKey(
         "users.Profile",
         on_delete=models.SET_NULL,
@@ -44,9 +227,148 @@ class Export(models.Model):
         choices=Status.choices,
         default=Status.PENDING,
     )
+    # The orders exported, see apps.orders.exports.ExportSpec
+    spec = models.JSONField(default=dict, blank=True)
+    format = models.CharField(max_length=10, choices=Format.choices, default=Format.CSV)
     file = models.FileField(upload_to="exports/", null=True, blank=True)
+    # Orders in the file and its size once ready
+    row_count = models.PositiveBigIntegerField(null=True, blank=True)
+    byte_size = models.PositiveBigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     objects = TenantManager()
 
     def __str__(self) -> str:
         return f"export number {self.pk}"
+
+
+class ExportShard(models.Model):
+    """
+    A range of consecutive order ids of a large export, written to its own
+    part file by a worker in parallel with the others.
+    """
+
+    export = models.ForeignKey(Export, on_delete=models.CASCADE, related_name="shards")
+    company = models.ForeignKey("companies.Company", on_delete=models.CASCADE)
+    index = models.PositiveIntegerField()
+    # Inclusive bounds of the order ids
+    first_pk = models.PositiveBigIntegerField()
+    last_pk = models.PositiveBigIntegerField()
+    status = models.CharField(
+        max_length=20,
+        choices=Export.Status.choices,
+        default=Export.Status.PENDING,
+    )
+    row_count = models.PositiveBigIntegerField(null=True, blank=True)
+    # Removed once merged into the export's file
+    file = models.FileField(upload_to="exports/parts/", null=True, blank=True)
+    objects = TenantManager()
+
+    class Meta:
+        constraints = [  # noqa: RUF012
+            models.UniqueConstraint(
+                fields=["export", "index"],
+                name="orders_export_shard_unique_index",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"shard {self.index} of export {self.export_id}"  # pyright: ignore[reportAttributeAccessIssue]
+
+
+class BulkOrderAction(models.Model):
+    """
+    An admin approve or retry action on many orders, run by a background
+    task with its progress recorded here.
+    """
+
+    class Action(models.TextChoices):
+        APPROVE = "approve", "Approve"
+        RETRY = "retry", "Retry"
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    action = models.CharField(max_length=20, choices=Action.choices)
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    requested_by = models.ForeignKey(
+        "users.Profile",
+        on_delete=models.SET_NULL,
+        null=True,
+    )
+    company = models.ForeignKey("companies.Company", on_delete=models.CASCADE)
+    order_ids = models.JSONField(default=list)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    # Orders approved or retried, and orders that could not be for lack of
+    # stock
+    succeeded = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    objects = TenantManager()
+
+    def __str__(self) -> str:
+        return f"{self.get_action_display()} of {self.total} orders"  # pyright: ignore[reportAttributeAccessIssue]
+
+
+class IdempotencyKey(models.Model):
+    """
+    An Idempotency-Key sent to an order creation endpoint, with the response
+    replayed when the request is repeated. See apps.orders.idempotency.
+    """
+
+    company = models.ForeignKey("companies.Company", on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    # Digest of the request, so a key reused for another request is refused
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    objects = TenantManager()
+
+    class Meta:
+        constraints = [  # noqa: RUF012
+            models.UniqueConstraint(
+                fields=["company", "key"],
+                name="orders_idempotency_key_unique",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return self.key
+
+
+class OutboxMessage(models.Model):
+    """
+    A Celery task call stored in the transaction that requested it, until
+    it is published to the broker. See apps.orders.outbox.
+    Not tenant-scoped: the relay publishes the messages of all companies.
+    """
+
+    task = models.CharField(max_length=200)
+    # Celery queue to publish to; empty for the default queue
+    queue = models.CharField(max_length=100, blank=True)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [  # noqa: RUF012
+            models.Index(
+                fields=["id"],
+                condition=models.Q(published_at__isnull=True),
+                name="orders_outbox_unpublished_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.task} #{self.pk}"
@@ -0,0 +1,121 @@
+"""
+Transactional outbox for Celery tasks started by order services.
+
+Tasks are not sent to the broker directly. They are stored as
+OutboxMessage rows in the caller's transaction, so a worker never receives
+a task for data that is not committed yet, and a task is never lost because
+the broker was unavailable when the transaction committed.
+
+Committed messages are published right after the commit by a
+`transaction.on_commit` callback (the fast path). Whatever that could not
+send is picked up by the periodic `relay_outbox_task`. Delivery is
+at least once; the order tasks tolerate duplicates because every status
+change is a compare-and-set.
+"""
+
+import datetime as dt
+import logging
+from collections.abc import Iterable
+from typing import Any
+
+from celery import Task, current_app
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_task(
+    task: Task,
+    *,
+    args: Iterable[Any] = (),
+    kwargs: dict[str, Any] | None = None,
+    queue: str = "",
+) -> None:
+    """Schedules one call of `task` through the outbox."""
+    enqueue_tasks(task, calls=[(args, kwargs or {})], queue=queue)
+
+
+def enqueue_tasks(
+    task: Task,
+    *,
+    calls: Iterable[tuple[Iterable[Any], dict[str, Any]]],
+    queue: str = "",
+) -> None:
+    """
+    Schedules many calls of `task` with a single INSERT into the outbox.
+    They are published together once the current transaction commits, to
+    `queue` or the default queue.
+    """
+    messages = OutboxMessage.objects.bulk_create(
+        OutboxMessage(task=task.name, args=list(args), kwargs=kwargs, queue=queue)
+        for args, kwargs in calls
+    )
+    message_ids = [message.pk for message in messages]
+    if message_ids:
+        # A failure here is only logged, the relay sends the messages later
+        transaction.on_commit(
+            lambda: publish_outbox_messages(message_ids=message_ids),
+            robust=True,
+        )
+
+
+def publish_outbox_messages(
+    *,
+    message_ids: list[int] | None = None,
+    limit: int | None = None,
+) -> int:
+    """
+    Sends unpublished outbox messages to the broker over one producer
+    connection and marks them published. Rows being published concurrently
+    are skipped. Returns the number of messages sent.
+    """
+    with transaction.atomic():
+        pending = (
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(published_at__isnull=True)
+            .order_by("pk")
+        )
+        if message_ids is not None:
+            pending = pending.filter(pk__in=message_ids)
+        messages = list(pending[:limit] if limit is not None else pending)
+        if not messages:
+            return 0
+
+        # If the broker fails midway nothing is marked published, so the
+        # messages already sent are sent again by the relay
+        with current_app.producer_or_acquire() as producer:
+            for message in messages:
+                current_app.send_task(
+                    message.task,
+                    args=message.args,
+                    kwargs=message.kwargs,
+                    queue=message.queue or None,
+                    producer=producer,
+                )
+        OutboxMessage.objects.filter(
+            pk__in=[message.pk for message in messages],
+        ).update(published_at=timezone.now())
+
+    return len(messages)
+
+
+def relay_outbox_messages() -> int:
+    """
+    Publishes every committed message left behind by the fast path, in
+    batches of OUTBOX_RELAY_BATCH_SIZE, and deletes published messages older
+    than OUTBOX_RETENTION_SECONDS. Returns the number of messages sent.
+    """
+    published = 0
+    while sent := publish_outbox_messages(limit=settings.OUTBOX_RELAY_BATCH_SIZE):
+        published += sent
+
+    expired = timezone.now() - dt.timedelta(seconds=settings.OUTBOX_RETENTION_SECONDS)
+    OutboxMessage.objects.filter(published_at__lt=expired).delete()
+
+    if published:
+        logger.warning("Outbox relay published %d delayed messages.", published)
+    return published
@@ -0,0 +1,41 @@
+"""
+Which order processing errors are retried, and when.
+
+Transient errors (the external call failing or timing out, the circuit
+breaker being open, a database lock timeout or deadlock) put the order back
+in its company's backlog after a jittered exponential backoff. Anything else
+is permanent and fails the order at once. Insufficient stock is not an
+error at all: the order is simply FAILED by the approval.
+"""
+
+import random
+
+from django.conf import settings
+from django.db import OperationalError
+
+from .fulfillment import FulfillmentError
+
+TRANSIENT_ERRORS = (FulfillmentError, OperationalError)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def describe_error(error: BaseException) -> str:
+    """The text stored as an order's last_error."""
+    return f"{type(error).__name__}: {error}"
+
+
+def retry_delay_seconds(attempt: int, *, rng: random.Random | None = None) -> float:
+    """
+    Backoff before retrying after the `attempt`-th failure (starting at 1):
+    ORDER_RETRY_BACKOFF_SECONDS doubled per attempt and capped at
+    ORDER_RETRY_BACKOFF_MAX_SECONDS, of which a random half is kept so
+    orders that failed together are not retried together.
+    """
+    ceiling = min(
+        settings.ORDER_RETRY_BACKOFF_MAX_SECONDS,
+        settings.ORDER_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1),
+    )
+    return ceiling / 2 + (rng or random).uniform(0, ceiling / 2)
@@ -1,7 +1,19 @@
-from django.db.models import QuerySet
+import operator
+import uuid
+from collections import defaultdict
+from collections.abc import Iterable
+from functools import reduce
 
+from django.db.models import Count, Q, QuerySet
+from django.utils.text import smart_split, unescape_string_literal
+
+from apps.companies.models import Company
 from apps.companies.selectors import get_company
-from apps.orders.models import Export, Order
+from apps.orders.exports import ExportSpec
+from apps.orders.models import Export, Order, OrderLine
+
+# Fields searched by the admin search box and by exports made from a search
+ORDER_SEARCH_FIELDS = ("reference_code", "product__name", "created_by__user__username")
 
 
 def get_export_for_company(*, pk: int, company_pk: int) -> Export:
@@ -12,3 +24,79 @@ def get_export_for_company(*, pk: int, company_pk: int) -> Export:
 def get_orders_for_company(*, company_pk: int) -> QuerySet[Order]:
     company = get_company(pk=company_pk)
     return Order.objects.for_tenant(company).all()  # pyright: ignore[reportAttributeAccessIssue]
+
+
+def search_orders(orders: QuerySet[Order], term: str) -> QuerySet[Order]:
+    """
+    The orders matching every word of `term` in one of ORDER_SEARCH_FIELDS,
+    like Django's admin search; quoted phrases count as one word.
+    """
+    for word in smart_split(term):
+        if word[0] in {'"', "'"} and word[-1] == word[0]:
+            word = unescape_string_literal(word)
+        orders = orders.filter(
+            reduce(
+                operator.or_,
+                (Q(**{f"{field}__icontains": word}) for field in ORDER_SEARCH_FIELDS),
+            ),
+        )
+    return orders
+
+
+def get_export_orders(*, company: Company, spec: ExportSpec) -> QuerySet[Order]:
+    """The orders of `company` selected by an export's spec."""
+    orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    if "ids" in spec:
+        orders = orders.filter(pk__in=spec["ids"])
+    if "status" in spec:
+        orders = orders.filter(status=spec["status"])
+    if "processed" in spec:
+        orders = orders.filter(has_been_processed=spec["processed"])
+    if "created_from" in spec:
+        orders = orders.filter(created_at__gte=spec["created_from"])
+    if "created_to" in spec:
+        orders = orders.filter(created_at__lt=spec["created_to"])
+    if spec.get("search"):
+        orders = search_orders(orders, spec["search"])
+    return orders
+
+
+def get_order_lines(
+    *,
+    company: Company,
+    orders: Iterable[Order],
+) -> dict[int, list[OrderLine]]:
+    """The lines of the multi-line `orders`, by order id, with one query."""
+    lines: defaultdict[int, list[OrderLine]] = defaultdict(list)
+    order_ids = [order.pk for order in orders if order.has_lines]
+    if order_ids:
+        for line in (
+            OrderLine.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+            .select_related("product")
+            .filter(order__in=order_ids)
+            .order_by("product_id")
+        ):
+            lines[line.order_id].append(line)
+    return lines
+
+
+def get_order_batch_summary(
+    *,
+    orders: QuerySet[Order],
+    batch_id: uuid.UUID,
+) -> dict[str, int]:
+    """
+    Counts the orders of a bulk-create batch per status, e.g.
+    {"total": 3, "pending": 1, "processing": 0, "approved": 2, "failed": 0,
+    "dead_letter": 0}.
+    """
+    counts = dict(
+        orders.filter(batch_id=batch_id)
+        .order_by()
+        .values_list("status")
+        .annotate(count=Count("pk")),
+    )
+    summary = {
+        status.name.lower(): counts.get(status.value, 0) for status in Order.Status
+    }
+    return {"total": sum(counts.values()), **summary}
@@ -1,24 +1,119 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
 
 from apps.products.models import Product
 
-from .models import Order
+from .models import Order, OrderLine
+
+
+class BatchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    A PrimaryKeyRelatedField that can resolve its objects from a lookup
+    table prepared by the parent list serializer, instead of running one
+    query per item. Errors are the same as the regular field.
+    """
+
+    def __init__(self, **kwargs) -> None:  # noqa: ANN003
+        super().__init__(**kwargs)
+        self.prefetched: dict | None = None
+
+    def prefetch(self, values: list) -> None:
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.to_pk(value))
+            except (TypeError, ValueError, DjangoValidationError):
+                continue
+        self.prefetched = {
+            obj.pk: obj for obj in self.get_queryset().filter(pk__in=pks)
+        }
+
+    def clear_prefetched(self) -> None:
+        self.prefetched = None
+
+    def to_pk(self, data):  # noqa: ANN001, ANN201
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        if isinstance(data, bool):
+            raise TypeError
+        return self.get_queryset().model._meta.pk.to_python(data)
+
+    def to_internal_value(self, data):  # noqa: ANN001, ANN201
+        if self.prefetched is None:
+            return super().to_internal_value(data)
+
+        try:
+            pk = self.to_pk(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if pk not in self.prefetched:
+            self.fail("does_not_exist", pk_value=data)
+        return self.prefetched[pk]
+
+
+class OrderCreateListSerializer(serializers.ListSerializer):
+    """Resolves the products of all items with a single query."""
+
+    def to_internal_value(self, data):  # noqa: ANN001, ANN201
+        product_field = self.child.fields["product"]  # pyright: ignore[reportOptionalMemberAccess]
+        if isinstance(data, list):
+            product_field.prefetch(
+                [item.get("product") for item in data if isinstance(item, dict)],
+            )
+        try:
+            return super().to_internal_value(data)
+        finally:
+            product_field.clear_prefetched()
 
 
 class OrderCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating new orders."""
 
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    # Pass the manager, not a queryset, so the TenantManager filters by the
+    # tenant of the current request rather than the one active at import time
+    product = BatchedPrimaryKeyRelatedField(queryset=Product.objects)
 
     class Meta:
         model = Order
         fields = ["product", "quantity"]  # noqa: RUF012
+        list_serializer_class = OrderCreateListSerializer
+
+
+class OrderLineCreateSerializer(serializers.ModelSerializer):
+    """Serializer for one line of a new multi-line order."""
+
+    product = BatchedPrimaryKeyRelatedField(queryset=Product.objects)
+
+    class Meta:
+        model = OrderLine
+        fields = ["product", "quantity"]  # noqa: RUF012
+        list_serializer_class = OrderCreateListSerializer
+
+
+class MultiLineOrderCreateSerializer(serializers.Serializer):
+    """Serializer for creating an order covering several products."""
+
+    lines = OrderLineCreateSerializer(many=True, allow_empty=False)
+
+
+class OrderLineReadSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source="product.name", read_only=True)
+
+    class Meta:
+        model = OrderLine
+        fields = ["product", "product_name", "quantity"]  # noqa: RUF012
 
 
 class OrderReadSerializer(serializers.ModelSerializer):
     """Serializer for displaying order details."""
 
-    product_name = serializers.CharField(source="product.name", read_only=True)
+    # Multi-line orders have no product of their own, only lines
+    product_name = serializers.CharField(
+        source="product.name",
+        read_only=True,
+        default=None,
+    )
+    lines = OrderLineReadSerializer(many=True, read_only=True)
     created_by = serializers.CharField(
         source="created_by.user.username",
         read_only=True,
@@ -30,6 +125,7 @@ class OrderReadSerializer(serializers.ModelSerializer):
             "reference_code",
             "product_name",
             "quantity",
+            "lines",
             "status",
             "created_by",
             "created_at",
@@ -1,16 +1,78 @@
+import datetime as dt
 import logging
+import uuid
+from collections import defaultdict
+from collections.abc import Iterable
+from itertools import chain
+from typing import Any, TypedDict
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
+from django.db.models import Case, Count, F, Min, Q, QuerySet, Value, When
+from django.utils import timezone
 
 from apps.companies.models import Company
-from apps.products.models import Product
-from apps.products.services import adjust_product_stock_service
+from apps.products.availability import check_product_availability
+from apps.products.models import InventoryMovement, Product, ProductStockShard
+from apps.products.services import (
+    MovementData,
+    adjust_product_stock_service,
+    commit_product_reservation_service,
+    record_inventory_movements_service,
+    release_product_reservation_service,
+    reserve_product_stock_service,
+)
 from apps.users.models import Profile
 
-from .models import Order
+from .allocation import AllocationPolicy, allocate_stock
+from .exports import ExportSpec, available_export_formats
+from .models import BulkOrderAction, Export, ExportShard, Order, OrderLine
+from .outbox import enqueue_task, enqueue_tasks
+from .retries import retry_delay_seconds
+from .scheduling import TenantBacklog, allocate_dispatch
+from .selectors import get_order_lines
 
 logger = logging.getLogger(__name__)
 
+# Cache key held while a run of the scheduler is queued, see
+# wake_scheduler_service
+SCHEDULER_WAKE_KEY = "orders:scheduler:wake"
+
+
+class BatchApprovalResult(TypedDict):
+    approved: list[int]
+    failed: list[int]
+    backordered: list[int]
+
+
+class StockAllocationResult(TypedDict):
+    # PENDING orders given a reservation, and those failed or backordered
+    reserved: list[int]
+    failed: list[int]
+    backordered: list[int]
+
+
+class RetriedOrders(TypedDict):
+    retried: list[Order]
+    # Orders out of attempts
+    dead_lettered: list[Order]
+
+
+class ReapedOrders(TypedDict):
+    # PROCESSING orders put back in the backlog, and those failed or
+    # dead-lettered instead
+    requeued: int
+    failed: int
+    # PENDING orders dispatched again
+    redispatched: int
+
+
+class BulkRetryResult(TypedDict):
+    retried: list[int]
+    # Orders left FAILED because their product lacks the stock
+    rejected: list[int]
+
 
 def create_order_service(
     *,
@@ -20,76 +82,1392 @@ def create_order_service(
     company: Company,
 ) -> Order:
     """
-    Creates a new Order in a PENDING state and triggers a background
-    task to process it.
+    Reserves stock for a new Order, creates it in a PENDING state and
+    wakes the fair scheduler once the transaction commits, which dispatches
+    it to the workers. Raises ValueError if the product is inactive or the
+    stock cannot be reserved, so doomed orders never reach a worker, unless
+    the product takes backorders: the order then joins its backorder queue.
+    With ORDER_AVAILABILITY_PRECHECK, obviously doomed orders are turned
+    away from the cached availability before any lock is taken.
     """
-    from .tasks import process_order_task
-
     if quantity <= 0:
         msg = "Order quantity must be a positive number."
         raise ValueError(msg)
+    if settings.ORDER_AVAILABILITY_PRECHECK:
+        check_product_availability(product=product, quantity=quantity)
 
-    order = Order.objects.create(
-        product=product,
-        quantity=quantity,
-        created_by=created_by,
-        company=company,
-        status=Order.Status.PENDING,
+    with transaction.atomic():
+        try:
+            reserve_product_stock_service(product=product, quantity=quantity)
+        except ValueError:
+            if not (product.is_active and product.backorders_enabled):
+                raise
+            return Order.objects.create(
+                product=product,
+                quantity=quantity,
+                created_by=created_by,
+                company=company,
+                status=Order.Status.BACKORDERED,
+                backordered_at=timezone.now(),
+            )
+        order = Order.objects.create(
+            product=product,
+            quantity=quantity,
+            created_by=created_by,
+            company=company,
+            status=Order.Status.PENDING,
+            stock_reserved=True,
+        )
+        wake_scheduler_service()
+
+    return order
+
+
+class OrderItemData(TypedDict):
+    product: Product
+    quantity: int
+
+
+@transaction.atomic
+def bulk_create_orders_service(
+    *,
+    items: list[OrderItemData],
+    created_by: Profile,
+    company: Company,
+) -> uuid.UUID:
+    """
+    Creates many PENDING orders with a single bulk INSERT and wakes the
+    fair scheduler through the outbox, in the same transaction. Stock is
+    reserved once per product; if any product lacks stock, ValueError is
+    raised and no order is created, unless the product takes backorders: its
+    orders then join its backorder queue.
+    Returns the batch id shared by the new orders.
+    """
+    if any(item["quantity"] <= 0 for item in items):
+        msg = "Order quantity must be a positive number."
+        raise ValueError(msg)
+
+    products, quantities = _quantities_by_product(items)
+    _check_products_availability(products=products, quantities=quantities)
+    backordered: set[int] = set()
+    for product_id in sorted(quantities):
+        try:
+            reserve_product_stock_service(
+                product=products[product_id],
+                quantity=quantities[product_id],
+            )
+        except ValueError as e:
+            product = products[product_id]
+            if product.is_active and product.backorders_enabled:
+                backordered.add(product_id)
+                continue
+            msg = f"{product}: {e}"
+            raise ValueError(msg) from e
+
+    batch_id = uuid.uuid4()
+    now = timezone.now()
+    Order.objects.bulk_create(
+        Order(
+            product=item["product"],
+            quantity=item["quantity"],
+            created_by=created_by,
+            company=company,
+            status=Order.Status.BACKORDERED,
+            batch_id=batch_id,
+            backordered_at=now,
+        )
+        if item["product"].pk in backordered
+        else Order(
+            product=item["product"],
+            quantity=item["quantity"],
+            created_by=created_by,
+            company=company,
+            status=Order.Status.PENDING,
+            batch_id=batch_id,
+            stock_reserved=True,
+        )
+        for item in items
     )
+    wake_scheduler_service()
+
+    return batch_id
+
 
-    process_order_task.delay(order.pk, company_id=order.company.pk)
+def _quantities_by_product(
+    items: list[OrderItemData],
+) -> tuple[dict[int, Product], dict[int, int]]:
+    """The products of `items` and their total quantities, by product id."""
+    products = {item["product"].pk: item["product"] for item in items}
+    quantities: defaultdict[int, int] = defaultdict(int)
+    for item in items:
+        quantities[item["product"].pk] += item["quantity"]
+    return products, dict(quantities)
+
+
+def _check_products_availability(
+    *,
+    products: dict[int, Product],
+    quantities: dict[int, int],
+) -> None:
+    """
+    Rejects, before anything is locked, orders for products that are
+    inactive or obviously short of stock, when ORDER_AVAILABILITY_PRECHECK
+    is on. Raises ValueError naming the first such product.
+    """
+    if not settings.ORDER_AVAILABILITY_PRECHECK:
+        return
+    for product_id in sorted(quantities):
+        try:
+            check_product_availability(
+                product=products[product_id],
+                quantity=quantities[product_id],
+            )
+        except ValueError as e:
+            msg = f"{products[product_id]}: {e}"
+            raise ValueError(msg) from e
+
+
+def _reserve_products_stock(
+    *,
+    products: dict[int, Product],
+    quantities: dict[int, int],
+) -> None:
+    """
+    Reserves stock for several products in id order, so concurrent orders
+    sharing products cannot deadlock. Raises ValueError naming the first
+    product short of stock; the caller's transaction undoes the others.
+    """
+    for product_id in sorted(quantities):
+        try:
+            reserve_product_stock_service(
+                product=products[product_id],
+                quantity=quantities[product_id],
+            )
+        except ValueError as e:
+            msg = f"{products[product_id]}: {e}"
+            raise ValueError(msg) from e
+
+
+def _lock_products(
+    *,
+    company: Company,
+    product_ids: Iterable[int],
+    with_shards: bool = False,
+) -> dict[int, Product]:
+    """
+    Locks the company's products with a single SELECT FOR UPDATE, in id
+    order so concurrent transactions locking overlapping products cannot
+    deadlock. Returns them by id, in that order.
+
+    With `with_shards`, the stock shards of those products are locked too,
+    so reservations taking the shards' fast path cannot change the
+    available stock the caller reads until it commits.
+    """
+    products = {
+        product.pk: product
+        for product in Product.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+        .select_for_update()
+        .filter(pk__in=list(product_ids))
+        .order_by("pk")
+    }
+    sharded = [pk for pk, product in products.items() if product.stock_shard_count]
+    if with_shards and sharded:
+        list(
+            ProductStockShard.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+            .select_for_update()
+            .filter(product_id__in=sharded)
+            .order_by("product_id", "index")
+            .values_list("pk", flat=True),
+        )
+    return products
+
+
+def create_multi_line_order_service(
+    *,
+    lines: list[OrderItemData],
+    created_by: Profile,
+    company: Company,
+) -> Order:
+    """
+    Creates one PENDING order covering several products, reserving the
+    stock of every line, and wakes the fair scheduler once the transaction
+    commits. Lines for the same product are merged. The order is accepted
+    as a whole: if any product lacks stock, ValueError is raised and nothing
+    is reserved. Multi-line orders are never backordered.
+    """
+    if not lines:
+        msg = "An order needs at least one line."
+        raise ValueError(msg)
+    if any(line["quantity"] <= 0 for line in lines):
+        msg = "Order quantity must be a positive number."
+        raise ValueError(msg)
+
+    products, quantities = _quantities_by_product(lines)
+    _check_products_availability(products=products, quantities=quantities)
+    with transaction.atomic():
+        _reserve_products_stock(products=products, quantities=quantities)
+        order = Order.objects.create(
+            product=None,
+            quantity=sum(quantities.values()),
+            created_by=created_by,
+            company=company,
+            status=Order.Status.PENDING,
+            stock_reserved=True,
+        )
+        OrderLine.objects.bulk_create(
+            OrderLine(
+                order=order,
+                product=products[product_id],
+                quantity=quantity,
+                company=company,
+            )
+            for product_id, quantity in sorted(quantities.items())
+        )
+        wake_scheduler_service()
 
     return order
 
 
+def dispatch_order_chunks_service(*, order_ids: list[int], company: Company) -> None:
+    """
+    Schedules one chunk task per ORDER_DISPATCH_CHUNK_SIZE orders through the
+    outbox, so the broker sees one message per chunk instead of one per order.
+    The chunks go to the company's dedicated queue if it has one.
+    """
+    from .tasks import process_orders_chunk_task
+
+    chunk_size = settings.ORDER_DISPATCH_CHUNK_SIZE
+    chunks = [
+        order_ids[start : start + chunk_size]
+        for start in range(0, len(order_ids), chunk_size)
+    ]
+    enqueue_tasks(
+        process_orders_chunk_task,
+        calls=[((chunk,), {"company_id": company.pk}) for chunk in chunks],
+        queue=company.order_queue,
+    )
+
+
+def _due_for_processing(orders: QuerySet[Order]) -> QuerySet[Order]:
+    """Leaves out orders still backing off after a transient error."""
+    return orders.filter(Q(retry_at__isnull=True) | Q(retry_at__lte=timezone.now()))
+
+
+def wake_scheduler_service() -> None:
+    """
+    Queues a run of the fair scheduler once the current transaction commits,
+    unless one is queued already: the caller that adds SCHEDULER_WAKE_KEY
+    to the cache sends it, and schedule_orders_task drops the key when it
+    starts. The key expires after ORDER_SCHEDULER_WAKE_SECONDS in case the
+    run is lost; the beat runs the scheduler every ORDER_SCHEDULER_INTERVAL
+    regardless. A burst of new or finished orders so costs one extra run,
+    not one per order contending for the companies' locks.
+    """
+    from .tasks import schedule_orders_task
+
+    if cache.add(SCHEDULER_WAKE_KEY, 1, timeout=settings.ORDER_SCHEDULER_WAKE_SECONDS):
+        enqueue_task(schedule_orders_task)
+
+
+def schedule_orders_service() -> dict[int, int]:
+    """
+    Dispatches the oldest undispatched PENDING orders of every company,
+    sharing ORDER_SCHEDULER_CAPACITY orders in flight on the shared queue
+    with a weighted round-robin; see apps.orders.scheduling. Returns the
+    number of orders dispatched per company id.
+    """
+    orders = Order.objects.for_all_tenants()  # pyright: ignore[reportAttributeAccessIssue]
+    undispatched = _due_for_processing(
+        orders.filter(status=Order.Status.PENDING, dispatched_at__isnull=True),
+    )
+    # Oldest backlog first, so the round-robin starts with the longest wait
+    oldest = dict(
+        undispatched.order_by()
+        .values("company")
+        .annotate(oldest=Min("created_at"))
+        .order_by("oldest")
+        .values_list("company", "oldest"),
+    )
+    if not oldest:
+        return {}
+
+    with transaction.atomic():
+        # Serializes concurrent schedulers, so caps are not exceeded
+        companies = (
+            Company.objects.select_for_update()
+            .filter(pk__in=oldest.keys())
+            .order_by("pk")
+            .in_bulk()
+        )
+        waiting = dict(
+            undispatched.filter(company__in=companies.keys())
+            .order_by()
+            .values("company")
+            .annotate(count=Count("pk"))
+            .values_list("company", "count"),
+        )
+        dispatched = orders.filter(
+            Q(status=Order.Status.PROCESSING)
+            | Q(status=Order.Status.PENDING, dispatched_at__isnull=False),
+        )
+        in_flight = dict(
+            dispatched.filter(company__in=companies.keys())
+            .order_by()
+            .values("company")
+            .annotate(count=Count("pk"))
+            .values_list("company", "count"),
+        )
+        backlogs = [
+            TenantBacklog(
+                company_id=company_id,
+                waiting=waiting.get(company_id, 0),
+                in_flight=in_flight.get(company_id, 0),
+                weight=companies[company_id].order_weight,
+                max_in_flight=companies[company_id].max_orders_in_flight,
+                dedicated_queue=bool(companies[company_id].order_queue),
+            )
+            for company_id in oldest
+            if company_id in companies
+        ]
+        # Companies without a backlog may still have orders in flight
+        shared_in_flight = dispatched.filter(company__order_queue="").count()
+        grants = allocate_dispatch(
+            backlogs,
+            capacity=settings.ORDER_SCHEDULER_CAPACITY - shared_in_flight,
+            quantum=settings.ORDER_SCHEDULER_QUANTUM,
+        )
+
+        now = timezone.now()
+        for company_id, count in grants.items():
+            order_ids = list(
+                undispatched.filter(company=company_id)
+                .order_by("created_at", "pk")
+                .values_list("pk", flat=True)[:count],
+            )
+            orders.filter(pk__in=order_ids).update(dispatched_at=now)
+            dispatch_order_chunks_service(
+                order_ids=order_ids,
+                company=companies[company_id],
+            )
+
+    if grants:
+        logger.info("Dispatched orders per company: %s", grants)
+    return grants
+
+
+def _stock_failure(product: Product) -> tuple[int, dict]:
+    """The status and fields of an order that its product cannot supply."""
+    if product.backorders_enabled:
+        return Order.Status.BACKORDERED, {"backordered_at": timezone.now()}
+    return Order.Status.FAILED, {"has_been_processed": True}
+
+
 @transaction.atomic
-def approve_order_service(*, order: Order) -> None:
+def approve_order_service(*, order: Order) -> bool:
     """
     Approves an order if stock is available, and deducts the stock quantity.
+    Orders holding a reservation are always approved and commit it. Orders
+    short of stock fail, or are backordered if their product allows it.
+
+    The status moves with a compare-and-set, so an order that was finished
+    concurrently is left alone and its stock change undone. Returns whether
+    this call finished the order.
     """
-    if (
-        not (
-            order.status == Order.Status.PROCESSING
-            or order.status == Order.Status.PENDING
-        )
-        or not order.product.is_active
-    ):
-        return
+    if order.status not in Order.APPROVABLE_STATUSES:
+        return False
+    if order.has_lines:
+        return _approve_multi_line_order(order=order)
+    if not order.product.is_active:
+        return False
 
-    product = order.product
-    if product.stock_quantity >= order.quantity:
-        order.status = Order.Status.APPROVED
-        adjust_product_stock_service(
-            product=product,
-            quantity_change=-order.quantity,
+    status = Order.Status.APPROVED
+    fields = {"has_been_processed": True, "stock_reserved": False}
+    if order.stock_reserved:
+        commit_product_reservation_service(
+            product=order.product,
+            quantity=order.quantity,
+            reference=str(order.reference_code),
         )
-        logger.info("Order %s approved.", order.reference_code)
+    else:
+        try:
+            adjust_product_stock_service(
+                product=order.product,
+                quantity_change=-order.quantity,
+                reason=InventoryMovement.Reason.ORDER_APPROVED,
+                reference=str(order.reference_code),
+            )
+        except ValueError:
+            status, fields = _stock_failure(order.product)
 
+    if not order.transition_to(status, **fields):
+        logger.info("Order %s was already finished elsewhere.", order.reference_code)
+        transaction.set_rollback(True)
+        return False
+
+    if status == Order.Status.APPROVED:
+        logger.info("Order %s approved.", order.reference_code)
+    elif status == Order.Status.BACKORDERED:
+        logger.info("Order %s was backordered.", order.reference_code)
     else:
-        order.status = Order.Status.FAILED
         logger.warning(
             "Order %s failed due to insufficient stock.",
             order.reference_code,
         )
+    return True
 
-    order.has_been_processed = True
-    order.save()
+
+def _approve_multi_line_order(*, order: Order) -> bool:
+    """
+    `approve_order_service` for a multi-line order: a batch of one, so its
+    products are locked together and it is approved all-or-nothing.
+    """
+    try:
+        with transaction.atomic():
+            result = _approve_orders_in_bulk(company=order.company, orders=[order])
+    except _TransitionLostError:
+        logger.info("Order %s was already finished elsewhere.", order.reference_code)
+        return False
+
+    if result["approved"]:
+        order.status = Order.Status.APPROVED
+        order.has_been_processed = True
+        order.stock_reserved = False
+    elif result["failed"]:
+        order.status = Order.Status.FAILED
+        order.has_been_processed = True
+    else:
+        # One of its products is inactive
+        return False
+    return True
 
 
 def retry_order_service(*, order: Order) -> Order:
     """
-    Resets a FAILED order to PENDING and re-queues it for processing.
+    Resets a FAILED or dead-lettered order to PENDING, with a fresh set of
+    automatic retries, and puts it back in its company's backlog. Stock is
+    reserved again; ValueError is raised if it is not available.
     """
-    from .tasks import process_order_task
+    msg = "Only failed orders can be retried."
+    retriable = [Order.Status.FAILED, Order.Status.DEAD_LETTER]
+    if order.status not in retriable:
+        raise ValueError(msg)
 
-    if order.status != Order.Status.FAILED:
-        msg = "Only failed orders can be retried."
+    with transaction.atomic():
+        if order.has_lines:
+            lines = get_order_lines(company=order.company, orders=[order])[order.pk]
+            _reserve_products_stock(
+                products={line.product_id: line.product for line in lines},  # pyright: ignore[reportAttributeAccessIssue]
+                quantities={line.product_id: line.quantity for line in lines},  # pyright: ignore[reportAttributeAccessIssue]
+            )
+        else:
+            reserve_product_stock_service(
+                product=order.product,
+                quantity=order.quantity,
+            )
+        if not order.transition_to(
+            Order.Status.PENDING,
+            from_statuses=retriable,
+            has_been_processed=False,
+            stock_reserved=True,
+            dispatched_at=None,
+            attempts=0,
+            retry_at=None,
+            last_error="",
+        ):
+            # Retried concurrently; the reservation is rolled back
+            raise ValueError(msg)
+        wake_scheduler_service()
+
+    return order
+
+
+def approve_orders_service(
+    *,
+    company: Company,
+    order_ids: list[int],
+) -> BatchApprovalResult:
+    """
+    Approves the company's PENDING or PROCESSING orders among `order_ids`
+    as one set with `approve_orders_batch_service`, so each product is
+    locked once however many orders are selected.
+    """
+    orders = list(
+        Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+        .select_related("product")
+        .filter(pk__in=order_ids, status__in=Order.APPROVABLE_STATUSES),
+    )
+    if not orders:
+        return {"approved": [], "failed": [], "backordered": []}
+    return approve_orders_batch_service(company=company, orders=orders)
+
+
+@transaction.atomic
+def retry_orders_service(*, company: Company, order_ids: list[int]) -> BulkRetryResult:
+    """
+    Set-based `retry_order_service` for the company's FAILED and
+    dead-lettered orders among `order_ids`. Stock is reserved once per
+    product for the orders that fit, oldest first, then for each multi-line
+    order whose lines all fit; the others are rejected and left as they are.
+    The retried orders move to PENDING with one UPDATE and the scheduler is
+    woken once.
+    """
+    retriable = [Order.Status.FAILED, Order.Status.DEAD_LETTER]
+    company_orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    orders_by_product: defaultdict[int, list[Order]] = defaultdict(list)
+    multi_line: list[Order] = []
+    for order in (
+        company_orders.select_for_update()
+        .filter(pk__in=order_ids, status__in=retriable)
+        .order_by("created_at", "pk")
+    ):
+        if order.has_lines:
+            multi_line.append(order)
+        else:
+            orders_by_product[order.product_id].append(order)  # pyright: ignore[reportAttributeAccessIssue]
+    lines = get_order_lines(company=company, orders=multi_line)
+    products = _lock_products(
+        company=company,
+        product_ids={
+            *orders_by_product,
+            *(line.product_id for line in chain.from_iterable(lines.values())),  # pyright: ignore[reportAttributeAccessIssue]
+        },
+    )
+
+    result: BulkRetryResult = {"retried": [], "rejected": []}
+    for product_id, product_orders in orders_by_product.items():
+        product = products[product_id]
+        available = product.available_quantity
+        retried: list[int] = []
+        quantity = 0
+        for order in product_orders:
+            if quantity + order.quantity <= available:
+                quantity += order.quantity
+                retried.append(order.pk)
+            else:
+                result["rejected"].append(order.pk)
+        try:
+            if quantity:
+                reserve_product_stock_service(product=product, quantity=quantity)
+        except ValueError:
+            # Stock was taken concurrently
+            result["rejected"].extend(retried)
+        else:
+            result["retried"].extend(retried)
+
+    # Multi-line orders, oldest first, take whatever stock is left
+    for order in multi_line:
+        try:
+            with transaction.atomic():
+                _reserve_products_stock(
+                    products=products,
+                    quantities={
+                        line.product_id: line.quantity  # pyright: ignore[reportAttributeAccessIssue]
+                        for line in lines[order.pk]
+                    },
+                )
+        except ValueError:
+            result["rejected"].append(order.pk)
+        else:
+            result["retried"].append(order.pk)
+
+    Order.transition_orders(
+        company_orders.filter(pk__in=result["retried"]),
+        Order.Status.PENDING,
+        from_statuses=retriable,
+        has_been_processed=False,
+        stock_reserved=True,
+        dispatched_at=None,
+        attempts=0,
+        retry_at=None,
+        last_error="",
+    )
+    if result["retried"]:
+        wake_scheduler_service()
+    return result
+
+
+def start_bulk_order_action_service(
+    *,
+    action: str,
+    company: Company,
+    order_ids: list[int],
+    requested_by: Profile | None = None,
+) -> BulkOrderAction:
+    """
+    Records a bulk approve or retry of `order_ids` and schedules the task
+    that runs it, in the same transaction.
+    """
+    from .tasks import run_bulk_order_action_task
+
+    with transaction.atomic():
+        bulk_action = BulkOrderAction.objects.create(
+            action=action,
+            company=company,
+            requested_by=requested_by,
+            order_ids=order_ids,
+            total=len(order_ids),
+        )
+        enqueue_task(
+            run_bulk_order_action_task,
+            args=(bulk_action.pk,),
+            kwargs={"company_id": company.pk},
+        )
+    return bulk_action
+
+
+def start_export_service(
+    *,
+    company: Company,
+    spec: ExportSpec,
+    export_format: str = Export.Format.CSV,
+    requested_by: Profile | None = None,
+) -> Export:
+    """
+    Records an export of the orders selected by `spec` and schedules the
+    task that writes its file in `export_format`, in the same transaction.
+    Raises ValueError if the format's backend is not installed.
+    """
+    from .tasks import generate_export_file_task
+
+    if export_format not in dict(available_export_formats()):
+        label = Export.Format(export_format).label
+        msg = f"The {label} export format is not available."
         raise ValueError(msg)
 
-    order.status = Order.Status.PENDING
-    order.has_been_processed = False
-    order.save()
+    with transaction.atomic():
+        export = Export.objects.create(
+            company=company,
+            requested_by=requested_by,
+            spec=spec,
+            format=export_format,
+        )
+        enqueue_task(
+            generate_export_file_task,
+            args=(export.pk,),
+            kwargs={"company_id": company.pk},
+        )
+    return export
+
+
+def create_export_shards_service(
+    *,
+    export: Export,
+    ranges: list[tuple[int, int]],
+) -> list[ExportShard]:
+    """
+    Records a shard of the export per range of order ids, replacing those of
+    an earlier attempt.
+    """
+    with transaction.atomic():
+        ExportShard.objects.for_tenant(export.company).filter(export=export).delete()  # pyright: ignore[reportAttributeAccessIssue]
+        return ExportShard.objects.bulk_create(
+            ExportShard(
+                export=export,
+                company=export.company,
+                index=index,
+                first_pk=first_pk,
+                last_pk=last_pk,
+            )
+            for index, (first_pk, last_pk) in enumerate(ranges)
+        )
 
-    process_order_task.delay(order.pk, company_id=order.company.pk)
 
-    return order
+def run_bulk_order_action_service(*, bulk_action: BulkOrderAction) -> None:
+    """
+    Runs a bulk action in chunks of ORDER_BATCH_SIZE orders, recording the
+    progress after each chunk. A redelivered task resumes after the last
+    recorded chunk; a finished action is left alone.
+    """
+    finished = (BulkOrderAction.Status.DONE, BulkOrderAction.Status.FAILED)
+    if bulk_action.status in finished:
+        return
+
+    company = bulk_action.company
+    actions = BulkOrderAction.objects.for_tenant(company).filter(pk=bulk_action.pk)  # pyright: ignore[reportAttributeAccessIssue]
+    actions.update(status=BulkOrderAction.Status.RUNNING)
+    chunk_size = settings.ORDER_BATCH_SIZE
+    try:
+        for start in range(bulk_action.processed, bulk_action.total, chunk_size):
+            chunk = bulk_action.order_ids[start : start + chunk_size]
+            if bulk_action.action == BulkOrderAction.Action.APPROVE:
+                approval = approve_orders_service(company=company, order_ids=chunk)
+                succeeded, rejected = approval["approved"], approval["failed"]
+            else:
+                retry = retry_orders_service(company=company, order_ids=chunk)
+                succeeded, rejected = retry["retried"], retry["rejected"]
+            actions.update(
+                processed=start + len(chunk),
+                succeeded=F("succeeded") + len(succeeded),
+                rejected=F("rejected") + len(rejected),
+            )
+    except Exception:
+        actions.update(
+            status=BulkOrderAction.Status.FAILED,
+            finished_at=timezone.now(),
+        )
+        raise
+    actions.update(status=BulkOrderAction.Status.DONE, finished_at=timezone.now())
+
+
+def claim_order_service(*, company: Company, order_id: int) -> Order | None:
+    """
+    Claims a single PENDING order by moving it to PROCESSING in a short
+    transaction. Returns None if the order was already claimed elsewhere.
+    """
+    orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    claimed = Order.transition_orders(
+        _due_for_processing(orders.filter(pk=order_id)),
+        Order.Status.PROCESSING,
+        from_statuses=[Order.Status.PENDING],
+    )
+    if not claimed:
+        return None
+
+    return orders.select_related("product").get(pk=order_id)
+
+
+def claim_pending_orders_service(
+    *,
+    company: Company,
+    limit: int | None = None,
+    order_ids: list[int] | None = None,
+) -> list[Order]:
+    """
+    Claims the company's oldest PENDING orders by moving them to PROCESSING,
+    optionally restricted to `order_ids` and capped at `limit`.
+    Rows already claimed by a concurrent worker, and orders backing off
+    after a transient error, are skipped.
+    """
+    with transaction.atomic():
+        pending = _due_for_processing(
+            Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+            .select_for_update(skip_locked=True)
+            .filter(status=Order.Status.PENDING)
+            .order_by("created_at", "pk"),
+        )
+        if order_ids is not None:
+            pending = pending.filter(pk__in=order_ids)
+        orders = list(pending[:limit] if limit is not None else pending)
+        Order.transition_orders(
+            Order.objects.for_tenant(company).filter(  # pyright: ignore[reportAttributeAccessIssue]
+                pk__in=[order.pk for order in orders],
+            ),
+            Order.Status.PROCESSING,
+        )
+
+    for order in orders:
+        order.status = Order.Status.PROCESSING
+
+    return orders
+
+
+class _TransitionLostError(Exception):
+    """Another worker moved one of the orders of a batch first."""
+
+
+@transaction.atomic
+def approve_orders_batch_service(
+    *,
+    company: Company,
+    orders: list[Order],
+) -> BatchApprovalResult:
+    """
+    Approves or fails many of a company's orders at once. Orders are grouped
+    by product, every product row is locked once, and each group is approved
+    in FIFO order against the remaining stock. Statuses and the inventory
+    ledger entries are written in bulk.
+
+    Statuses move with conditional UPDATEs. If another worker finished any
+    of the orders first, the batch is undone and every order is approved on
+    its own instead, so none is approved twice.
+    """
+    try:
+        with transaction.atomic():
+            return _approve_orders_in_bulk(company=company, orders=orders)
+    except _TransitionLostError:
+        logger.warning(
+            "Orders of a batch were finished elsewhere; approving them one by one.",
+        )
+
+    result: BatchApprovalResult = {"approved": [], "failed": [], "backordered": []}
+    outcomes = {
+        Order.Status.APPROVED: "approved",
+        Order.Status.FAILED: "failed",
+        Order.Status.BACKORDERED: "backordered",
+    }
+    for order in sorted(orders, key=lambda order: (order.created_at, order.pk)):
+        if approve_order_service(order=order):
+            result[outcomes[order.status]].append(order.pk)
+    return result
+
+
+def _approve_orders_in_bulk(
+    *,
+    company: Company,
+    orders: list[Order],
+) -> BatchApprovalResult:
+    orders_by_product: defaultdict[int, list[Order]] = defaultdict(list)
+    multi_line: list[Order] = []
+    for order in orders:
+        if order.status not in Order.APPROVABLE_STATUSES:
+            continue
+        if order.has_lines:
+            multi_line.append(order)
+        else:
+            orders_by_product[order.product_id].append(order)  # pyright: ignore[reportAttributeAccessIssue]
+    lines = get_order_lines(company=company, orders=multi_line)
+
+    # Every product of the batch, multi-line orders included, is locked by
+    # one query in id order so concurrent batches cannot deadlock. Shards
+    # are locked too: their available stock is read before it is deducted
+    products = _lock_products(
+        company=company,
+        product_ids={
+            *orders_by_product,
+            *(line.product_id for line in chain.from_iterable(lines.values())),  # pyright: ignore[reportAttributeAccessIssue]
+        },
+        with_shards=True,
+    )
+
+    result: BatchApprovalResult = {"approved": [], "failed": [], "backordered": []}
+    movements: list[MovementData] = []
+    reserved: defaultdict[int, int] = defaultdict(int)
+    deducted: defaultdict[int, int] = defaultdict(int)
+    for product_id, product_orders in orders_by_product.items():
+        product = products[product_id]
+        if not product.is_active:
+            continue
+
+        # Reserved orders always fit; the others share the unreserved stock
+        # under the allocation policy
+        fifo = sorted(product_orders, key=lambda order: (order.created_at, order.pk))
+        unreserved = [order for order in fifo if not order.stock_reserved]
+        filled = dict(
+            zip(
+                (order.pk for order in unreserved),
+                allocate_stock(
+                    [order.quantity for order in unreserved],
+                    product.available_quantity,
+                    policy=AllocationPolicy(settings.ORDER_ALLOCATION_POLICY),
+                ),
+                strict=True,
+            ),
+        )
+        for order in fifo:
+            if order.stock_reserved:
+                reserved[product_id] += order.quantity
+            elif filled[order.pk]:
+                deducted[product_id] += order.quantity
+            else:
+                short = "backordered" if product.backorders_enabled else "failed"
+                result[short].append(order.pk)
+                continue
+            result["approved"].append(order.pk)
+            movements.append(
+                {
+                    "product": product,
+                    "quantity_change": -order.quantity,
+                    "reason": InventoryMovement.Reason.ORDER_APPROVED,
+                    "reference": str(order.reference_code),
+                },
+            )
+
+    # Multi-line orders are all-or-nothing: oldest first, each one takes the
+    # stock of every line from what the single-line orders left, or fails
+    left = {
+        product_id: product.available_quantity - deducted[product_id]
+        for product_id, product in products.items()
+        if multi_line
+    }
+    for order in sorted(multi_line, key=lambda order: (order.created_at, order.pk)):
+        order_lines = lines[order.pk]
+        if not all(products[line.product_id].is_active for line in order_lines):  # pyright: ignore[reportAttributeAccessIssue]
+            continue
+        if not order.stock_reserved and any(
+            line.quantity > left[line.product_id]  # pyright: ignore[reportAttributeAccessIssue]
+            for line in order_lines
+        ):
+            result["failed"].append(order.pk)
+            continue
+        for line in order_lines:
+            if order.stock_reserved:
+                reserved[line.product_id] += line.quantity  # pyright: ignore[reportAttributeAccessIssue]
+            else:
+                deducted[line.product_id] += line.quantity  # pyright: ignore[reportAttributeAccessIssue]
+                left[line.product_id] -= line.quantity  # pyright: ignore[reportAttributeAccessIssue]
+            movements.append(
+                {
+                    "product": products[line.product_id],  # pyright: ignore[reportAttributeAccessIssue]
+                    "quantity_change": -line.quantity,
+                    "reason": InventoryMovement.Reason.ORDER_APPROVED,
+                    "reference": str(order.reference_code),
+                },
+            )
+        result["approved"].append(order.pk)
+
+    for product_id, product in products.items():
+        if reserved[product_id]:
+            commit_product_reservation_service(
+                product=product,
+                quantity=reserved[product_id],
+                record_movement=False,
+            )
+        if deducted[product_id]:
+            adjust_product_stock_service(
+                product=product,
+                quantity_change=-deducted[product_id],
+                record_movement=False,
+            )
+
+    record_inventory_movements_service(company=company, movements=movements)
+
+    company_orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    moved = Order.transition_orders(
+        company_orders.filter(pk__in=result["approved"]),
+        Order.Status.APPROVED,
+        has_been_processed=True,
+        stock_reserved=False,
+    )
+    moved += Order.transition_orders(
+        company_orders.filter(pk__in=result["failed"]),
+        Order.Status.FAILED,
+        has_been_processed=True,
+    )
+    moved += Order.transition_orders(
+        company_orders.filter(pk__in=result["backordered"]),
+        Order.Status.BACKORDERED,
+        backordered_at=timezone.now(),
+    )
+    if moved != sum(len(order_ids) for order_ids in result.values()):
+        raise _TransitionLostError
+    logger.info(
+        "Batch approval finished: %d approved, %d failed due to insufficient "
+        "stock, %d backordered.",
+        len(result["approved"]),
+        len(result["failed"]),
+        len(result["backordered"]),
+    )
+
+    return result
+
+
+def fail_inactive_product_orders_service(
+    *,
+    company: Company,
+    order_ids: list[int],
+    error: str = "The product is inactive.",
+) -> list[Order]:
+    """
+    Fails those of the PROCESSING orders whose product, or the product of
+    one of their lines, was deactivated, as no approval would finish them,
+    and releases their stock. Returns the orders that were failed.
+    """
+    inactive = list(
+        Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+        .filter(pk__in=order_ids)
+        .filter(Q(product__is_active=False) | Q(lines__product__is_active=False))
+        .values_list("pk", flat=True)
+        .distinct(),
+    )
+    if not inactive:
+        return []
+    return fail_orders_service(
+        company=company,
+        order_ids=inactive,
+        errors=dict.fromkeys(inactive, error),
+    )
+
+
+@transaction.atomic
+def fail_orders_service(
+    *,
+    company: Company,
+    order_ids: list[int],
+    errors: dict[int, str] | None = None,
+    status: int = Order.Status.FAILED,
+) -> list[Order]:
+    """
+    Marks PROCESSING orders as FAILED, or `status`, after an unexpected
+    error with one UPDATE and releases the stock they had reserved. `errors`
+    maps order ids to the error recorded as their last_error. Returns the
+    orders that were failed.
+    """
+    errors = errors or {}
+    company_orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    # Orders another transaction is moving are left to it
+    orders = list(
+        company_orders.select_for_update(skip_locked=True)
+        .filter(pk__in=order_ids, status=Order.Status.PROCESSING)
+        .order_by("pk"),
+    )
+    if not orders:
+        return []
+    order_errors = {
+        order.pk: errors[order.pk] for order in orders if order.pk in errors
+    }
+    Order.transition_orders(
+        company_orders.filter(pk__in=[order.pk for order in orders]),
+        status,
+        from_statuses=[Order.Status.PROCESSING],
+        has_been_processed=True,
+        stock_reserved=False,
+        last_error=_per_order("last_error", order_errors),
+    )
+
+    released: defaultdict[int, int] = defaultdict(int)
+    multi_line: list[Order] = []
+    for order in orders:
+        # stock_reserved cannot change while the order stays PROCESSING
+        if order.stock_reserved and order.has_lines:
+            multi_line.append(order)
+        elif order.stock_reserved:
+            released[order.product_id] += order.quantity  # pyright: ignore[reportAttributeAccessIssue]
+        order.status = status
+        order.has_been_processed = True
+        order.stock_reserved = False
+        order.last_error = order_errors.get(order.pk, order.last_error)
+    for order_lines in get_order_lines(company=company, orders=multi_line).values():
+        for line in order_lines:
+            released[line.product_id] += line.quantity  # pyright: ignore[reportAttributeAccessIssue]
+    products = Product.objects.for_tenant(company).filter(pk__in=released.keys())  # pyright: ignore[reportAttributeAccessIssue]
+    for product in products.order_by("pk"):
+        release_product_reservation_service(
+            product=product,
+            quantity=released[product.pk],
+        )
+
+    return orders
+
+
+@transaction.atomic
+def retry_orders_later_service(
+    *,
+    company: Company,
+    errors: dict[int, str],
+) -> RetriedOrders:
+    """
+    Puts PROCESSING orders that hit a transient error back in the backlog,
+    keeping their reservation, to be processed again after a jittered
+    exponential backoff. Orders that used up ORDER_MAX_ATTEMPTS are moved to
+    DEAD_LETTER instead. `errors` maps order ids to their error. Each
+    group is moved with one UPDATE. Returns the orders that will be retried
+    and those dead-lettered.
+    """
+    company_orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    # Orders another transaction is moving are left to it
+    processing = list(
+        company_orders.select_for_update(skip_locked=True)
+        .filter(pk__in=errors.keys(), status=Order.Status.PROCESSING)
+        .order_by("pk"),
+    )
+    now = timezone.now()
+    retried: list[Order] = []
+    exhausted: list[int] = []
+    for order in processing:
+        order.attempts += 1
+        if order.attempts >= settings.ORDER_MAX_ATTEMPTS:
+            exhausted.append(order.pk)
+            continue
+        order.status = Order.Status.PENDING
+        order.retry_at = now + dt.timedelta(
+            seconds=retry_delay_seconds(order.attempts),
+        )
+        order.dispatched_at = None
+        order.last_error = errors[order.pk]
+        retried.append(order)
+    if retried:
+        Order.transition_orders(
+            company_orders.filter(pk__in=[order.pk for order in retried]),
+            Order.Status.PENDING,
+            from_statuses=[Order.Status.PROCESSING],
+            attempts=F("attempts") + 1,
+            retry_at=_per_order(
+                "retry_at",
+                {order.pk: order.retry_at for order in retried},
+            ),
+            dispatched_at=None,
+            last_error=_per_order(
+                "last_error",
+                {order.pk: order.last_error for order in retried},
+            ),
+        )
+
+    dead = fail_orders_service(
+        company=company,
+        order_ids=exhausted,
+        errors=errors,
+        status=Order.Status.DEAD_LETTER,
+    )
+    company_orders.filter(pk__in=[order.pk for order in dead]).update(
+        attempts=F("attempts") + 1,
+    )
+    for order in dead:
+        order.attempts += 1
+        logger.error(
+            "Order %s was dead-lettered after %d attempts: %s",
+            order.reference_code,
+            order.attempts,
+            order.last_error,
+        )
+    return {"retried": retried, "dead_lettered": dead}
+
+
+def _per_order(field: str, values: dict[int, Any]) -> Case | F:
+    """
+    An UPDATE value of `field` that differs per order: `values` maps order
+    ids to theirs, the other orders keep their own.
+    """
+    if not values:
+        return F(field)
+    return Case(
+        *(When(pk=order_id, then=Value(value)) for order_id, value in values.items()),
+        default=F(field),
+        output_field=Order._meta.get_field(field),
+    )
+
+
+def reap_stuck_orders_service() -> dict[int, ReapedOrders]:
+    """
+    Recovers the orders of every company abandoned by their worker, e.g.
+    one that died mid-task, or left PROCESSING because their product was
+    deactivated during the fulfillment call; orders whose product was
+    deactivated before they were picked up already fail then. Orders
+    PROCESSING for longer than ORDER_LEASE_SECONDS are put back in the
+    backlog like after a transient error, or dead-lettered once out of
+    attempts; those with an inactive product fail. PENDING orders
+    dispatched longer ago than the lease but never claimed, whose message
+    was lost, go back to the scheduler. Orders are handled in batches of
+    ORDER_REAPER_BATCH_SIZE. Returns the counts per company id.
+    """
+    lease = settings.ORDER_LEASE_SECONDS
+    cutoff = timezone.now() - dt.timedelta(seconds=lease)
+    batch_size = settings.ORDER_REAPER_BATCH_SIZE
+    orders = Order.objects.for_all_tenants()  # pyright: ignore[reportAttributeAccessIssue]
+    counts: defaultdict[int, ReapedOrders] = defaultdict(
+        lambda: {"requeued": 0, "failed": 0, "redispatched": 0},
+    )
+
+    # Reaped orders leave PROCESSING, so every pass reads the next batch
+    abandoned = orders.filter(status=Order.Status.PROCESSING, updated_at__lt=cutoff)
+    while batch := list(
+        abandoned.order_by("updated_at").values_list("company", "pk")[:batch_size],
+    ):
+        order_ids: defaultdict[int, list[int]] = defaultdict(list)
+        for company_id, order_id in batch:
+            order_ids[company_id].append(order_id)
+        companies = Company.objects.in_bulk(order_ids.keys())
+        reaped = 0
+        for company_id, ids in order_ids.items():
+            error = f"Reaped: still PROCESSING after {lease} seconds."
+            with transaction.atomic():
+                failed = fail_inactive_product_orders_service(
+                    company=companies[company_id],
+                    order_ids=ids,
+                    error="Reaped: the product is inactive.",
+                )
+                inactive = {order.pk for order in failed}
+                outcome = retry_orders_later_service(
+                    company=companies[company_id],
+                    errors={pk: error for pk in ids if pk not in inactive},
+                )
+            requeued = outcome["retried"]
+            dead = len(outcome["dead_lettered"])
+            counts[company_id]["requeued"] += len(requeued)
+            counts[company_id]["failed"] += len(failed) + dead
+            reaped += len(failed) + len(requeued) + dead
+        if not reaped:
+            # Nothing could be moved, so the next pass would read the same
+            break
+
+    lost = orders.filter(status=Order.Status.PENDING, dispatched_at__lt=cutoff)
+    while batch := list(
+        lost.order_by("dispatched_at").values_list("company", "pk")[:batch_size],
+    ):
+        lost.filter(pk__in=[order_id for _, order_id in batch]).update(
+            dispatched_at=None,
+        )
+        for company_id, _ in batch:
+            counts[company_id]["redispatched"] += 1
+
+    for company_id, reaped in counts.items():
+        logger.warning(
+            "Reaped stuck orders of company %s: %d requeued, %d failed, "
+            "%d redispatched.",
+            company_id,
+            reaped["requeued"],
+            reaped["failed"],
+            reaped["redispatched"],
+        )
+    if any(reaped["requeued"] or reaped["redispatched"] for reaped in counts.values()):
+        wake_scheduler_service()
+    return dict(counts)
+
+
+@transaction.atomic
+def fill_backorders_service(
+    *,
+    product: Product,
+    policy: str | None = None,
+) -> list[int]:
+    """
+    Reserves stock for the product's backordered orders chosen by `policy`
+    (ORDER_ALLOCATION_POLICY by default; see apps.orders.allocation) among
+    those the available stock covers, and moves them back to PENDING: the
+    fair scheduler then dispatches them and the workers fulfill them like
+    any new order. The product row is locked once and the reservation and
+    the statuses are written in bulk. Returns the ids of the orders filled.
+    """
+    company = product.company
+    locked = (
+        Product.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+        .select_for_update()
+        .get(pk=product.pk)
+    )
+    available = locked.available_quantity
+    if not locked.is_active or available <= 0:
+        return []
+
+    company_orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    # Orders larger than the available stock cannot be filled by any policy
+    queue = list(
+        company_orders.select_for_update()
+        .filter(
+            product=locked,
+            status=Order.Status.BACKORDERED,
+            quantity__lte=available,
+        )
+        .order_by("backordered_at", "pk")
+        .values_list("pk", "quantity"),
+    )
+    if not queue:
+        return []
+    chosen = allocate_stock(
+        [quantity for _, quantity in queue],
+        available,
+        policy=AllocationPolicy(policy or settings.ORDER_ALLOCATION_POLICY),
+    )
+    filled = [row for row, is_chosen in zip(queue, chosen, strict=True) if is_chosen]
+    if not filled:
+        return []
+
+    try:
+        reserve_product_stock_service(
+            product=locked,
+            quantity=sum(quantity for _, quantity in filled),
+        )
+    except ValueError:
+        # New orders reserved the stock meanwhile; the next restock retries
+        return []
+    order_ids = [order_id for order_id, _ in filled]
+    Order.transition_orders(
+        company_orders.filter(pk__in=order_ids),
+        Order.Status.PENDING,
+        from_statuses=[Order.Status.BACKORDERED],
+        stock_reserved=True,
+    )
+    wake_scheduler_service()
+    logger.info("Filled %d backordered orders of %s.", len(order_ids), locked)
+    return order_ids
+
+
+def start_stock_allocation_service(
+    *,
+    company: Company,
+    product_ids: Iterable[int],
+) -> None:
+    """
+    Schedules allocate_product_stock_task for each of the company's
+    products, once the current transaction commits.
+    """
+    from .tasks import allocate_product_stock_task
+
+    enqueue_tasks(
+        allocate_product_stock_task,
+        calls=[
+            ((product_id,), {"company_id": company.pk})
+            for product_id in sorted(set(product_ids))
+        ],
+    )
+
+
+def allocate_product_stock_service(
+    *,
+    product: Product,
+    policy: str | None = None,
+) -> StockAllocationResult:
+    """
+    Shares the product's available stock between its undispatched PENDING
+    orders without a reservation in one batch, under `policy`
+    (ORDER_ALLOCATION_POLICY by default; see apps.orders.allocation).
+    Filled orders get a reservation and stay PENDING, so the scheduler
+    dispatches them to fulfillment like any new order; the others fail, or
+    are backordered if the product allows it. The product and the orders
+    are locked once, and the reservation and the statuses are written in
+    bulk. Orders already dispatched to a worker are left to it.
+    """
+    company = product.company
+    result: StockAllocationResult = {"reserved": [], "failed": [], "backordered": []}
+    with transaction.atomic():
+        locked = (
+            Product.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+            .select_for_update()
+            .get(pk=product.pk)
+        )
+        if not locked.is_active:
+            return result
+
+        company_orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+        rows = list(
+            company_orders.select_for_update()
+            .filter(
+                product=locked,
+                status=Order.Status.PENDING,
+                dispatched_at__isnull=True,
+                stock_reserved=False,
+            )
+            .order_by("created_at", "pk")
+            .values_list("pk", "quantity"),
+        )
+        if not rows:
+            return result
+        filled = allocate_stock(
+            [quantity for _, quantity in rows],
+            locked.available_quantity,
+            policy=AllocationPolicy(policy or settings.ORDER_ALLOCATION_POLICY),
+        )
+
+        short = "backordered" if locked.backorders_enabled else "failed"
+        for (order_id, _), is_filled in zip(rows, filled, strict=True):
+            result["reserved" if is_filled else short].append(order_id)
+        reserved = sum(
+            quantity
+            for (_, quantity), is_filled in zip(rows, filled, strict=True)
+            if is_filled
+        )
+        if reserved:
+            try:
+                reserve_product_stock_service(product=locked, quantity=reserved)
+            except ValueError:
+                # A sharded product's stock was reserved meanwhile; run again
+                logger.warning("Stock of %s changed during allocation.", locked)
+                return {"reserved": [], "failed": [], "backordered": []}
+            company_orders.filter(pk__in=result["reserved"]).update(
+                stock_reserved=True,
+            )
+            wake_scheduler_service()
+        status, fields = _stock_failure(locked)
+        Order.transition_orders(
+            company_orders.filter(pk__in=result[short]),
+            status,
+            from_statuses=[Order.Status.PENDING],
+            **fields,
+        )
+    logger.info(
+        "Allocated %s under the %s policy: %d reserved, %d %s.",
+        locked,
+        policy or settings.ORDER_ALLOCATION_POLICY,
+        len(result["reserved"]),
+        len(result[short]),
+        short,
+    )
+    return result
@@ -0,0 +1,20 @@
+from django.dispatch import receiver
+
+from apps.products.models import Product
+from apps.products.signals import stock_added
+
+from .outbox import enqueue_task
+
+
+@receiver(stock_added, sender=Product)
+def fill_backorders_on_restock(sender, product: Product, **kwargs) -> None:  # noqa: ANN001, ANN003, ARG001
+    """Schedules one job filling the backorders the freed stock covers."""
+    from .tasks import fill_backorders_task
+
+    if not product.backorders_enabled:
+        return
+    enqueue_task(
+        fill_backorders_task,
+        args=(product.pk,),
+        kwargs={"company_id": product.company_id},  # pyright: ignore[reportAttributeAccessIssue]
+    )
@@ -1,96 +1,379 @@
-import csv
-import io
 import logging
-import time
+import tempfile
+from collections.abc import Callable, Iterator
+from typing import IO
 
-from celery import shared_task
-from django.core.files.base import ContentFile
-from django.db import transaction
+from celery import chord, shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models.fields.files import FieldFile
 
-from .models import Export, Order
-from .selectors import get_export_for_company, get_orders_for_company
-from .services import approve_order_service
+from apps.companies.models import Company
+from apps.companies.selectors import get_company
+from apps.products.models import Product
+
+from .exports import (
+    iter_export_rows,
+    merge_export_parts,
+    plan_export_shards,
+    write_export,
+)
+from .fulfillment import FulfillmentRequest, get_fulfillment_gateway
+from .idempotency import purge_expired_idempotency_keys
+from .models import BulkOrderAction, Export, ExportShard, Order
+from .outbox import relay_outbox_messages
+from .retries import describe_error, is_transient_error
+from .selectors import (
+    get_export_for_company,
+    get_export_orders,
+    get_order_lines,
+    get_orders_for_company,
+)
+from .services import (
+    SCHEDULER_WAKE_KEY,
+    allocate_product_stock_service,
+    approve_order_service,
+    approve_orders_batch_service,
+    claim_order_service,
+    claim_pending_orders_service,
+    create_export_shards_service,
+    fail_inactive_product_orders_service,
+    fail_orders_service,
+    fill_backorders_service,
+    reap_stuck_orders_service,
+    retry_orders_later_service,
+    run_bulk_order_action_service,
+    schedule_orders_service,
+    wake_scheduler_service,
+)
 
 logger = logging.getLogger(__name__)
 
 
+def _fulfillment_requests(
+    *,
+    company: Company,
+    orders: list[Order],
+) -> list[FulfillmentRequest]:
+    lines = get_order_lines(company=company, orders=orders)
+    return [
+        FulfillmentRequest(
+            order_id=order.pk,
+            reference_code=order.reference_code,
+            product_id=order.product_id,  # pyright: ignore[reportAttributeAccessIssue]
+            quantity=order.quantity,
+            lines=tuple(
+                (line.product_id, line.quantity)  # pyright: ignore[reportAttributeAccessIssue]
+                for line in lines.get(order.pk, [])
+            ),
+        )
+        for order in orders
+    ]
+
+
+def _release_db_connection() -> None:
+    """
+    Hands the worker's DB connection back before a slow network call.
+    Django reconnects lazily on the next query.
+    """
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+def _handle_failed_orders(
+    *,
+    company: Company,
+    failures: list[tuple[Order, BaseException]],
+) -> None:
+    """
+    Orders hit by a transient error are retried later, or dead-lettered once
+    out of attempts. Any other error fails them for good.
+    """
+    transient = {
+        order.pk: describe_error(error)
+        for order, error in failures
+        if is_transient_error(error)
+    }
+    permanent = {
+        order.pk: describe_error(error)
+        for order, error in failures
+        if order.pk not in transient
+    }
+    retried = retry_orders_later_service(company=company, errors=transient)
+    for order in retried["retried"]:
+        logger.warning(
+            "Order %s hit a transient error and will be retried (attempt %d): %s",
+            order.reference_code,
+            order.attempts,
+            order.last_error,
+        )
+    failed = fail_orders_service(
+        company=company,
+        order_ids=list(permanent),
+        errors=permanent,
+    )
+    for order in failed:
+        logger.error(
+            "Order %s failed unexpectedly and was marked as FAILED.",
+            order.reference_code,
+        )
+
+
 @shared_task
 def process_order_task(order_id: int, company_id: int) -> None:
-    orders = get_orders_for_company(company_pk=company_id)
-    with transaction.atomic():
-        try:
-            order = orders.get(
-                id=order_id,
-                status=Order.Status.PENDING,
-            )
-        except Order.DoesNotExist:
-            return
+    company = get_company(pk=company_id)
 
-        try:
-            order.status = Order.Status.PROCESSING
-            order.save()
+    # Phase 1: claim the order (PENDING -> PROCESSING) in a short transaction
+    order = claim_order_service(company=company, order_id=order_id)
+    if order is None or not _fail_inactive_product_orders(
+        company=company,
+        orders=[order],
+    ):
+        return
 
-            # --- External Call Simulation ---
-            logger.info(
-                "Order %s: Simulating external API call...",
-                order.reference_code,
-            )
-            time.sleep(5)
-            logger.info(
-                "Order %s: External call simulation finished.",
-                order.reference_code,
-            )
-            # --- End of simulation ---
+    try:
+        # Phase 2: the external call runs with no transaction or connection held
+        (request,) = _fulfillment_requests(company=company, orders=[order])
+        _release_db_connection()
+        get_fulfillment_gateway().fulfill_sync(request)
 
+        # Phase 3: finalize against fresh stock in a short transaction
+        orders = get_orders_for_company(company_pk=company_id)
+        with transaction.atomic():
+            order = orders.select_related("product").get(pk=order_id)
             approve_order_service(order=order)
-        except Exception as e:
-            logger.exception(e)
-            if order.status == Order.Status.PROCESSING:
-                order.status = Order.Status.FAILED
-                order.has_been_processed = True
-                order.save()
-                msg = f"Order {order.reference_code} failed unexpectedly and was marked as FAILED."
-                logger.error(msg)
+    except Exception as e:
+        logger.exception(e)
+        _handle_failed_orders(company=company, failures=[(order, e)])
+
+
+def _fail_inactive_product_orders(
+    *,
+    company: Company,
+    orders: list[Order],
+) -> list[Order]:
+    """
+    Fails the claimed orders whose product was deactivated after they were
+    dispatched, before any external call, and returns the others.
+    """
+    failed = fail_inactive_product_orders_service(
+        company=company,
+        order_ids=[order.pk for order in orders],
+    )
+    for order in failed:
+        logger.warning(
+            "Order %s was failed: its product is inactive.",
+            order.reference_code,
+        )
+    failed_ids = {order.pk for order in failed}
+    return [order for order in orders if order.pk not in failed_ids]
+
+
+def _process_claimed_orders(*, company: Company, orders: list[Order]) -> None:
+    orders = _fail_inactive_product_orders(company=company, orders=orders)
+    if not orders:
+        return
+    # All external calls of the batch run concurrently through the gateway
+    requests = _fulfillment_requests(company=company, orders=orders)
+    _release_db_connection()
+    errors = get_fulfillment_gateway().fulfill_many_sync(requests)
+    outcomes = list(zip(orders, errors, strict=True))
+    fulfilled = [order for order, error in outcomes if error is None]
+    failures = [(order, error) for order, error in outcomes if error is not None]
+    for error in filter(None, errors):
+        logger.error(error)
+    if failures:
+        _handle_failed_orders(company=company, failures=failures)
+
+    try:
+        approve_orders_batch_service(company=company, orders=fulfilled)
+    except Exception as e:
+        # The batch was rolled back, so its orders are still PROCESSING
+        logger.exception(e)
+        _handle_failed_orders(
+            company=company,
+            failures=[(order, e) for order in fulfilled],
+        )
 
 
 @shared_task
-@transaction.atomic
-def generate_export_file_task(
-    export_id: int,
-    order_ids: list[int],
+def process_pending_orders_batch_task(
     company_id: int,
-) -> None:
-    export = get_export_for_company(pk=export_id, company_pk=company_id)
+    batch_size: int | None = None,
+) -> int:
+    """
+    Claims up to `batch_size` PENDING orders of a company and approves them
+    together, locking each involved product only once.
+    """
+    company = get_company(pk=company_id)
+    orders = claim_pending_orders_service(
+        company=company,
+        limit=batch_size or settings.ORDER_BATCH_SIZE,
+    )
+    if orders:
+        _process_claimed_orders(company=company, orders=orders)
+    return len(orders)
 
-    try:
-        orders = get_orders_for_company(company_pk=company_id).filter(id__in=order_ids)
 
-        # Use an in-memory text buffer to build the CSV
-        string_io = io.StringIO()
-        writer = csv.writer(string_io)
+@shared_task
+def process_orders_chunk_task(order_ids: list[int], company_id: int) -> int:
+    """
+    Processes one chunk of orders dispatched by the scheduler. Orders that
+    are no longer PENDING are skipped. The scheduler runs again afterwards,
+    as the chunk freed processing capacity, unless a run is queued already.
+    """
+    company = get_company(pk=company_id)
+    orders = claim_pending_orders_service(company=company, order_ids=order_ids)
+    if orders:
+        _process_claimed_orders(company=company, orders=orders)
+    wake_scheduler_service()
+    return len(orders)
+
+
+@shared_task
+def schedule_orders_task() -> dict[int, int]:
+    """
+    Dispatches waiting orders fairly between companies. Started when orders
+    are created or finished, see wake_scheduler_service, and periodically
+    as a safety net.
+    """
+    # Orders arriving from now on need another run
+    cache.delete(SCHEDULER_WAKE_KEY)
+    return schedule_orders_service()
+
+
+@shared_task
+def run_bulk_order_action_task(action_id: int, company_id: int) -> None:
+    """Runs an admin approve or retry of many orders; see BulkOrderAction."""
+    company = get_company(pk=company_id)
+    bulk_action = BulkOrderAction.objects.for_tenant(company).get(pk=action_id)  # pyright: ignore[reportAttributeAccessIssue]
+    run_bulk_order_action_service(bulk_action=bulk_action)
+
+
+@shared_task
+def fill_backorders_task(product_id: int, company_id: int) -> int:
+    """
+    Fills the backorders of a product whose stock was freed, sending them
+    back to processing. Returns the number of orders filled.
+    """
+    company = get_company(pk=company_id)
+    product = Product.objects.for_tenant(company).get(pk=product_id)  # pyright: ignore[reportAttributeAccessIssue]
+    return len(fill_backorders_service(product=product))
+
+
+@shared_task
+def allocate_product_stock_task(
+    product_id: int,
+    company_id: int,
+    policy: str | None = None,
+) -> dict[str, int]:
+    """
+    Shares an oversubscribed product's stock between its undispatched
+    pending orders in one batch, reserving it for those filled. Returns the
+    number of orders per outcome.
+    """
+    company = get_company(pk=company_id)
+    product = Product.objects.for_tenant(company).get(pk=product_id)  # pyright: ignore[reportAttributeAccessIssue]
+    result = allocate_product_stock_service(product=product, policy=policy)
+    return {outcome: len(order_ids) for outcome, order_ids in result.items()}
+
+
+@shared_task
+def reap_stuck_orders_task() -> dict[int, dict[str, int]]:
+    """
+    Periodically recovers orders abandoned in PROCESSING, or dispatched and
+    never claimed. Returns the counts per company id.
+    """
+    return reap_stuck_orders_service()  # pyright: ignore[reportReturnType]
+
+
+@shared_task
+def purge_idempotency_keys_task() -> int:
+    """Deletes expired idempotency keys. Returns how many."""
+    return purge_expired_idempotency_keys()
 
-        # Write header row
-        writer.writerow(
-            ["Reference Code", "Product SKU", "Quantity", "Status", "Created At"],
-        )
 
-        # Write data rows
-        for order in orders:
-            writer.writerow(
-                [
-                    order.reference_code,
-                    order.product.sku,
-                    order.quantity,
-                    order.get_status_display(),  # pyright: ignore[reportAttributeAccessIssue]
-                    order.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                ],
+@shared_task
+def relay_outbox_task() -> int:
+    """
+    Periodic task that publishes outbox messages the on_commit fast path
+    could not send, e.g. while the broker was unavailable.
+    """
+    return relay_outbox_messages()
+
+
+def _save_export_file(
+    field_file: FieldFile,
+    name: str,
+    write: Callable[[IO[bytes]], object],
+) -> int:
+    """
+    Calls `write` with a temporary file and saves the result to `field_file`
+    without saving its instance. Returns the file's size in bytes.
+    """
+    with tempfile.TemporaryFile() as file:
+        write(file)
+        size = file.tell()
+        file.seek(0)
+        # The storage copies the file in chunks
+        field_file.save(name, File(file), save=False)
+    return size
+
+
+def _fail_export(export: Export) -> None:
+    Export.objects.for_tenant(export.company).filter(pk=export.pk).update(  # pyright: ignore[reportAttributeAccessIssue]
+        status=Export.Status.FAILED,
+    )
+
+
+@shared_task
+def generate_export_file_task(export_id: int, company_id: int) -> None:
+    """
+    Streams the orders selected by the export's spec into a temporary file
+    in the export's format, chunk by chunk, and saves it on the export.
+    Exports of more than ORDER_EXPORT_SHARD_SIZE orders are split into
+    shards written in parallel, see generate_export_shard_task. Runs outside
+    a transaction: a long export must not hold one open, and a failure must
+    still be recorded on the export.
+    """
+    export = get_export_for_company(pk=export_id, company_pk=company_id)
+
+    try:
+        orders = get_export_orders(company=export.company, spec=export.spec)
+        ranges = plan_export_shards(
+            orders,
+            shard_size=settings.ORDER_EXPORT_SHARD_SIZE,
+        )
+        if len(ranges) > 1:
+            shards = create_export_shards_service(export=export, ranges=ranges)
+            chord(
+                generate_export_shard_task.si(shard.pk, company_id) for shard in shards
+            )(finish_sharded_export_task.si(export_id, company_id))
+            logger.info(
+                "Export ID: %d split into %d shards",
+                export_id,
+                len(shards),
             )
+            return
+
+        row_count = 0
 
-        # Create a Django ContentFile from the buffer's content
-        file_content = ContentFile(string_io.getvalue().encode("utf-8"))
+        def write(file: IO[bytes]) -> None:
+            nonlocal row_count
+            row_count = write_export(
+                iter_export_rows(orders, company=export.company),
+                file,
+                export_format=export.format,
+            )
 
-        # Save the file to the Export object's FileField
-        export.file.save(f"export_{export_id}.csv", file_content)
+        export.byte_size = _save_export_file(
+            export.file,
+            f"export_{export_id}.{export.format}",
+            write,
+        )
+        export.row_count = row_count
 
         # Mark the export as ready
         export.status = Export.Status.READY
@@ -100,7 +383,97 @@ def generate_export_file_task(
     except Exception:
         # If anything goes wrong, mark the export as failed
         logger.exception("Export failed for Export ID: %d. ", export.pk)
-        if "export" in locals():
-            export.status = Export.Status.FAILED
-            export.save()
+        _fail_export(export)
+        raise
+
+
+@shared_task
+def generate_export_shard_task(shard_id: int, company_id: int) -> int:
+    """
+    Writes the orders of one shard of an export to its part file. Returns
+    the number of orders written.
+    """
+    company = get_company(pk=company_id)
+    shard = (
+        ExportShard.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+        .select_related("export")
+        .get(pk=shard_id)
+    )
+    export = shard.export
+
+    try:
+        orders = get_export_orders(company=company, spec=export.spec).filter(
+            pk__gte=shard.first_pk,
+            pk__lte=shard.last_pk,
+        )
+
+        def write(file: IO[bytes]) -> None:
+            shard.row_count = write_export(
+                iter_export_rows(orders, company=company),
+                file,
+                export_format=export.format,
+                # The parts are concatenated, only the first has a header
+                header=shard.index == 0,
+            )
+
+        _save_export_file(
+            shard.file,
+            f"export_{export.pk}_{shard.index}.{export.format}",
+            write,
+        )
+        shard.status = Export.Status.READY
+        shard.save(update_fields=["status", "row_count", "file"])
+
+    except Exception:
+        # The chord's callback never runs if a shard fails
+        logger.exception("Export failed for Export ID: %d. ", export.pk)
+        ExportShard.objects.for_tenant(company).filter(pk=shard_id).update(  # pyright: ignore[reportAttributeAccessIssue]
+            status=Export.Status.FAILED,
+        )
+        _fail_export(export)
         raise
+
+    return shard.row_count
+
+
+@shared_task
+def finish_sharded_export_task(export_id: int, company_id: int) -> None:
+    """
+    Chord callback of a sharded export: merges the part files of its shards,
+    in order, into the export's file, marks it READY and deletes the parts.
+    """
+    export = get_export_for_company(pk=export_id, company_pk=company_id)
+
+    try:
+        shards = list(
+            ExportShard.objects.for_tenant(export.company)  # pyright: ignore[reportAttributeAccessIssue]
+            .filter(export=export)
+            .order_by("index"),
+        )
+
+        def open_parts() -> Iterator[IO[bytes]]:
+            for shard in shards:
+                with shard.file.open("rb") as part:
+                    yield part
+
+        export.byte_size = _save_export_file(
+            export.file,
+            f"export_{export_id}.{export.format}",
+            lambda file: merge_export_parts(
+                open_parts(),
+                file,
+                export_format=export.format,
+            ),
+        )
+        export.row_count = sum(shard.row_count for shard in shards)
+        export.status = Export.Status.READY
+        export.save()
+
+    except Exception:
+        logger.exception("Export failed for Export ID: %d. ", export.pk)
+        _fail_export(export)
+        raise
+
+    for shard in shards:
+        shard.file.delete()
+    logger.info("Successfully completed export for Export ID: %d", export_id)
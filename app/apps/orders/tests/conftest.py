@@ -1,5 +1,6 @@
 import pytest
 from core.thread_locals import delete_current_tenant, set_current_tenant
+from django.core.cache import cache
 from django.core.files.base import ContentFile
 from rest_framework.test import APIClient
 
@@ -16,6 +17,14 @@ from ..models import Export, Order
 from ..services import create_order_service
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Rate limit buckets must not leak from one test into another."""
+    cache.clear()
+    yield
+    cache.clear()
+
+
 @pytest.fixture
 def company() -> Company:
     return create_company(name="test company", domain="test")
@@ -56,16 +65,14 @@ def setup_current_tenant(company):
 
 
 @pytest.fixture
-def test_data(company, product, user_profile, mocker, setup_current_tenant):
+def test_data(company, product, user_profile, setup_current_tenant):
     """Fixture to create a company, user, and some orders."""
-    mock_process_task = mocker.patch("apps.orders.tasks.process_order_task.delay")
-
     # Create a few orders for the export
     for _ in range(5):
         create_order_service(
             created_by=user_profile,
             company=company,
-            quantity=30,
+            quantity=20,
             product=product,
         )
 
@@ -0,0 +1,51 @@
+import pytest
+
+from ..admission import AdmissionDeniedError, TokenBucket, admit_orders
+
+
+@pytest.fixture
+def clock(mocker):
+    return mocker.patch("apps.orders.admission.time.time", return_value=1000.0)
+
+
+def test_token_bucket_refills_at_rate(clock):
+    bucket = TokenBucket("test-bucket", rate=2.0, capacity=4)
+
+    assert bucket.take(3) == 0
+    assert bucket.take(3) == pytest.approx(1.0)
+
+    clock.return_value += 1
+    assert bucket.take(3) == 0
+    # Never refilled above capacity
+    clock.return_value += 60
+    assert bucket.take(4) == 0
+    assert bucket.take(1) == pytest.approx(0.5)
+
+
+def test_token_bucket_large_request_needs_full_bucket(clock):
+    bucket = TokenBucket("test-bucket", rate=1.0, capacity=5)
+
+    assert bucket.take(50) == 0
+    assert bucket.take(50) == pytest.approx(5.0)
+
+
+@pytest.mark.django_db
+def test_admit_orders_gives_back_tenant_tokens_when_user_is_limited(
+    company,
+    settings,
+    clock,
+):
+    settings.ORDER_RATE_LIMITS = {
+        "TENANT": {"RATE": 1.0, "BURST": 3},
+        "USER": {"RATE": 1.0, "BURST": 2},
+    }
+
+    admit_orders(company=company, user_id=1, count=2)
+    with pytest.raises(AdmissionDeniedError, match="too fast") as denied:
+        admit_orders(company=company, user_id=1)
+    assert denied.value.retry_after == 1
+
+    # The tenant bucket still holds the token the first user was refused
+    admit_orders(company=company, user_id=2)
+    with pytest.raises(AdmissionDeniedError, match="too fast"):
+        admit_orders(company=company, user_id=3)
@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+import pytest
+
+from ..allocation import AllocationPolicy, allocate_stock
+
+
+def test_allocate_stock_fifo_skips_orders_that_do_not_fit():
+    filled = allocate_stock([4, 7, 3, 2, 5], 10)
+
+    # The 7 does not fit after the 4, the 3 and the 2 still do
+    assert filled.tolist() == [True, False, True, True, False]
+
+
+def test_allocate_stock_max_orders_fills_smallest_first():
+    filled = allocate_stock([8, 3, 3, 2, 6], 9, policy=AllocationPolicy.MAX_ORDERS)
+
+    assert filled.tolist() == [False, True, True, True, False]
+
+
+def test_allocate_stock_edge_cases():
+    assert allocate_stock([], 10).tolist() == []
+    assert allocate_stock([3, 4], 0).tolist() == [False, False]
+    assert allocate_stock([11, 0, 10], 10).tolist() == [False, False, True]
+
+
+@pytest.mark.parametrize("policy", list(AllocationPolicy))
+def test_allocate_stock_matches_sequential_greedy(policy):
+    rng = np.random.default_rng(3)
+    quantities = rng.integers(1, 50, size=500)
+    available = 3000
+
+    if policy == AllocationPolicy.MAX_ORDERS:
+        order = sorted(range(500), key=lambda i: (quantities[i], i))
+    else:
+        order = list(range(500))
+    expected = [False] * 500
+    left = available
+    for i in order:
+        if quantities[i] <= left:
+            left -= quantities[i]
+            expected[i] = True
+
+    filled = allocate_stock(quantities, available, policy=policy)
+    assert filled.tolist() == expected
+    assert quantities[filled].sum() <= available
+
+
+def test_allocate_stock_is_fast_on_large_batches():
+    rng = np.random.default_rng(11)
+    quantities = rng.integers(1, 100, size=100_000)
+
+    for policy in AllocationPolicy:
+        started = time.perf_counter()
+        allocate_stock(quantities, 2_000_000, policy=policy)
+        # Milliseconds in practice; the bound only catches a Python loop
+        assert time.perf_counter() - started < 0.5
+
+
+def test_allocate_stock_is_linear_on_adversarial_orders():
+    # Ones between orders one unit too large for what the ones left: each
+    # prefix pass would fill a single order
+    quantities = np.ones(100_000, dtype=np.int64)
+    quantities[1::2] = np.arange(50_000, 0, -1)
+
+    started = time.perf_counter()
+    filled = allocate_stock(quantities, 50_000)
+
+    assert time.perf_counter() - started < 0.5
+    assert filled.tolist() == [True, False] * 50_000
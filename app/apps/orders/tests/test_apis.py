@@ -1,8 +1,14 @@
+import uuid
+
 import pytest
 from core.thread_locals import delete_current_tenant, set_current_tenant
 
-from apps.orders.models import Order
-from apps.orders.services import create_order_service
+from apps.orders.models import Order, OutboxMessage
+from apps.orders.services import bulk_create_orders_service, create_order_service
+from apps.products.services import (
+    adjust_product_stock_service,
+    create_product_service,
+)
 
 from ..models import Export
 
@@ -16,20 +22,15 @@ class TestOrderAPI:
         admin_profile,
         product,
         company,
-        mocker,
         setup_current_tenant,
     ):
-        mock_process_task = mocker.patch(
-            "apps.orders.tasks.process_order_task.delay",
-        )
         # Arrange: Operator creates one order, admin creates another
-        order1 = create_order_service(
+        create_order_service(
             product=product,
             quantity=1,
             created_by=operator_profile,
             company=company,
         )
-        mock_process_task.assert_called_once_with(order1.pk, company_id=company.pk)
 
         create_order_service(
             product=product,
@@ -55,12 +56,8 @@ class TestOrderAPI:
         admin_profile,
         product,
         company,
-        mocker,
         setup_current_tenant,
     ):
-        mocker.patch(
-            "apps.orders.tasks.process_order_task.delay",
-        )
         # Arrange: Operator and admin both create orders
         create_order_service(
             product=product,
@@ -103,6 +100,67 @@ class TestOrderAPI:
         assert response.status_code == 201  # 201 Created
         mock_create_service.assert_called_once()
 
+    def test_create_order_without_stock_is_rejected(
+        self,
+        api_client,
+        operator_profile,
+        product,
+        setup_current_tenant,
+    ):
+        api_client.force_authenticate(user=operator_profile.user)
+        order_data = {"product": product.pk, "quantity": product.stock_quantity + 1}
+
+        response = api_client.post("/api/orders/", data=order_data)
+
+        assert response.status_code == 400
+        assert "Cannot reserve" in response.data["error"]
+        assert not Order.objects.exists()
+        assert not OutboxMessage.objects.exists()
+
+    def test_create_multi_line_order(
+        self,
+        api_client,
+        operator_profile,
+        product,
+        company,
+        setup_current_tenant,
+    ):
+        other = create_product_service(
+            company=company,
+            name="Other",
+            stock_quantity=5,
+        )
+        api_client.force_authenticate(user=operator_profile.user)
+        order_data = {
+            "lines": [
+                {"product": product.pk, "quantity": 10},
+                {"product": other.pk, "quantity": 5},
+            ],
+        }
+
+        response = api_client.post("/api/orders/", data=order_data, format="json")
+
+        assert response.status_code == 201
+        order = Order.objects.get()
+        assert order.has_lines
+        assert order.quantity == 15
+
+        response = api_client.get("/api/orders/")
+        assert response.data[0]["product_name"] is None
+        assert [
+            (line["product_name"], line["quantity"])
+            for line in response.data[0]["lines"]
+        ] == [("Test Product", 10), ("Other", 5)]
+
+        response = api_client.post(
+            "/api/orders/",
+            data={"lines": [{"product": other.pk, "quantity": 1}]},
+            format="json",
+        )
+        assert response.status_code == 400
+        assert "Other" in response.data["error"]
+        assert Order.objects.count() == 1
+
     def test_bulk_create_orders_success(
         self,
         api_client,
@@ -113,7 +171,10 @@ class TestOrderAPI:
     ):
         # Arrange
         api_client.force_authenticate(user=operator_profile.user)
-        mock_create_service = mocker.patch("apps.orders.views.create_order_service")
+        mock_bulk_service = mocker.patch(
+            "apps.orders.views.bulk_create_orders_service",
+            return_value=uuid.uuid4(),
+        )
         orders_data = [
             {"product": product.pk, "quantity": 5},
             {"product": product.pk, "quantity": 3},
@@ -128,7 +189,197 @@ class TestOrderAPI:
 
         # Assert
         assert response.status_code == 202  # 202 Accepted
-        assert mock_create_service.call_count == 2
+        assert response.data["batch_id"] == mock_bulk_service.return_value
+        mock_bulk_service.assert_called_once()
+        assert len(mock_bulk_service.call_args.kwargs["items"]) == 2
+
+    def test_create_order_rate_limited(
+        self,
+        api_client,
+        operator_profile,
+        product,
+        settings,
+        setup_current_tenant,
+    ):
+        settings.ORDER_RATE_LIMITS = {
+            "TENANT": {"RATE": 100.0, "BURST": 100},
+            "USER": {"RATE": 0.1, "BURST": 2},
+        }
+        api_client.force_authenticate(user=operator_profile.user)
+        order_data = {"product": product.pk, "quantity": 1}
+
+        statuses = [
+            api_client.post("/api/orders/", data=order_data).status_code
+            for _ in range(2)
+        ]
+        response = api_client.post("/api/orders/", data=order_data)
+
+        assert statuses == [201, 201]
+        assert response.status_code == 429
+        assert response["Retry-After"] == "10"
+        assert Order.objects.count() == 2
+
+    def test_bulk_create_rejected_when_backlog_is_full(
+        self,
+        api_client,
+        operator_profile,
+        product,
+        company,
+        settings,
+        setup_current_tenant,
+    ):
+        settings.ORDER_ADMISSION_MAX_BACKLOG = 2
+        settings.ORDER_ADMISSION_RETRY_AFTER = 15
+        bulk_create_orders_service(
+            items=[{"product": product, "quantity": 1} for _ in range(2)],
+            created_by=operator_profile,
+            company=company,
+        )
+        api_client.force_authenticate(user=operator_profile.user)
+
+        response = api_client.post(
+            "/api/orders/bulk-create/",
+            data=[{"product": product.pk, "quantity": 1}],
+            format="json",
+        )
+
+        assert response.status_code == 429
+        assert response["Retry-After"] == "15"
+        assert Order.objects.count() == 2
+
+    def test_repeated_create_with_idempotency_key_is_replayed(
+        self,
+        api_client,
+        operator_profile,
+        product,
+        setup_current_tenant,
+    ):
+        api_client.force_authenticate(user=operator_profile.user)
+        order_data = {"product": product.pk, "quantity": 3}
+
+        first = api_client.post(
+            "/api/orders/",
+            data=order_data,
+            HTTP_IDEMPOTENCY_KEY="create-1",
+        )
+        repeat = api_client.post(
+            "/api/orders/",
+            data=order_data,
+            HTTP_IDEMPOTENCY_KEY="create-1",
+        )
+
+        assert first.status_code == repeat.status_code == 201
+        assert repeat.data == first.data
+        assert repeat["Idempotent-Replayed"] == "true"
+        assert Order.objects.count() == 1
+        assert OutboxMessage.objects.count() == 1
+
+        reused = api_client.post(
+            "/api/orders/",
+            data={"product": product.pk, "quantity": 4},
+            HTTP_IDEMPOTENCY_KEY="create-1",
+        )
+        assert reused.status_code == 422
+        assert Order.objects.count() == 1
+
+    def test_repeated_bulk_create_with_idempotency_key_is_replayed(
+        self,
+        api_client,
+        operator_profile,
+        product,
+        setup_current_tenant,
+    ):
+        api_client.force_authenticate(user=operator_profile.user)
+        orders_data = [
+            {"product": product.pk, "quantity": 1},
+            {"product": product.pk, "quantity": 2},
+        ]
+
+        responses = [
+            api_client.post(
+                "/api/orders/bulk-create/",
+                data=orders_data,
+                format="json",
+                HTTP_IDEMPOTENCY_KEY="bulk-1",
+            )
+            for _ in range(2)
+        ]
+
+        assert [response.status_code for response in responses] == [202, 202]
+        assert str(responses[0].data["batch_id"]) == responses[1].data["batch_id"]
+        assert Order.objects.count() == 2
+        assert OutboxMessage.objects.count() == 1
+
+    def test_failed_request_does_not_keep_its_idempotency_key(
+        self,
+        api_client,
+        operator_profile,
+        product,
+        setup_current_tenant,
+        django_capture_on_commit_callbacks,
+    ):
+        api_client.force_authenticate(user=operator_profile.user)
+        orders_data = [{"product": product.pk, "quantity": 101}]
+
+        rejected = api_client.post(
+            "/api/orders/bulk-create/",
+            data=orders_data,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="bulk-2",
+        )
+        with django_capture_on_commit_callbacks(execute=True):
+            adjust_product_stock_service(product=product, quantity_change=1)
+        accepted = api_client.post(
+            "/api/orders/bulk-create/",
+            data=orders_data,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="bulk-2",
+        )
+
+        assert rejected.status_code == 400
+        assert accepted.status_code == 202
+        assert "Idempotent-Replayed" not in accepted
+        assert Order.objects.count() == 1
+
+    def test_batch_status(
+        self,
+        api_client,
+        operator_profile,
+        product,
+        company,
+        setup_current_tenant,
+    ):
+        # Arrange
+        batch_id = bulk_create_orders_service(
+            items=[{"product": product, "quantity": 1} for _ in range(3)],
+            created_by=operator_profile,
+            company=company,
+        )
+        first_order = Order.objects.filter(batch_id=batch_id).first()
+        Order.objects.filter(pk=first_order.pk).update(status=Order.Status.APPROVED)
+        api_client.force_authenticate(user=operator_profile.user)
+
+        # Act
+        response = api_client.get(f"/api/orders/batches/{batch_id}/")
+
+        # Assert
+        assert response.status_code == 200
+        assert response.data["total"] == 3
+        assert response.data["pending"] == 2
+        assert response.data["approved"] == 1
+        assert response.data["failed"] == 0
+
+    def test_batch_status_unknown_batch(
+        self,
+        api_client,
+        operator_profile,
+        setup_current_tenant,
+    ):
+        api_client.force_authenticate(user=operator_profile.user)
+
+        response = api_client.get(f"/api/orders/batches/{uuid.uuid4()}/")
+
+        assert response.status_code == 404
 
     def test_retry_order_success(
         self,
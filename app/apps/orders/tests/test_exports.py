@@ -0,0 +1,280 @@
+import csv
+import datetime as dt
+import gzip
+import io
+import json
+import tempfile
+import tracemalloc
+
+import pyarrow.parquet as pq
+import pytest
+import zstandard
+from core.celery import app as celery_app
+from django.contrib.admin import site
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.products.services import create_product_service
+
+from ..admin import OrderAdmin
+from ..exports import (
+    available_export_formats,
+    iter_export_rows,
+    plan_export_shards,
+    write_export,
+)
+from ..models import Export, ExportShard, Order
+from ..selectors import get_export_orders
+from ..services import create_multi_line_order_service, start_export_service
+from ..tasks import generate_export_file_task
+
+
+@pytest.mark.django_db
+def test_export_rows_list_the_skus_of_multi_line_orders(
+    test_data,
+    company,
+    product,
+    user_profile,
+    django_assert_num_queries,
+):
+    first, second = (
+        create_product_service(company=company, name=name, stock_quantity=10)
+        for name in ("First", "Second")
+    )
+    order = create_multi_line_order_service(
+        lines=[{"product": second, "quantity": 1}, {"product": first, "quantity": 2}],
+        created_by=user_profile,
+        company=company,
+    )
+    orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+
+    # One query for the orders, one for the lines of the only chunk with a
+    # multi-line order
+    with django_assert_num_queries(2):
+        rows = list(iter_export_rows(orders, company=company, chunk_size=4))
+
+    assert len(rows) == 6
+    assert rows[-1][0] == str(order.reference_code)
+    # Lines in product order
+    assert rows[-1][1] == f"{first.sku};{second.sku}"
+    assert rows[-1][2:4] == (3, "Pending")
+    assert rows[0][1] == str(product.sku)
+
+
+def _read_export(content: bytes, export_format: str) -> list[list[str]]:
+    """The reference code and status of every exported order."""
+    if export_format == Export.Format.PARQUET:
+        table = pq.read_table(io.BytesIO(content), columns=["reference_code", "status"])
+        return [list(record.values()) for record in table.to_pylist()]
+    if export_format == Export.Format.NDJSON:
+        records = [json.loads(line) for line in content.splitlines()]
+        return [[record["reference_code"], record["status"]] for record in records]
+    if export_format == Export.Format.CSV_GZIP:
+        content = gzip.decompress(content)
+    elif export_format == Export.Format.CSV_ZSTD:
+        content = zstandard.ZstdDecompressor().stream_reader(content).read()
+    rows = list(csv.reader(io.StringIO(content.decode())))
+    assert rows[0][0] == "Reference Code"
+    return [[row[0], row[3]] for row in rows[1:]]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("export_format", list(Export.Format))
+def test_write_export_formats(test_data, company, export_format):
+    orders = Order.objects.for_tenant(company).order_by("pk")  # pyright: ignore[reportAttributeAccessIssue]
+    file = io.BytesIO()
+
+    count = write_export(
+        iter_export_rows(orders, company=company, chunk_size=2),
+        file,
+        export_format=export_format,
+        chunk_size=2,
+    )
+
+    assert count == 5
+    if export_format == Export.Format.PARQUET:
+        # A row group per chunk
+        assert pq.ParquetFile(io.BytesIO(file.getvalue())).num_row_groups == 3
+    assert _read_export(file.getvalue(), export_format) == [
+        [str(order.reference_code), "Pending"] for order in orders
+    ]
+
+
+def _export_peak_memory(orders, company) -> int:
+    with tempfile.TemporaryFile() as file:
+        tracemalloc.start()
+        try:
+            write_export(iter_export_rows(orders, company=company), file)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+@pytest.mark.django_db
+def test_export_memory_does_not_grow_with_the_orders(
+    company,
+    product,
+    user_profile,
+    settings,
+):
+    settings.ORDER_EXPORT_CHUNK_SIZE = 100
+    orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+
+    def add_orders(count: int) -> None:
+        Order.objects.bulk_create(
+            Order(
+                company=company,
+                product=product,
+                quantity=1,
+                status=Order.Status.PENDING,
+                created_by=user_profile,
+            )
+            for _ in range(count)
+        )
+
+    add_orders(500)
+    small = _export_peak_memory(orders, company)
+    add_orders(4500)
+    large = _export_peak_memory(orders, company)
+
+    # Ten times the orders, about the same peak
+    assert large < small * 1.5
+
+
+@pytest.mark.django_db
+def test_export_orders_are_rebuilt_from_the_spec(
+    test_data,
+    company,
+    company_b,
+    product,
+    user_profile,
+):
+    first, *others = Order.objects.for_tenant(company).order_by("pk")  # pyright: ignore[reportAttributeAccessIssue]
+    Order.objects.filter(pk=first.pk).update(
+        status=Order.Status.APPROVED,
+        created_at=timezone.make_aware(dt.datetime(2024, 3, 5, 12)),  # noqa: DTZ001
+    )
+    admin = OrderAdmin(Order, site)
+    request = RequestFactory().get(
+        "/admin/orders/order/",
+        {"status__exact": "3", "created_at__year": "2024", "created_at__month": "3"},
+    )
+    spec = admin._export_filters(request)
+
+    assert spec == {
+        "status": Order.Status.APPROVED,
+        "created_from": "2024-03-01T00:00:00+00:00",
+        "created_to": "2024-04-01T00:00:00+00:00",
+    }
+    assert list(get_export_orders(company=company, spec=spec)) == [first]
+    assert not get_export_orders(company=company_b, spec=spec).exists()
+    ids = {"ids": [order.pk for order in others]}
+    assert set(get_export_orders(company=company, spec=ids)) == set(others)
+    # Every word must match one of the search fields
+    reference = str(first.reference_code)
+    search = {"search": f"{reference[:8]} '{product.name}'"}
+    assert list(get_export_orders(company=company, spec=search)) == [first]
+    assert get_export_orders(company=company, spec={"search": "test"}).count() == 5
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("export_format", list(Export.Format))
+def test_large_exports_are_sharded_and_merged(
+    test_data,
+    company,
+    settings,
+    tmp_path,
+    monkeypatch,
+    export_format,
+):
+    settings.MEDIA_ROOT = tmp_path
+    settings.ORDER_EXPORT_SHARD_SIZE = 2
+    # Runs the chord's shards and callback in the test
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    export = Export.objects.create(company=company, format=export_format)
+
+    generate_export_file_task(export_id=export.pk, company_id=company.pk)
+
+    export.refresh_from_db()
+    shards = ExportShard.objects.for_tenant(company).order_by("index")  # pyright: ignore[reportAttributeAccessIssue]
+    assert [(shard.status, shard.row_count) for shard in shards] == [
+        (Export.Status.READY, 2),
+        (Export.Status.READY, 2),
+        (Export.Status.READY, 1),
+    ]
+    # The parts are deleted once merged
+    assert not any(shard.file for shard in shards)
+    assert not list((tmp_path / "exports" / "parts").iterdir())
+    assert export.status == Export.Status.READY
+    assert export.row_count == 5
+    assert export.file.name.endswith(f"export_{export.pk}.{export_format}")
+    with export.file.open("rb") as f:
+        content = f.read()
+    assert export.byte_size == len(content)
+    orders = Order.objects.for_tenant(company).order_by("pk")  # pyright: ignore[reportAttributeAccessIssue]
+    assert _read_export(content, export_format) == [
+        [str(order.reference_code), "Pending"] for order in orders
+    ]
+
+
+@pytest.mark.django_db
+def test_export_shards_are_planned_with_a_query_per_shard(test_data, company):
+    pks = test_data["order_ids"]
+    orders = Order.objects.for_tenant(company).exclude(pk=pks[1])  # pyright: ignore[reportAttributeAccessIssue]
+
+    with CaptureQueriesContext(connection) as queries:
+        ranges = plan_export_shards(orders, shard_size=2)
+
+    # The bounds, then one boundary query per shard
+    assert len(queries) == 3
+    assert ranges == [(pks[0], pks[2]), (pks[3], pks[4])]
+    assert plan_export_shards(orders, shard_size=10) == [(pks[0], pks[4])]
+    assert plan_export_shards(orders.none(), shard_size=2) == []
+
+
+@pytest.mark.django_db
+def test_a_failed_shard_fails_the_export(
+    test_data,
+    company,
+    settings,
+    tmp_path,
+    monkeypatch,
+    mocker,
+):
+    settings.MEDIA_ROOT = tmp_path
+    settings.ORDER_EXPORT_SHARD_SIZE = 2
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    mocker.patch(
+        "apps.orders.tasks.iter_export_rows",
+        side_effect=[ValueError("boom"), [], []],
+    )
+    export = Export.objects.create(company=company)
+
+    with pytest.raises(ValueError, match="boom"):
+        generate_export_file_task(export_id=export.pk, company_id=company.pk)
+
+    export.refresh_from_db()
+    shards = ExportShard.objects.for_tenant(company).order_by("index")  # pyright: ignore[reportAttributeAccessIssue]
+    assert shards[0].status == Export.Status.FAILED
+    assert export.status == Export.Status.FAILED
+    assert not export.file
+
+
+@pytest.mark.django_db
+def test_formats_without_their_backend_are_not_offered(company, mocker):
+    find_spec = mocker.patch("apps.orders.exports.importlib.util.find_spec")
+    find_spec.side_effect = lambda name: None if name == "pyarrow" else mocker.ANY
+
+    formats = dict(available_export_formats())
+
+    assert Export.Format.PARQUET not in formats
+    assert Export.Format.CSV_ZSTD in formats
+    with pytest.raises(ValueError, match="Parquet"):
+        start_export_service(
+            company=company,
+            spec={},
+            export_format=Export.Format.PARQUET,
+        )
+    assert not Export.objects.for_tenant(company).exists()  # pyright: ignore[reportAttributeAccessIssue]
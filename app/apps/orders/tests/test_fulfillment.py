@@ -0,0 +1,237 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+
+from ..fulfillment import (
+    AsyncFulfillmentGateway,
+    CircuitBreaker,
+    CircuitOpenError,
+    FakeFulfillmentBackend,
+    FulfillmentError,
+    FulfillmentRequest,
+    FulfillmentTimeoutError,
+)
+
+
+def make_requests(count):
+    return [
+        FulfillmentRequest(
+            order_id=index,
+            reference_code=uuid.uuid4(),
+            product_id=1,
+            quantity=1,
+        )
+        for index in range(count)
+    ]
+
+
+def make_gateway(backend, *, max_concurrency=100, timeout=5.0, threshold=5):
+    return AsyncFulfillmentGateway(
+        backend=backend,
+        max_concurrency=max_concurrency,
+        timeout=timeout,
+        circuit_breaker=CircuitBreaker(
+            failure_threshold=threshold,
+            reset_timeout=30,
+        ),
+    )
+
+
+class CountingBackend:
+    """Records how many calls are in flight at the same time."""
+
+    def __init__(self, latency=0.01):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def fulfill(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.latency)
+        self.in_flight -= 1
+
+
+class ThreadSafeCountingBackend(CountingBackend):
+    """Counts the calls in flight across threads, each with its own loop."""
+
+    def __init__(self, latency=0.01):
+        super().__init__(latency)
+        self.lock = threading.Lock()
+
+    async def fulfill(self, request):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.latency)
+        with self.lock:
+            self.in_flight -= 1
+
+
+class FailingBackend:
+    def __init__(self):
+        self.calls = 0
+
+    async def fulfill(self, request):
+        self.calls += 1
+        msg = "connection refused"
+        raise ConnectionError(msg)
+
+
+def test_gateway_runs_calls_concurrently():
+    backend = FakeFulfillmentBackend(
+        latency="uniform",
+        latency_options={"low": 0.05, "high": 0.1},
+        seed=1,
+    )
+    gateway = make_gateway(backend, max_concurrency=500)
+
+    started = time.perf_counter()
+    errors = gateway.fulfill_many_sync(make_requests(500))
+    elapsed = time.perf_counter() - started
+
+    assert errors == [None] * 500
+    # 500 sequential calls would take at least 25 seconds
+    assert elapsed < 2
+
+
+def test_gateway_respects_concurrency_limit():
+    backend = CountingBackend()
+    gateway = make_gateway(backend, max_concurrency=7)
+
+    gateway.fulfill_many_sync(make_requests(50))
+
+    assert backend.max_in_flight == 7
+
+
+def test_gateway_concurrency_limit_spans_concurrent_batches():
+    backend = ThreadSafeCountingBackend()
+    gateway = make_gateway(backend, max_concurrency=5)
+    results = []
+
+    def run_batch():
+        results.append(gateway.fulfill_many_sync(make_requests(20)))
+
+    threads = [threading.Thread(target=run_batch) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [[None] * 20] * 3
+    assert backend.max_in_flight == 5
+    assert gateway.limiter.in_use == 0
+
+
+def test_gateway_times_out_slow_calls():
+    backend = FakeFulfillmentBackend(latency_options={"seconds": 1})
+    gateway = make_gateway(backend, timeout=0.01)
+
+    [error] = gateway.fulfill_many_sync(make_requests(1))
+
+    assert isinstance(error, FulfillmentTimeoutError)
+
+
+def test_gateway_wraps_backend_errors():
+    gateway = make_gateway(FailingBackend())
+
+    with pytest.raises(FulfillmentError, match="connection refused"):
+        gateway.fulfill_sync(make_requests(1)[0])
+
+
+def test_circuit_breaker_stops_calling_failing_backend():
+    backend = FailingBackend()
+    gateway = make_gateway(backend, max_concurrency=1, threshold=3)
+
+    errors = gateway.fulfill_many_sync(make_requests(10))
+
+    assert backend.calls == 3
+    assert all(isinstance(error, CircuitOpenError) for error in errors[3:])
+
+
+def test_circuit_breaker_half_opens_after_reset_timeout():
+    now = [0.0]
+    breaker = CircuitBreaker(
+        failure_threshold=2,
+        reset_timeout=10,
+        clock=lambda: now[0],
+    )
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    now[0] = 10
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    # Only one trial call is let through
+    assert not breaker.allow_request()
+
+    # A failed trial call re-opens the circuit straight away
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 20
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_circuit_breaker_replaces_a_lost_trial_call():
+    now = [0.0]
+    breaker = CircuitBreaker(
+        failure_threshold=1,
+        reset_timeout=10,
+        clock=lambda: now[0],
+    )
+    breaker.record_failure()
+
+    now[0] = 10
+    assert breaker.allow_request()
+    now[0] = 19
+    assert not breaker.allow_request()
+    now[0] = 20
+    assert breaker.allow_request()
+
+
+def test_half_open_circuit_sends_one_trial_call():
+    now = [0.0]
+    backend = CountingBackend()
+    gateway = AsyncFulfillmentGateway(
+        backend=backend,
+        max_concurrency=100,
+        timeout=5.0,
+        circuit_breaker=CircuitBreaker(
+            failure_threshold=1,
+            reset_timeout=10,
+            clock=lambda: now[0],
+        ),
+    )
+    gateway.circuit_breaker.record_failure()
+    now[0] = 10
+
+    errors = gateway.fulfill_many_sync(make_requests(5))
+
+    assert backend.max_in_flight == 1
+    assert errors[0] is None
+    assert all(isinstance(error, CircuitOpenError) for error in errors[1:])
+    assert gateway.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_fake_backend_failure_rate():
+    backend = FakeFulfillmentBackend(
+        latency_options={"seconds": 0},
+        failure_rate=0.5,
+        seed=7,
+    )
+    gateway = make_gateway(backend, threshold=1000)
+
+    errors = gateway.fulfill_many_sync(make_requests(1000))
+
+    failures = sum(error is not None for error in errors)
+    assert 400 < failures < 600
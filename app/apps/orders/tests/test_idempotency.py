@@ -0,0 +1,83 @@
+import datetime as dt
+
+import pytest
+from django.utils import timezone
+
+from ..idempotency import (
+    IdempotencyKeyReusedError,
+    StoredResponse,
+    purge_expired_idempotency_keys,
+    request_fingerprint,
+    run_idempotently,
+)
+from ..models import IdempotencyKey
+
+
+def _fingerprint(data: dict) -> str:
+    return request_fingerprint(method="POST", path="/api/orders/", data=data)
+
+
+@pytest.mark.django_db
+def test_run_idempotently_replays_from_the_cache(
+    company,
+    django_capture_on_commit_callbacks,
+    django_assert_num_queries,
+):
+    calls = []
+
+    def create() -> StoredResponse:
+        calls.append(1)
+        return StoredResponse(201, {"quantity": 1})
+
+    fingerprint = _fingerprint({"quantity": 1})
+    with django_capture_on_commit_callbacks(execute=True):
+        first = run_idempotently(
+            company=company,
+            key="k",
+            fingerprint=fingerprint,
+            create=create,
+        )
+
+    with django_assert_num_queries(0):
+        repeat = run_idempotently(
+            company=company,
+            key="k",
+            fingerprint=fingerprint,
+            create=create,
+        )
+    assert first == (StoredResponse(201, {"quantity": 1}), False)
+    assert repeat == (StoredResponse(201, {"quantity": 1}), True)
+    assert calls == [1]
+    with pytest.raises(IdempotencyKeyReusedError):
+        run_idempotently(
+            company=company,
+            key="k",
+            fingerprint=_fingerprint({"quantity": 2}),
+            create=create,
+        )
+
+
+@pytest.mark.django_db
+def test_expired_keys_are_used_again_and_purged(company, company_b):
+    def create() -> StoredResponse:
+        return StoredResponse(201, {})
+
+    for tenant in (company, company_b):
+        run_idempotently(company=tenant, key="k", fingerprint="a", create=create)
+    IdempotencyKey.objects.for_tenant(company).update(  # pyright: ignore[reportAttributeAccessIssue]
+        expires_at=timezone.now() - dt.timedelta(seconds=1),
+    )
+
+    # Keys are per company, and an expired key runs the request again
+    assert run_idempotently(
+        company=company,
+        key="k",
+        fingerprint="b",
+        create=create,
+    ) == (StoredResponse(201, {}), False)
+    assert purge_expired_idempotency_keys() == 0
+
+    IdempotencyKey.objects.for_all_tenants().update(  # pyright: ignore[reportAttributeAccessIssue]
+        expires_at=timezone.now() - dt.timedelta(seconds=1),
+    )
+    assert purge_expired_idempotency_keys() == 2
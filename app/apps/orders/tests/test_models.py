@@ -0,0 +1,58 @@
+import pytest
+
+from ..models import Order
+
+
+@pytest.fixture
+def order(product, user_profile, company):
+    return Order.objects.create(
+        product=product,
+        quantity=1,
+        created_by=user_profile,
+        company=company,
+        status=Order.Status.PENDING,
+    )
+
+
+@pytest.mark.django_db
+def test_transition_to_moves_order_once(order):
+    # A stale copy, as held by a second worker
+    stale = Order.objects.for_tenant(order.company).get(pk=order.pk)  # pyright: ignore[reportAttributeAccessIssue]
+
+    assert order.transition_to(Order.Status.PROCESSING)
+    assert not stale.transition_to(Order.Status.PROCESSING)
+
+    assert order.transition_to(Order.Status.APPROVED, has_been_processed=True)
+    assert not stale.transition_to(Order.Status.APPROVED)
+    assert stale.status == Order.Status.PENDING
+
+    order.refresh_from_db()
+    assert order.status == Order.Status.APPROVED
+    assert order.has_been_processed is True
+
+
+@pytest.mark.django_db
+def test_transition_to_follows_state_machine(order):
+    assert not order.transition_to(Order.Status.PENDING)
+    assert order.transition_to(Order.Status.FAILED)
+    assert not order.transition_to(Order.Status.APPROVED)
+    assert order.transition_to(Order.Status.PENDING)
+
+    with pytest.raises(ValueError, match="cannot move"):
+        order.transition_to(
+            Order.Status.PROCESSING,
+            from_statuses=[Order.Status.FAILED],
+        )
+
+
+@pytest.mark.django_db
+def test_transition_to_writes_only_given_fields(order, django_assert_num_queries):
+    order.quantity = 99
+
+    with django_assert_num_queries(1) as queries:
+        order.transition_to(Order.Status.PROCESSING)
+
+    sql = queries.captured_queries[0]["sql"]
+    assert '"quantity"' not in sql
+    order.refresh_from_db()
+    assert order.quantity == 1
@@ -0,0 +1,83 @@
+import datetime as dt
+
+import pytest
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import OutboxMessage
+from ..outbox import enqueue_task, publish_outbox_messages, relay_outbox_messages
+from ..tasks import process_order_task
+
+
+@pytest.fixture
+def mock_app(mocker):
+    return mocker.patch("apps.orders.outbox.current_app")
+
+
+@pytest.mark.django_db
+def test_enqueue_task_is_rolled_back_with_the_transaction(mock_app):
+    with transaction.atomic():
+        enqueue_task(process_order_task, args=(1,), kwargs={"company_id": 1})
+        transaction.set_rollback(True)
+
+    assert not OutboxMessage.objects.exists()
+    mock_app.send_task.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_enqueue_task_publishes_on_commit(mock_app, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        enqueue_task(process_order_task, args=(1,), kwargs={"company_id": 2})
+
+    # Nothing is sent before the commit
+    mock_app.send_task.assert_not_called()
+
+    for callback in callbacks:
+        callback()
+
+    mock_app.send_task.assert_called_once_with(
+        "apps.orders.tasks.process_order_task",
+        args=[1],
+        kwargs={"company_id": 2},
+        queue=None,
+        producer=mock_app.producer_or_acquire.return_value.__enter__.return_value,
+    )
+    assert OutboxMessage.objects.get().published_at is not None
+
+
+@pytest.mark.django_db
+def test_relay_publishes_messages_the_fast_path_missed(
+    mock_app,
+    settings,
+    django_capture_on_commit_callbacks,
+):
+    settings.OUTBOX_RELAY_BATCH_SIZE = 2
+    mock_app.send_task.side_effect = ConnectionError("broker unavailable")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        for order_id in range(5):
+            enqueue_task(process_order_task, args=(order_id,))
+
+    assert OutboxMessage.objects.filter(published_at__isnull=True).count() == 5
+
+    mock_app.send_task.side_effect = None
+    assert relay_outbox_messages() == 5
+    # Five failed fast-path attempts, then the relay's batches of 2, 2 and 1
+    assert mock_app.producer_or_acquire.call_count == 5 + 3
+    assert publish_outbox_messages() == 0
+
+
+@pytest.mark.django_db
+def test_relay_deletes_old_published_messages(mock_app, settings):
+    settings.OUTBOX_RETENTION_SECONDS = 60
+    now = timezone.now()
+    OutboxMessage.objects.bulk_create(
+        [
+            OutboxMessage(task="t", published_at=now - dt.timedelta(seconds=61)),
+            OutboxMessage(task="t", published_at=now),
+        ],
+    )
+
+    relay_outbox_messages()
+
+    assert OutboxMessage.objects.count() == 1
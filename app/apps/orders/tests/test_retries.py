@@ -0,0 +1,15 @@
+import random
+
+from ..retries import retry_delay_seconds
+
+
+def test_retry_delay_grows_exponentially_with_jitter(settings):
+    settings.ORDER_RETRY_BACKOFF_SECONDS = 10.0
+    settings.ORDER_RETRY_BACKOFF_MAX_SECONDS = 60.0
+    rng = random.Random(1)
+
+    delays = [retry_delay_seconds(attempt, rng=rng) for attempt in (1, 2, 3, 4, 5)]
+
+    for delay, ceiling in zip(delays, (10, 20, 40, 60, 60), strict=True):
+        assert ceiling / 2 <= delay <= ceiling
+    assert delays[3] != delays[4]
@@ -0,0 +1,65 @@
+import pytest
+
+from apps.products.services import create_product_service
+
+from ..serializers import OrderCreateSerializer
+
+
+@pytest.fixture
+def products(company):
+    return [
+        create_product_service(company=company, name=f"Product {i}", stock_quantity=10)
+        for i in range(20)
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("lines", [10, 1000])
+def test_bulk_payload_validates_in_constant_queries(
+    products,
+    setup_current_tenant,
+    django_assert_num_queries,
+    lines,
+):
+    payload = [
+        {"product": products[i % len(products)].pk, "quantity": 1} for i in range(lines)
+    ]
+    serializer = OrderCreateSerializer(data=payload, many=True)
+
+    with django_assert_num_queries(1):
+        assert serializer.is_valid(), serializer.errors
+
+    assert serializer.validated_data[0]["product"] == products[0]
+    assert serializer.validated_data[-1]["product"] == products[(lines - 1) % 20]
+
+
+@pytest.mark.django_db
+def test_bulk_payload_keeps_validation_errors(
+    products,
+    company_b,
+    setup_current_tenant,
+):
+    other_tenant_product = create_product_service(
+        company=company_b,
+        name="Other tenant",
+        stock_quantity=10,
+    )
+    payload = [
+        {"product": products[0].pk, "quantity": 1},
+        {"product": other_tenant_product.pk, "quantity": 1},
+        {"product": "abc", "quantity": 1},
+        {"product": True, "quantity": 1},
+    ]
+    single = OrderCreateSerializer(data=payload[1])
+    serializer = OrderCreateSerializer(data=payload, many=True)
+
+    assert not single.is_valid()
+    assert not serializer.is_valid()
+
+    errors = serializer.errors
+    assert errors[0] == {}
+    # Products of other tenants are hidden by the TenantManager
+    assert errors[1]["product"] == single.errors["product"]
+    assert errors[1]["product"][0].code == "does_not_exist"
+    assert errors[2]["product"][0].code == "incorrect_type"
+    assert errors[3]["product"][0].code == "incorrect_type"
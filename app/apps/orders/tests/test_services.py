@@ -1,7 +1,44 @@
+import datetime as dt
+from itertools import chain
+
 import pytest
+from django.contrib.admin import site
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.orders import services
+from apps.products.models import InventoryMovement, Product
+from apps.products.services import (
+    adjust_product_stock_service,
+    create_product_service,
+    deactivate_products_service,
+    set_product_stock_shards_service,
+    update_product_service,
+)
 
-from ..models import Order
-from ..services import approve_order_service, create_order_service, retry_order_service
+from ..admin import OrderAdmin
+from ..models import BulkOrderAction, Order, OrderLine, OutboxMessage
+from ..services import (
+    allocate_product_stock_service,
+    approve_order_service,
+    approve_orders_batch_service,
+    approve_orders_service,
+    bulk_create_orders_service,
+    claim_pending_orders_service,
+    create_multi_line_order_service,
+    create_order_service,
+    fail_orders_service,
+    fill_backorders_service,
+    reap_stuck_orders_service,
+    retry_order_service,
+    retry_orders_later_service,
+    retry_orders_service,
+    run_bulk_order_action_service,
+    schedule_orders_service,
+    start_bulk_order_action_service,
+)
 
 
 @pytest.mark.django_db
@@ -30,16 +67,36 @@ def test_approve_order_success_with_sufficient_stock(
 
 
 @pytest.mark.django_db
-def test_create_order_service(
+def test_approve_order_fails_with_insufficient_stock(
     product,
     user_profile,
     company,
-    mocker,
     setup_current_tenant,
 ):
-    # 1. Arrange: Patch the Celery task so we can check if it was called
-    mock_process_task = mocker.patch("apps.orders.tasks.process_order_task.delay")
+    order = Order.objects.create(
+        product=product,
+        quantity=product.stock_quantity + 1,
+        created_by=user_profile,
+        company=company,
+        status=Order.Status.PROCESSING,
+    )
+
+    approve_order_service(order=order)
+
+    order.refresh_from_db()
+    product.refresh_from_db()
+    assert order.status == Order.Status.FAILED
+    assert order.has_been_processed is True
+    assert product.stock_quantity == 100
 
+
+@pytest.mark.django_db
+def test_create_order_service(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
     order_quantity = 5
 
     # 2. Act: Call the create service
@@ -59,8 +116,12 @@ def test_create_order_service(
     assert new_order.status == Order.Status.PENDING
     assert new_order.has_been_processed is False
 
-    # Assert that the background task was called exactly once with the new order's ID
-    mock_process_task.assert_called_once_with(new_order.pk, company_id=company.pk)
+    # Assert that the scheduler was woken once, leaving the order in the backlog
+    message = OutboxMessage.objects.get()
+    assert message.task == "apps.orders.tasks.schedule_orders_task"
+    assert message.args == []
+    assert message.published_at is None
+    assert new_order.dispatched_at is None
 
 
 @pytest.mark.django_db
@@ -68,11 +129,8 @@ def test_retry_order_service(
     product,
     user_profile,
     company,
-    mocker,
     setup_current_tenant,
 ):
-    mock_process_task = mocker.patch("apps.orders.tasks.process_order_task.delay")
-
     # 1. Arrange: Create an order that is already in a FAILED state
     order = create_order_service(
         product=product,
@@ -83,6 +141,7 @@ def test_retry_order_service(
 
     order.status = Order.Status.FAILED
     order.has_been_processed = True
+    order.dispatched_at = timezone.now()
     order.save()
 
     # 2. Act: Call the retry service
@@ -93,5 +152,1113 @@ def test_retry_order_service(
     assert retried_order.status == Order.Status.PENDING
     assert retried_order.has_been_processed is False
 
-    # Assert that the background task was re-queued
-    assert mock_process_task.call_count == 2
+    # Assert that the order is back in the scheduler's backlog; the run
+    # queued when it was created has not started yet and covers it
+    order.refresh_from_db()
+    assert order.dispatched_at is None
+    scheduler_runs = OutboxMessage.objects.filter(
+        task="apps.orders.tasks.schedule_orders_task",
+    )
+    assert scheduler_runs.count() == 1
+
+
+@pytest.mark.django_db
+def test_claim_pending_orders_service(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
+    orders = [
+        Order.objects.create(
+            product=product,
+            quantity=1,
+            created_by=user_profile,
+            company=company,
+            status=Order.Status.PENDING,
+        )
+        for _ in range(3)
+    ]
+
+    claimed = claim_pending_orders_service(company=company, limit=2)
+
+    assert [order.pk for order in claimed] == [orders[0].pk, orders[1].pk]
+    assert Order.objects.filter(status=Order.Status.PROCESSING).count() == 2
+    assert Order.objects.filter(status=Order.Status.PENDING).count() == 1
+
+
+@pytest.mark.django_db
+def test_approve_orders_batch_service_fifo(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
+    other_product = create_product_service(
+        company=company,
+        name="Other Product",
+        stock_quantity=5,
+    )
+    # product has 100 in stock: the first two fit, the third does not
+    quantities = [(product, 60), (product, 40), (product, 1), (other_product, 5)]
+    orders = [
+        Order.objects.create(
+            product=item,
+            quantity=quantity,
+            created_by=user_profile,
+            company=company,
+            status=Order.Status.PROCESSING,
+        )
+        for item, quantity in quantities
+    ]
+
+    result = approve_orders_batch_service(company=company, orders=orders)
+
+    assert sorted(result["approved"]) == [orders[0].pk, orders[1].pk, orders[3].pk]
+    assert result["failed"] == [orders[2].pk]
+
+    product.refresh_from_db()
+    other_product.refresh_from_db()
+    assert product.stock_quantity == 0
+    assert other_product.stock_quantity == 0
+
+    statuses = dict(Order.objects.values_list("pk", "status"))
+    assert statuses[orders[2].pk] == Order.Status.FAILED
+    assert Order.objects.filter(status=Order.Status.APPROVED).count() == 3
+    assert Order.objects.filter(has_been_processed=True).count() == 4
+
+    # One ledger entry per approved order, written in a single insert
+    ledger = InventoryMovement.objects.filter(
+        reason=InventoryMovement.Reason.ORDER_APPROVED,
+    ).order_by("pk")
+    assert list(ledger.values_list("reference", "quantity_change")) == [
+        (str(orders[0].reference_code), -60),
+        (str(orders[1].reference_code), -40),
+        (str(orders[3].reference_code), -5),
+    ]
+
+
+@pytest.mark.django_db
+def test_bulk_create_orders_service(
+    product,
+    user_profile,
+    company,
+    mocker,
+    settings,
+    setup_current_tenant,
+    django_capture_on_commit_callbacks,
+):
+    settings.ORDER_DISPATCH_CHUNK_SIZE = 2
+    mock_app = mocker.patch("apps.orders.outbox.current_app")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        batch_id = bulk_create_orders_service(
+            items=[{"product": product, "quantity": 1} for _ in range(5)],
+            created_by=user_profile,
+            company=company,
+        )
+
+    orders = Order.objects.filter(batch_id=batch_id)
+    assert orders.count() == 5
+    assert set(orders.values_list("status", flat=True)) == {Order.Status.PENDING}
+    mock_app.send_task.assert_called_once()
+    assert mock_app.send_task.call_args.args[0] == (
+        "apps.orders.tasks.schedule_orders_task"
+    )
+
+    mock_app.reset_mock()
+    with django_capture_on_commit_callbacks(execute=True):
+        assert schedule_orders_service() == {company.pk: 5}
+
+    # Five orders in chunks of two: three chunk tasks over one connection
+    mock_app.producer_or_acquire.assert_called_once()
+    sent = mock_app.send_task.call_args_list
+    assert {call.args[0] for call in sent} == {
+        "apps.orders.tasks.process_orders_chunk_task",
+    }
+    assert [len(call.kwargs["args"][0]) for call in sent] == [2, 2, 1]
+    assert not orders.filter(dispatched_at__isnull=True).exists()
+    assert not OutboxMessage.objects.filter(published_at__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_bulk_create_orders_service_rejects_invalid_quantity(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
+    with pytest.raises(ValueError, match="positive"):
+        bulk_create_orders_service(
+            items=[
+                {"product": product, "quantity": 1},
+                {"product": product, "quantity": 0},
+            ],
+            created_by=user_profile,
+            company=company,
+        )
+
+    assert Order.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_create_order_service_reserves_stock(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
+    order = create_order_service(
+        product=product,
+        quantity=60,
+        created_by=user_profile,
+        company=company,
+    )
+
+    product.refresh_from_db()
+    assert order.stock_reserved is True
+    assert product.stock_quantity == 100
+    assert product.reserved_quantity == 60
+
+    # Only 40 units are left unreserved, so this order is rejected right away
+    with pytest.raises(ValueError, match="only 40 are available"):
+        create_order_service(
+            product=product,
+            quantity=41,
+            created_by=user_profile,
+            company=company,
+        )
+    assert Order.objects.count() == 1
+    # The rejected order's outbox message was rolled back with it
+    assert OutboxMessage.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_reservation_is_committed_on_approval(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
+    order = create_order_service(
+        product=product,
+        quantity=60,
+        created_by=user_profile,
+        company=company,
+    )
+    order.status = Order.Status.PROCESSING
+
+    approve_order_service(order=order)
+
+    order.refresh_from_db()
+    product.refresh_from_db()
+    assert order.status == Order.Status.APPROVED
+    assert order.stock_reserved is False
+    assert product.stock_quantity == 40
+    assert product.reserved_quantity == 0
+
+
+@pytest.mark.django_db
+def test_reservation_is_released_on_failure_and_taken_on_retry(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
+    order = create_order_service(
+        product=product,
+        quantity=60,
+        created_by=user_profile,
+        company=company,
+    )
+    Order.objects.filter(pk=order.pk).update(status=Order.Status.PROCESSING)
+
+    fail_orders_service(company=company, order_ids=[order.pk])
+
+    order.refresh_from_db()
+    product.refresh_from_db()
+    assert order.status == Order.Status.FAILED
+    assert order.stock_reserved is False
+    assert product.reserved_quantity == 0
+
+    retry_order_service(order=order)
+
+    order.refresh_from_db()
+    product.refresh_from_db()
+    assert order.status == Order.Status.PENDING
+    assert order.stock_reserved is True
+    assert product.reserved_quantity == 60
+
+
+@pytest.mark.django_db
+def test_retry_order_service_without_stock(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
+    order = Order.objects.create(
+        product=product,
+        quantity=101,
+        created_by=user_profile,
+        company=company,
+        status=Order.Status.FAILED,
+    )
+
+    with pytest.raises(ValueError, match="Cannot reserve"):
+        retry_order_service(order=order)
+
+    order.refresh_from_db()
+    assert order.status == Order.Status.FAILED
+
+
+@pytest.mark.django_db
+def test_approve_order_service_never_approves_twice(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
+    order = Order.objects.create(
+        product=product,
+        quantity=10,
+        created_by=user_profile,
+        company=company,
+        status=Order.Status.PROCESSING,
+    )
+    stale = Order.objects.select_related("product").get(pk=order.pk)
+
+    assert approve_order_service(order=order) is True
+    assert approve_order_service(order=stale) is False
+
+    product.refresh_from_db()
+    assert product.stock_quantity == 90
+
+
+@pytest.mark.django_db
+def test_approve_orders_batch_service_locks_stock_shards(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
+    set_product_stock_shards_service(product=product, shard_count=4)
+    orders = [
+        Order.objects.create(
+            product=product,
+            quantity=quantity,
+            created_by=user_profile,
+            company=company,
+            status=Order.Status.PROCESSING,
+        )
+        for quantity in (60, 40, 1)
+    ]
+
+    with CaptureQueriesContext(connection) as queries:
+        result = approve_orders_batch_service(company=company, orders=orders)
+
+    assert result["approved"] == [orders[0].pk, orders[1].pk]
+    assert result["failed"] == [orders[2].pk]
+    product.refresh_from_db()
+    assert product.total_stock_quantity == 0
+
+    # The shards are locked before their available stock is read
+    sql = [query["sql"] for query in queries.captured_queries]
+    shard_lock = next(
+        index
+        for index, statement in enumerate(sql)
+        if statement.startswith("SELECT")
+        and '"products_productstockshard"."product_id" ASC' in statement
+    )
+    shard_read = next(
+        index
+        for index, statement in enumerate(sql)
+        if 'SUM("products_productstockshard"."stock_quantity")' in statement
+    )
+    assert shard_lock < shard_read
+
+
+@pytest.mark.django_db
+def test_approve_orders_batch_service_skips_orders_finished_elsewhere(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
+    orders = [
+        Order.objects.create(
+            product=product,
+            quantity=10,
+            created_by=user_profile,
+            company=company,
+            status=Order.Status.PROCESSING,
+        )
+        for _ in range(3)
+    ]
+    # Another worker approved the second order meanwhile
+    approve_order_service(order=Order.objects.get(pk=orders[1].pk))
+
+    result = approve_orders_batch_service(company=company, orders=orders)
+
+    assert sorted(result["approved"]) == [orders[0].pk, orders[2].pk]
+    product.refresh_from_db()
+    assert product.stock_quantity == 70
+    assert Order.objects.filter(status=Order.Status.APPROVED).count() == 3
+
+
+@pytest.mark.django_db
+def test_schedule_orders_service_shares_capacity_between_companies(
+    product,
+    user_profile,
+    company,
+    company_b,
+    settings,
+    django_capture_on_commit_callbacks,
+):
+    settings.ORDER_SCHEDULER_CAPACITY = 6
+    settings.ORDER_SCHEDULER_QUANTUM = 2
+    product_b = create_product_service(company=company_b, name="B", stock_quantity=10)
+    bulk_create_orders_service(
+        items=[{"product": product, "quantity": 1} for _ in range(20)],
+        created_by=user_profile,
+        company=company,
+    )
+    bulk_create_orders_service(
+        items=[{"product": product_b, "quantity": 1} for _ in range(2)],
+        created_by=user_profile,
+        company=company_b,
+    )
+
+    # The small backlog is served in full although it came last
+    assert schedule_orders_service() == {company.pk: 4, company_b.pk: 2}
+    # No capacity is left until dispatched orders finish
+    assert schedule_orders_service() == {}
+
+    Order.objects.for_tenant(company).filter(  # pyright: ignore[reportAttributeAccessIssue]
+        dispatched_at__isnull=False,
+    ).update(status=Order.Status.APPROVED)
+    assert schedule_orders_service() == {company.pk: 4}
+
+
+@pytest.mark.django_db
+def test_schedule_orders_service_honours_company_settings(
+    product,
+    user_profile,
+    company,
+    company_b,
+    settings,
+    mocker,
+    django_capture_on_commit_callbacks,
+):
+    settings.ORDER_SCHEDULER_CAPACITY = 1
+    company.max_orders_in_flight = 3
+    company.order_queue = "orders-large"
+    company.save()
+    product_b = create_product_service(company=company_b, name="B", stock_quantity=10)
+    for owner, owner_product in ((company, product), (company_b, product_b)):
+        bulk_create_orders_service(
+            items=[{"product": owner_product, "quantity": 1} for _ in range(5)],
+            created_by=user_profile,
+            company=owner,
+        )
+    mock_app = mocker.patch("apps.orders.outbox.current_app")
+
+    # The dedicated queue does not use the shared capacity, only its own cap
+    with django_capture_on_commit_callbacks(execute=True):
+        assert schedule_orders_service() == {company.pk: 3, company_b.pk: 1}
+
+    queues = {
+        call.kwargs["kwargs"]["company_id"]: call.kwargs["queue"]
+        for call in mock_app.send_task.call_args_list
+    }
+    assert queues == {company.pk: "orders-large", company_b.pk: None}
+
+
+@pytest.mark.django_db
+def test_retry_order_service_resets_dead_lettered_order(
+    product,
+    user_profile,
+    company,
+    setup_current_tenant,
+):
+    order = Order.objects.create(
+        product=product,
+        quantity=5,
+        created_by=user_profile,
+        company=company,
+        status=Order.Status.DEAD_LETTER,
+        attempts=5,
+        last_error="FulfillmentTimeoutError: took too long",
+    )
+
+    retry_order_service(order=order)
+
+    order.refresh_from_db()
+    assert order.status == Order.Status.PENDING
+    assert (order.attempts, order.retry_at, order.last_error) == (0, None, "")
+    assert order.stock_reserved
+
+
+def _failed_orders(*, product, user_profile, company, quantities):
+    return [
+        Order.objects.create(
+            product=product,
+            quantity=quantity,
+            created_by=user_profile,
+            company=company,
+            status=Order.Status.FAILED,
+            has_been_processed=True,
+        )
+        for quantity in quantities
+    ]
+
+
+@pytest.mark.django_db
+def test_retry_orders_service_reserves_once_per_product(
+    product,
+    user_profile,
+    company,
+    mocker,
+):
+    orders = _failed_orders(
+        product=product,
+        user_profile=user_profile,
+        company=company,
+        quantities=[40, 70, 50],
+    )
+    reserve = mocker.spy(services, "reserve_product_stock_service")
+
+    result = retry_orders_service(
+        company=company,
+        order_ids=[order.pk for order in orders],
+    )
+
+    # 100 in stock: the oldest orders that fit are retried, FIFO
+    assert result == {
+        "retried": [orders[0].pk, orders[2].pk],
+        "rejected": [orders[1].pk],
+    }
+    reserve.assert_called_once_with(product=product, quantity=90)
+    statuses = dict(
+        Order.objects.for_tenant(company).values_list("pk", "status"),  # pyright: ignore[reportAttributeAccessIssue]
+    )
+    assert statuses == {
+        orders[0].pk: Order.Status.PENDING,
+        orders[1].pk: Order.Status.FAILED,
+        orders[2].pk: Order.Status.PENDING,
+    }
+    scheduler_runs = OutboxMessage.objects.filter(
+        task="apps.orders.tasks.schedule_orders_task",
+    )
+    assert scheduler_runs.count() == 1
+
+
+@pytest.mark.django_db
+def test_approve_orders_service_skips_finished_orders(
+    product,
+    user_profile,
+    company,
+):
+    pending = create_order_service(
+        product=product,
+        quantity=30,
+        created_by=user_profile,
+        company=company,
+    )
+    (failed,) = _failed_orders(
+        product=product,
+        user_profile=user_profile,
+        company=company,
+        quantities=[10],
+    )
+
+    result = approve_orders_service(company=company, order_ids=[pending.pk, failed.pk])
+
+    assert result == {"approved": [pending.pk], "failed": [], "backordered": []}
+    product.refresh_from_db()
+    assert (product.stock_quantity, product.reserved_quantity) == (70, 0)
+
+
+@pytest.mark.django_db
+def test_admin_approval_skips_backordered_orders(
+    product,
+    user_profile,
+    company,
+    mocker,
+):
+    pending = create_order_service(
+        product=product,
+        quantity=100,
+        created_by=user_profile,
+        company=company,
+    )
+    product.backorders_enabled = True
+    product.save()
+    waiting = create_order_service(
+        product=product,
+        quantity=10,
+        created_by=user_profile,
+        company=company,
+    )
+    order_admin = OrderAdmin(Order, site)
+    message_user = mocker.patch.object(order_admin, "message_user")
+
+    order_admin.approve_selected_orders(
+        order_admin,
+        RequestFactory().post("/"),
+        Order.objects.for_tenant(company),  # pyright: ignore[reportAttributeAccessIssue]
+    )
+
+    pending.refresh_from_db()
+    waiting.refresh_from_db()
+    assert pending.status == Order.Status.APPROVED
+    assert waiting.status == Order.Status.BACKORDERED
+    messages = [call.args[1] for call in message_user.call_args_list]
+    assert messages[0].startswith("1 backordered orders were skipped")
+    assert messages[1].startswith("1 orders have been approved, 0 failed")
+
+
+@pytest.mark.django_db
+def test_bulk_order_action_runs_in_chunks_and_resumes(
+    product,
+    user_profile,
+    company,
+    settings,
+):
+    settings.ORDER_BATCH_SIZE = 2
+    orders = _failed_orders(
+        product=product,
+        user_profile=user_profile,
+        company=company,
+        quantities=[10, 10, 10, 10, 90],
+    )
+    bulk_action = start_bulk_order_action_service(
+        action=BulkOrderAction.Action.RETRY,
+        company=company,
+        order_ids=[order.pk for order in orders],
+        requested_by=user_profile,
+    )
+    message = OutboxMessage.objects.get(task__endswith="run_bulk_order_action_task")
+    assert message.args == [bulk_action.pk]
+
+    # A redelivered task picks up after the chunks already recorded
+    BulkOrderAction.objects.for_tenant(company).filter(pk=bulk_action.pk).update(  # pyright: ignore[reportAttributeAccessIssue]
+        processed=2,
+        succeeded=0,
+    )
+    bulk_action.refresh_from_db()
+    run_bulk_order_action_service(bulk_action=bulk_action)
+
+    bulk_action.refresh_from_db()
+    assert bulk_action.status == BulkOrderAction.Status.DONE
+    assert (bulk_action.processed, bulk_action.total) == (5, 5)
+    assert (bulk_action.succeeded, bulk_action.rejected) == (2, 1)
+    assert bulk_action.finished_at is not None
+    company_orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    assert company_orders.filter(status=Order.Status.PENDING).count() == 2
+
+
+@pytest.mark.django_db
+def test_backorders_wait_for_restock_in_fifo_order(user_profile, company):
+    product = create_product_service(
+        company=company,
+        name="Backordered",
+        stock_quantity=10,
+        backorders_enabled=True,
+    )
+    quantities = [10, 30, 20, 5]
+    orders = [
+        create_order_service(
+            product=product,
+            quantity=quantity,
+            created_by=user_profile,
+            company=company,
+        )
+        for quantity in quantities
+    ]
+
+    # Only the first order found stock; the others joined the queue
+    assert [order.status for order in orders] == [
+        Order.Status.PENDING,
+        Order.Status.BACKORDERED,
+        Order.Status.BACKORDERED,
+        Order.Status.BACKORDERED,
+    ]
+
+    adjust_product_stock_service(product=product, quantity_change=45)
+    restock = OutboxMessage.objects.get(task="apps.orders.tasks.fill_backorders_task")
+    assert restock.args == [product.pk]
+
+    # 45 units cover the 30, then the 20 no longer fits but the 5 does
+    assert fill_backorders_service(product=product) == [orders[1].pk, orders[3].pk]
+    product.refresh_from_db()
+    assert (product.stock_quantity, product.reserved_quantity) == (55, 45)
+
+    update_product_service(product=product, name=product.name, stock_quantity=65)
+    assert fill_backorders_service(product=product) == [orders[2].pk]
+    product.refresh_from_db()
+    assert (product.stock_quantity, product.reserved_quantity) == (65, 65)
+    # Filled backorders hold a reservation and are processed like new orders
+    filled = Order.objects.for_tenant(company).order_by("pk")  # pyright: ignore[reportAttributeAccessIssue]
+    assert list(filled.values_list("status", "stock_reserved")) == (
+        [(Order.Status.PENDING, True)] * 4
+    )
+    assert OutboxMessage.objects.filter(
+        task="apps.orders.tasks.schedule_orders_task",
+    ).exists()
+    movements = InventoryMovement.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    assert not movements.filter(reason=InventoryMovement.Reason.ORDER_APPROVED).exists()
+
+
+@pytest.mark.django_db
+def test_released_reservations_fill_backorders(user_profile, company):
+    product = create_product_service(
+        company=company,
+        name="Backordered",
+        stock_quantity=10,
+        backorders_enabled=True,
+    )
+    first, waiting = (
+        create_order_service(
+            product=product,
+            quantity=10,
+            created_by=user_profile,
+            company=company,
+        )
+        for _ in range(2)
+    )
+    assert waiting.status == Order.Status.BACKORDERED
+    first.transition_to(Order.Status.PROCESSING)
+
+    assert fail_orders_service(company=company, order_ids=[first.pk])
+
+    restock = OutboxMessage.objects.get(task="apps.orders.tasks.fill_backorders_task")
+    assert restock.args == [product.pk]
+    assert fill_backorders_service(product=product) == [waiting.pk]
+
+
+@pytest.mark.django_db
+def test_unreserved_order_short_of_stock_is_backordered(
+    product,
+    user_profile,
+    company,
+):
+    product.backorders_enabled = True
+    product.save()
+    order = Order.objects.create(
+        product=product,
+        quantity=150,
+        created_by=user_profile,
+        company=company,
+        status=Order.Status.PROCESSING,
+    )
+
+    assert approve_order_service(order=order)
+
+    order.refresh_from_db()
+    assert order.status == Order.Status.BACKORDERED
+    assert order.backordered_at is not None
+    assert not OutboxMessage.objects.filter(
+        task__endswith="fill_backorders_task",
+    ).exists()
+
+
+@pytest.mark.django_db
+def test_allocate_product_stock_service_maximizes_orders_filled(
+    product,
+    user_profile,
+    company,
+):
+    orders = [
+        Order.objects.create(
+            product=product,
+            quantity=quantity,
+            created_by=user_profile,
+            company=company,
+            status=Order.Status.PENDING,
+        )
+        for quantity in (60, 30, 50, 20)
+    ]
+    # Orders a worker has already been handed are left to it
+    dispatched = Order.objects.create(
+        product=product,
+        quantity=5,
+        created_by=user_profile,
+        company=company,
+        status=Order.Status.PENDING,
+        dispatched_at=timezone.now(),
+    )
+    processing = Order.objects.create(
+        product=product,
+        quantity=5,
+        created_by=user_profile,
+        company=company,
+        status=Order.Status.PROCESSING,
+    )
+
+    result = allocate_product_stock_service(product=product, policy="max_orders")
+
+    assert result == {
+        "reserved": [orders[1].pk, orders[2].pk, orders[3].pk],
+        "failed": [orders[0].pk],
+        "backordered": [],
+    }
+    product.refresh_from_db()
+    assert (product.stock_quantity, product.reserved_quantity) == (100, 100)
+    # Filled orders are fulfilled like any new order, nothing is approved yet
+    statuses = Order.objects.for_tenant(company).order_by("pk")  # pyright: ignore[reportAttributeAccessIssue]
+    assert list(statuses.values_list("status", "stock_reserved")) == [
+        (Order.Status.FAILED, False),
+        (Order.Status.PENDING, True),
+        (Order.Status.PENDING, True),
+        (Order.Status.PENDING, True),
+        (Order.Status.PENDING, False),
+        (Order.Status.PROCESSING, False),
+    ]
+    assert OutboxMessage.objects.filter(
+        task="apps.orders.tasks.schedule_orders_task",
+    ).exists()
+    movements = InventoryMovement.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    assert not movements.filter(reason=InventoryMovement.Reason.ORDER_APPROVED).exists()
+    assert {dispatched.pk, processing.pk}.isdisjoint(chain(*result.values()))
+
+
+@pytest.mark.django_db
+def test_multi_line_order_is_reserved_as_a_whole(product, user_profile, company):
+    other = create_product_service(company=company, name="Other", stock_quantity=5)
+
+    with pytest.raises(ValueError, match="Other"):
+        create_multi_line_order_service(
+            lines=[
+                {"product": product, "quantity": 10},
+                {"product": other, "quantity": 6},
+            ],
+            created_by=user_profile,
+            company=company,
+        )
+    product.refresh_from_db()
+    assert product.reserved_quantity == 0
+    assert not Order.objects.for_tenant(company).exists()  # pyright: ignore[reportAttributeAccessIssue]
+
+    order = create_multi_line_order_service(
+        lines=[
+            {"product": other, "quantity": 2},
+            {"product": product, "quantity": 10},
+            {"product": other, "quantity": 3},
+        ],
+        created_by=user_profile,
+        company=company,
+    )
+
+    assert order.has_lines
+    assert (order.status, order.quantity, order.stock_reserved) == (
+        Order.Status.PENDING,
+        15,
+        True,
+    )
+    lines = OrderLine.objects.for_tenant(company).filter(order=order)  # pyright: ignore[reportAttributeAccessIssue]
+    assert sorted(lines.values_list("product_id", "quantity")) == sorted(
+        [(product.pk, 10), (other.pk, 5)],
+    )
+    for item, reserved in ((product, 10), (other, 5)):
+        item.refresh_from_db()
+        assert item.reserved_quantity == reserved
+    assert OutboxMessage.objects.filter(
+        task="apps.orders.tasks.schedule_orders_task",
+    ).exists()
+
+
+@pytest.mark.django_db
+def test_batch_approval_locks_every_product_once(
+    product,
+    user_profile,
+    company,
+    mocker,
+):
+    other = create_product_service(company=company, name="Other", stock_quantity=5)
+    single = create_order_service(
+        product=product,
+        quantity=30,
+        created_by=user_profile,
+        company=company,
+    )
+    multi = create_multi_line_order_service(
+        lines=[
+            {"product": product, "quantity": 20},
+            {"product": other, "quantity": 5},
+        ],
+        created_by=user_profile,
+        company=company,
+    )
+    # Holds no reservation, and the other product has no stock left for it
+    unreserved = Order.objects.create(
+        product=None,
+        quantity=11,
+        created_by=user_profile,
+        company=company,
+        status=Order.Status.PENDING,
+    )
+    OrderLine.objects.bulk_create(
+        [
+            OrderLine(order=unreserved, product=product, quantity=10, company=company),
+            OrderLine(order=unreserved, product=other, quantity=1, company=company),
+        ],
+    )
+    lock = mocker.spy(services, "_lock_products")
+
+    result = approve_orders_batch_service(
+        company=company,
+        orders=[single, multi, unreserved],
+    )
+
+    lock.assert_called_once()
+    assert lock.call_args.kwargs["product_ids"] == {product.pk, other.pk}
+    assert result == {
+        "approved": [single.pk, multi.pk],
+        "failed": [unreserved.pk],
+        "backordered": [],
+    }
+    product.refresh_from_db()
+    other.refresh_from_db()
+    assert (product.stock_quantity, product.reserved_quantity) == (50, 0)
+    assert (other.stock_quantity, other.reserved_quantity) == (0, 0)
+    movements = InventoryMovement.objects.for_tenant(company).filter(  # pyright: ignore[reportAttributeAccessIssue]
+        reason=InventoryMovement.Reason.ORDER_APPROVED,
+        reference=str(multi.reference_code),
+    )
+    assert movements.count() == 2
+
+
+@pytest.mark.django_db
+def test_multi_line_order_fails_and_retries_as_a_whole(
+    product,
+    user_profile,
+    company,
+):
+    other = create_product_service(company=company, name="Other", stock_quantity=5)
+    order = create_multi_line_order_service(
+        lines=[
+            {"product": product, "quantity": 20},
+            {"product": other, "quantity": 5},
+        ],
+        created_by=user_profile,
+        company=company,
+    )
+    Order.objects.for_tenant(company).filter(pk=order.pk).update(  # pyright: ignore[reportAttributeAccessIssue]
+        status=Order.Status.PROCESSING,
+    )
+
+    assert fail_orders_service(company=company, order_ids=[order.pk])
+    for item in (product, other):
+        item.refresh_from_db()
+        assert item.reserved_quantity == 0
+
+    order.refresh_from_db()
+    retry_order_service(order=order)
+    order.refresh_from_db()
+    assert (order.status, order.stock_reserved) == (Order.Status.PENDING, True)
+    product.refresh_from_db()
+    other.refresh_from_db()
+    assert (product.reserved_quantity, other.reserved_quantity) == (20, 5)
+
+    assert approve_order_service(order=order)
+    order.refresh_from_db()
+    assert order.status == Order.Status.APPROVED
+    other.refresh_from_db()
+    assert (other.stock_quantity, other.reserved_quantity) == (0, 0)
+
+
+@pytest.mark.django_db
+def test_reap_stuck_orders_service(
+    product,
+    user_profile,
+    company,
+    company_b,
+    settings,
+):
+    settings.ORDER_LEASE_SECONDS = 60
+    settings.ORDER_REAPER_BATCH_SIZE = 2
+    settings.ORDER_MAX_ATTEMPTS = 3
+    inactive = create_product_service(company=company, name="Old", stock_quantity=5)
+    product_b = create_product_service(company=company_b, name="B", stock_quantity=5)
+    orders = [
+        create_order_service(
+            product=item,
+            quantity=1,
+            created_by=user_profile,
+            company=item.company,
+        )
+        for item in (product, product, inactive, product_b, product, product)
+    ]
+    abandoned, exhausted, _deactivated, _other_tenant, recent, lost = orders
+    long_ago = timezone.now() - dt.timedelta(minutes=5)
+    all_orders = Order.objects.for_all_tenants()  # pyright: ignore[reportAttributeAccessIssue]
+    all_orders.filter(pk__in=[order.pk for order in orders[:4]]).update(
+        status=Order.Status.PROCESSING,
+        updated_at=long_ago,
+    )
+    all_orders.filter(pk=exhausted.pk).update(attempts=2)
+    all_orders.filter(pk=recent.pk).update(status=Order.Status.PROCESSING)
+    all_orders.filter(pk=lost.pk).update(dispatched_at=long_ago)
+    inactive.is_active = False
+    inactive.save()
+
+    assert reap_stuck_orders_service() == {
+        company.pk: {"requeued": 1, "failed": 2, "redispatched": 1},
+        company_b.pk: {"requeued": 1, "failed": 0, "redispatched": 0},
+    }
+
+    statuses = dict(all_orders.values_list("pk", "status"))
+    assert [statuses[order.pk] for order in orders] == [
+        Order.Status.PENDING,
+        Order.Status.DEAD_LETTER,
+        Order.Status.FAILED,
+        Order.Status.PENDING,
+        Order.Status.PROCESSING,
+        Order.Status.PENDING,
+    ]
+    abandoned.refresh_from_db()
+    assert abandoned.attempts == 1
+    assert abandoned.last_error == "Reaped: still PROCESSING after 60 seconds."
+    assert abandoned.retry_at is not None
+    lost.refresh_from_db()
+    assert lost.dispatched_at is None
+    inactive.refresh_from_db()
+    assert inactive.reserved_quantity == 0
+    assert OutboxMessage.objects.filter(
+        task="apps.orders.tasks.schedule_orders_task",
+        published_at__isnull=True,
+    ).exists()
+    # Nothing is left to reap
+    assert reap_stuck_orders_service() == {}
+
+
+@pytest.mark.django_db
+def test_retry_orders_later_service_moves_each_group_with_one_update(
+    product,
+    user_profile,
+    company,
+    settings,
+):
+    settings.ORDER_MAX_ATTEMPTS = 3
+    orders = [
+        create_order_service(
+            product=product,
+            quantity=1,
+            created_by=user_profile,
+            company=company,
+        )
+        for _ in range(4)
+    ]
+    company_orders = Order.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+    company_orders.update(status=Order.Status.PROCESSING)
+    company_orders.filter(pk=orders[3].pk).update(attempts=2)
+
+    with CaptureQueriesContext(connection) as queries:
+        outcome = retry_orders_later_service(
+            company=company,
+            errors={order.pk: f"Error {index}" for index, order in enumerate(orders)},
+        )
+
+    assert [order.pk for order in outcome["retried"]] == [
+        order.pk for order in orders[:3]
+    ]
+    assert [order.pk for order in outcome["dead_lettered"]] == [orders[3].pk]
+    updates = [
+        query["sql"]
+        for query in queries.captured_queries
+        if query["sql"].startswith('UPDATE "orders_order"')
+    ]
+    # Retried, dead-lettered, then the attempts of the dead-lettered
+    assert len(updates) == 3
+    rows = company_orders.order_by("pk").values_list("status", "attempts", "last_error")
+    assert list(rows) == [
+        (Order.Status.PENDING, 1, "Error 0"),
+        (Order.Status.PENDING, 1, "Error 1"),
+        (Order.Status.PENDING, 1, "Error 2"),
+        (Order.Status.DEAD_LETTER, 3, "Error 3"),
+    ]
+    assert company_orders.filter(retry_at__isnull=False).count() == 3
+
+
+@pytest.mark.django_db
+def test_doomed_orders_are_rejected_before_any_lock(
+    product,
+    user_profile,
+    company,
+    mocker,
+    settings,
+    django_capture_on_commit_callbacks,
+):
+    reserve = mocker.spy(services, "reserve_product_stock_service")
+    with django_capture_on_commit_callbacks(execute=True):
+        deactivate_products_service(
+            products_qs=Product.objects.for_tenant(company).filter(pk=product.pk),  # pyright: ignore[reportAttributeAccessIssue]
+        )
+
+    with pytest.raises(ValueError, match="not available"):
+        create_order_service(
+            product=product,
+            quantity=1,
+            created_by=user_profile,
+            company=company,
+        )
+    other = create_product_service(company=company, name="Other", stock_quantity=5)
+    with pytest.raises(ValueError, match="Other: Cannot reserve 6 items; only 5"):
+        create_multi_line_order_service(
+            lines=[{"product": other, "quantity": 6}],
+            created_by=user_profile,
+            company=company,
+        )
+    reserve.assert_not_called()
+
+    # Restocking refreshes the cached availability at once
+    with django_capture_on_commit_callbacks(execute=True):
+        adjust_product_stock_service(product=other, quantity_change=1)
+    create_multi_line_order_service(
+        lines=[{"product": other, "quantity": 6}],
+        created_by=user_profile,
+        company=company,
+    )
+
+    # Without the pre-check the reservation still decides
+    settings.ORDER_AVAILABILITY_PRECHECK = False
+    with pytest.raises(ValueError, match="Cannot reserve 1 items; only 0"):
+        create_order_service(
+            product=other,
+            quantity=1,
+            created_by=user_profile,
+            company=company,
+        )
+    assert reserve.call_count == 2
+
+
+@pytest.mark.django_db
+def test_inactive_products_are_refused_without_the_precheck(
+    product,
+    user_profile,
+    company,
+    settings,
+):
+    settings.ORDER_AVAILABILITY_PRECHECK = False
+    product.is_active = False
+    product.backorders_enabled = True
+    product.save()
+
+    with pytest.raises(ValueError, match="not available"):
+        create_order_service(
+            product=product,
+            quantity=1,
+            created_by=user_profile,
+            company=company,
+        )
+    with pytest.raises(ValueError, match="not available"):
+        bulk_create_orders_service(
+            items=[{"product": product, "quantity": 1}],
+            created_by=user_profile,
+            company=company,
+        )
+
+    product.refresh_from_db()
+    assert product.reserved_quantity == 0
+    assert not Order.objects.filter(product=product).exists()
@@ -1,10 +1,23 @@
+import threading
 from pathlib import Path
 
 import pytest
+from django.db import OperationalError, connection
+from django.utils import timezone
 
-from apps.orders.tasks import generate_export_file_task
+from apps.orders.tasks import (
+    generate_export_file_task,
+    process_order_task,
+    process_orders_chunk_task,
+    process_pending_orders_batch_task,
+    schedule_orders_task,
+)
+from apps.products.models import Product
+from apps.products.services import create_product_service, deactivate_products_service
 
-from ..models import Export
+from ..fulfillment import FulfillmentTimeoutError
+from ..models import Export, Order, OutboxMessage
+from ..services import create_multi_line_order_service, create_order_service
 
 
 @pytest.mark.django_db
@@ -16,14 +29,11 @@ def test_generate_export_file_task(test_data, company, mocker, settings, tmp_pat
     export = Export.objects.create(
         requested_by=test_data["profile"],
         company=test_data["company"],
+        spec={"ids": test_data["order_ids"]},
     )
 
     # 2. Act: Call the task function directly
-    generate_export_file_task(
-        export_id=export.pk,
-        order_ids=test_data["order_ids"],
-        company_id=company.pk,
-    )
+    generate_export_file_task(export_id=export.pk, company_id=company.pk)
 
     # 3. Assert: Check that the task updated the Export object correctly
     export.refresh_from_db()
@@ -31,6 +41,8 @@ def test_generate_export_file_task(test_data, company, mocker, settings, tmp_pat
     assert export.status == Export.Status.READY
     assert export.file is not None
     assert export.file.name.endswith(f"export_{export.pk}.csv")
+    assert export.row_count == 5
+    assert export.byte_size == export.file.size
 
     # Check the content of the generated file
     with export.file.open("r") as f:
@@ -39,3 +51,246 @@ def test_generate_export_file_task(test_data, company, mocker, settings, tmp_pat
         assert len(content.strip().split("\n")) == 6  # Assuming 5 orders + header
 
     # NO manual cleanup needed. pytest will delete the tmp_path directory.
+
+
+@pytest.mark.django_db
+def test_process_pending_orders_batch_task(test_data, company, product, settings):
+    settings.ORDER_EXTERNAL_CALL_SECONDS = 0
+
+    # test_data holds five PENDING orders reserving 20 units each
+    processed = process_pending_orders_batch_task(company_id=company.pk)
+
+    assert processed == 5
+    assert Order.objects.filter(status=Order.Status.APPROVED).count() == 5
+    product.refresh_from_db()
+    assert product.stock_quantity == 0
+    assert product.reserved_quantity == 0
+
+
+@pytest.mark.django_db
+def test_process_orders_chunk_task(test_data, company, product, settings):
+    settings.ORDER_EXTERNAL_CALL_SECONDS = 0
+    chunk = test_data["order_ids"][:2]
+
+    processed = process_orders_chunk_task(chunk, company_id=company.pk)
+
+    assert processed == 2
+    approved = Order.objects.filter(status=Order.Status.APPROVED)
+    assert sorted(approved.values_list("pk", flat=True)) == sorted(chunk)
+    assert Order.objects.filter(status=Order.Status.PENDING).count() == 3
+
+    # Orders of the chunk are no longer PENDING, so a redelivery is a no-op
+    assert process_orders_chunk_task(chunk, company_id=company.pk) == 0
+    product.refresh_from_db()
+    assert product.stock_quantity == 60
+    assert product.reserved_quantity == 60
+
+
+@pytest.mark.django_db
+def test_chunk_fails_orders_of_deactivated_products_at_once(
+    test_data,
+    company,
+    product,
+    mocker,
+):
+    gateway = mocker.patch("apps.orders.tasks.get_fulfillment_gateway")
+    chunk = test_data["order_ids"][:2]
+    deactivate_products_service(products_qs=Product.objects.filter(pk=product.pk))
+
+    assert process_orders_chunk_task(chunk, company_id=company.pk) == 2
+
+    gateway.assert_not_called()
+    failed = Order.objects.filter(pk__in=chunk)
+    assert set(failed.values_list("status", "last_error")) == {
+        (Order.Status.FAILED, "The product is inactive."),
+    }
+    product.refresh_from_db()
+    assert product.reserved_quantity == 60
+
+
+@pytest.mark.django_db
+def test_scheduler_runs_are_not_queued_per_order(
+    company,
+    product,
+    user_profile,
+    settings,
+):
+    settings.ORDER_EXTERNAL_CALL_SECONDS = 0
+    runs = OutboxMessage.objects.filter(task="apps.orders.tasks.schedule_orders_task")
+    orders = [
+        create_order_service(
+            product=product,
+            quantity=1,
+            created_by=user_profile,
+            company=company,
+        )
+        for _ in range(5)
+    ]
+    process_orders_chunk_task([order.pk for order in orders], company_id=company.pk)
+
+    # One run is queued for the whole burst
+    assert runs.count() == 1
+
+    # Once it starts, what arrives next queues another one
+    schedule_orders_task()
+    create_order_service(
+        product=product,
+        quantity=1,
+        created_by=user_profile,
+        company=company,
+    )
+    assert runs.count() == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_process_order_task_holds_no_transaction_during_external_call(
+    product,
+    user_profile,
+    company,
+    mocker,
+):
+    first, second = (
+        Order.objects.create(
+            product=product,
+            quantity=10,
+            created_by=user_profile,
+            company=company,
+            status=Order.Status.PENDING,
+        )
+        for _ in range(2)
+    )
+    in_transaction = {}
+    close_spy = mocker.spy(connection, "close")
+
+    def run_worker(order_id):
+        try:
+            process_order_task(order_id, company_id=company.pk)
+        finally:
+            connection.close()
+
+    def fake_external_call(request):
+        in_transaction[request.order_id] = connection.in_atomic_block
+        if request.order_id != first.pk:
+            return
+        # While the first order waits on the network, a second worker must be
+        # able to claim, approve and commit another order for the same product.
+        worker = threading.Thread(target=run_worker, args=(second.pk,))
+        worker.start()
+        worker.join(timeout=10)
+        assert not worker.is_alive()
+
+    gateway = mocker.patch("apps.orders.tasks.get_fulfillment_gateway").return_value
+    gateway.fulfill_sync.side_effect = fake_external_call
+
+    process_order_task(first.pk, company_id=company.pk)
+
+    assert in_transaction == {first.pk: False, second.pk: False}
+    assert close_spy.called
+    statuses = Order.objects.for_tenant(company).values_list("status", flat=True)  # pyright: ignore[reportAttributeAccessIssue]
+    assert list(statuses) == [Order.Status.APPROVED, Order.Status.APPROVED]
+    product.refresh_from_db()
+    assert product.stock_quantity == 80
+
+
+@pytest.mark.django_db
+def test_transient_errors_are_retried_then_dead_lettered(
+    test_data,
+    company,
+    product,
+    mocker,
+    settings,
+):
+    settings.ORDER_MAX_ATTEMPTS = 2
+    order_id = test_data["order_ids"][0]
+    gateway = mocker.patch("apps.orders.tasks.get_fulfillment_gateway").return_value
+    gateway.fulfill_sync.side_effect = FulfillmentTimeoutError("took too long")
+
+    process_order_task(order_id, company_id=company.pk)
+
+    order = Order.objects.get(pk=order_id)
+    assert order.status == Order.Status.PENDING
+    assert order.attempts == 1
+    assert order.retry_at > timezone.now()
+    assert order.last_error == "FulfillmentTimeoutError: took too long"
+    assert order.stock_reserved
+    # Still backing off, so a redelivered task does not pick it up
+    process_order_task(order_id, company_id=company.pk)
+    assert Order.objects.get(pk=order_id).attempts == 1
+
+    Order.objects.filter(pk=order_id).update(retry_at=timezone.now())
+    process_order_task(order_id, company_id=company.pk)
+
+    order.refresh_from_db()
+    assert order.status == Order.Status.DEAD_LETTER
+    assert order.attempts == 2
+    assert not order.stock_reserved
+    product.refresh_from_db()
+    assert product.reserved_quantity == 80
+
+
+@pytest.mark.django_db
+def test_permanent_errors_are_not_retried(test_data, company, mocker):
+    order_id = test_data["order_ids"][0]
+    gateway = mocker.patch("apps.orders.tasks.get_fulfillment_gateway").return_value
+    gateway.fulfill_sync.side_effect = KeyError("bug")
+
+    process_order_task(order_id, company_id=company.pk)
+
+    order = Order.objects.get(pk=order_id)
+    assert order.status == Order.Status.FAILED
+    assert order.attempts == 0
+    assert order.last_error == "KeyError: 'bug'"
+
+
+@pytest.mark.django_db
+def test_lock_timeout_during_batch_approval_is_retried(
+    test_data,
+    company,
+    mocker,
+    settings,
+):
+    settings.ORDER_EXTERNAL_CALL_SECONDS = 0
+    mocker.patch(
+        "apps.orders.tasks.approve_orders_batch_service",
+        side_effect=OperationalError("lock timeout"),
+    )
+
+    assert process_pending_orders_batch_task(company_id=company.pk) == 5
+
+    orders = Order.objects.filter(pk__in=test_data["order_ids"])
+    assert set(orders.values_list("status", "attempts")) == {
+        (Order.Status.PENDING, 1),
+    }
+    # Nothing is due yet
+    assert process_pending_orders_batch_task(company_id=company.pk) == 0
+
+
+@pytest.mark.django_db
+def test_multi_line_order_is_fulfilled_with_one_call(
+    product,
+    user_profile,
+    company,
+    mocker,
+):
+    other = create_product_service(company=company, name="Other", stock_quantity=5)
+    order = create_multi_line_order_service(
+        lines=[
+            {"product": product, "quantity": 10},
+            {"product": other, "quantity": 5},
+        ],
+        created_by=user_profile,
+        company=company,
+    )
+    gateway = mocker.patch("apps.orders.tasks.get_fulfillment_gateway").return_value
+    gateway.fulfill_many_sync.return_value = [None]
+
+    assert process_orders_chunk_task([order.pk], company_id=company.pk) == 1
+
+    (requests,) = gateway.fulfill_many_sync.call_args.args
+    assert [(request.product_id, request.lines) for request in requests] == [
+        (None, ((product.pk, 10), (other.pk, 5))),
+    ]
+    order.refresh_from_db()
+    assert order.status == Order.Status.APPROVED
+    other.refresh_from_db()
+    assert other.stock_quantity == 0
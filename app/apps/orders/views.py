@@ -1,16 +1,36 @@
+from collections.abc import Callable
+
 from core.thread_locals import get_current_tenant
 from django.http import FileResponse
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled, ValidationError
 from rest_framework.permissions import DjangoModelPermissions, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from apps.users.roles import Role, get_role_group
 
-from .models import Export, Order
-from .serializers import OrderCreateSerializer, OrderReadSerializer
-from .services import create_order_service, retry_order_service
+from .admission import AdmissionDeniedError, admit_orders
+from .idempotency import (
+    IdempotencyKeyReusedError,
+    StoredResponse,
+    request_fingerprint,
+    run_idempotently,
+)
+from .models import Export, IdempotencyKey, Order
+from .selectors import get_order_batch_summary
+from .serializers import (
+    MultiLineOrderCreateSerializer,
+    OrderCreateSerializer,
+    OrderReadSerializer,
+)
+from .services import (
+    bulk_create_orders_service,
+    create_multi_line_order_service,
+    create_order_service,
+    retry_order_service,
+)
 
 
 class OrderViewSet(viewsets.ModelViewSet):
@@ -18,6 +38,8 @@ class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
 
     def get_serializer_class(self):  # pyright: ignore[reportIncompatibleMethodOverride]  # noqa: ANN201
+        if self.action == "create" and "lines" in self.request.data:
+            return MultiLineOrderCreateSerializer
         if self.action == "create" or self.action == "bulk_create":
             return OrderCreateSerializer
         return OrderReadSerializer
@@ -25,7 +47,12 @@ class OrderViewSet(viewsets.ModelViewSet):
     def get_queryset(self):  # noqa: ANN201
         """Filter queryset based on user's role."""
         user = self.request.user
-        qs = super().get_queryset().select_related("product", "created_by__user")
+        qs = (
+            super()
+            .get_queryset()
+            .select_related("product", "created_by__user")
+            .prefetch_related("lines__product")
+        )
 
         if user.is_superuser:
             return qs
@@ -35,35 +62,124 @@ class OrderViewSet(viewsets.ModelViewSet):
 
         return qs.filter(company=user.profile.company)
 
+    def _admit(self, count: int) -> None:
+        """Answers 429 with Retry-After when the orders may not be created."""
+        try:
+            admit_orders(
+                company=get_current_tenant(),
+                user_id=self.request.user.pk,
+                count=count,
+            )
+        except AdmissionDeniedError as e:
+            raise Throttled(wait=e.retry_after, detail=str(e)) from e
+
+    def _idempotent(self, request, create: Callable[[], Response]) -> Response:  # noqa: ANN001
+        """
+        Runs `create` once per Idempotency-Key header; a repeated request
+        gets the original response back, marked Idempotent-Replayed.
+        """
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return create()
+        if len(key) > IdempotencyKey._meta.get_field("key").max_length:  # pyright: ignore[reportOptionalOperand]
+            raise ValidationError({"error": "The Idempotency-Key is too long."})
+
+        def stored_create() -> StoredResponse:
+            response = create()
+            return StoredResponse(response.status_code, response.data)
+
+        try:
+            stored, replayed = run_idempotently(
+                company=get_current_tenant(),
+                key=key,
+                fingerprint=request_fingerprint(
+                    method=request.method,
+                    path=request.path,
+                    data=request.data,
+                ),
+                create=stored_create,
+            )
+        except IdempotencyKeyReusedError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        response = Response(stored.body, status=stored.status)
+        if replayed:
+            response["Idempotent-Replayed"] = "true"
+        return response
+
+    def create(self, request, *args, **kwargs):  # noqa: ANN001, ANN002, ANN003, ANN201
+        """Override to honour the Idempotency-Key header."""
+        create = super().create
+        return self._idempotent(request, lambda: create(request, *args, **kwargs))
+
     def perform_create(self, serializer) -> None:  # noqa: ANN001
-        """Override to use the create_order_service."""
+        """
+        Override to use the create_order_service, or the
+        create_multi_line_order_service when the order is sent as "lines".
+        """
         company = get_current_tenant()
-        create_order_service(
-            product=serializer.validated_data["product"],
-            quantity=serializer.validated_data["quantity"],
-            created_by=self.request.user.profile,  # pyright: ignore[reportAttributeAccessIssue]
-            company=company,
-        )
+        self._admit(1)
+        try:
+            if "lines" in serializer.validated_data:
+                create_multi_line_order_service(
+                    lines=serializer.validated_data["lines"],
+                    created_by=self.request.user.profile,  # pyright: ignore[reportAttributeAccessIssue]
+                    company=company,
+                )
+            else:
+                create_order_service(
+                    product=serializer.validated_data["product"],
+                    quantity=serializer.validated_data["quantity"],
+                    created_by=self.request.user.profile,  # pyright: ignore[reportAttributeAccessIssue]
+                    company=company,
+                )
+        except ValueError as e:
+            raise ValidationError({"error": str(e)}) from e
 
     @action(detail=False, methods=["post"], url_path="bulk-create")
     def bulk_create(self, request):  # noqa: ANN001, ANN201
         """Endpoint for POST /api/orders/bulk-create/"""
+        return self._idempotent(request, lambda: self._bulk_create(request))
+
+    def _bulk_create(self, request) -> Response:  # noqa: ANN001
         serializer = self.get_serializer(data=request.data, many=True)
         serializer.is_valid(raise_exception=True)
+        self._admit(len(serializer.validated_data))
 
-        for order_data in serializer.validated_data:
-            company = get_current_tenant()
-            create_order_service(
-                product=order_data["product"],
-                quantity=order_data["quantity"],
+        try:
+            batch_id = bulk_create_orders_service(
+                items=serializer.validated_data,
                 created_by=request.user.profile,
-                company=company,
+                company=get_current_tenant(),
             )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         return Response(
-            {"status": "bulk order creation started"},
+            {"status": "bulk order creation started", "batch_id": batch_id},
             status=status.HTTP_202_ACCEPTED,
         )
 
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path=r"batches/(?P<batch_id>[0-9a-f-]{36})",
+    )
+    def batch_status(self, request, batch_id=None):  # noqa: ANN001, ANN201, ARG002
+        """Endpoint for GET /api/orders/batches/<batch_id>/"""
+        summary = get_order_batch_summary(
+            orders=self.get_queryset(),
+            batch_id=batch_id,  # pyright: ignore[reportArgumentType]
+        )
+        if not summary["total"]:
+            return Response(
+                {"error": "Batch not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response({"batch_id": batch_id, **summary})
+
     @action(detail=True, methods=["post"])
     def retry(self, request, pk=None):  # noqa: ANN001, ANN201, ARG002
         """Endpoint for POST /api/orders/<id>/retry/"""
@@ -1,13 +1,16 @@
+from django.conf import settings
 from django.contrib import admin
 from django.db.models import QuerySet
 
 from apps.products.services import (
     activate_products_service,
     deactivate_products_service,
+    set_product_stock_shards_service,
 )
 
 from .forms import ProductAdminForm
 from .models import Product
+from .selectors import annotate_stock_totals
 
 
 @admin.register(Product)
@@ -16,11 +19,30 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ("name", "sku")
 
     def get_list_display(self, request):  # noqa: ANN001, ANN201
-        base_fields = ("name", "sku", "stock_quantity", "is_active")
+        base_fields = (
+            "name",
+            "sku",
+            "total_stock_quantity",
+            "total_reserved_quantity",
+            "stock_shard_count",
+            "backorders_enabled",
+            "is_active",
+        )
         if request.user.is_superuser:
             return (*base_fields, "company")
         return base_fields
 
+    def get_queryset(self, request):  # noqa: ANN001, ANN201
+        return annotate_stock_totals(super().get_queryset(request))
+
+    @admin.display(description="Stock quantity")
+    def total_stock_quantity(self, obj: Product) -> int:
+        return obj.total_stock_quantity
+
+    @admin.display(description="Reserved quantity")
+    def total_reserved_quantity(self, obj: Product) -> int:
+        return obj.total_reserved_quantity
+
     def get_list_filter(self, request):  # noqa: ANN001, ANN201
         if request.user.is_superuser:
             return ("company", "is_active")
@@ -41,4 +63,24 @@ class ProductAdmin(admin.ModelAdmin):
         deactivate_products_service(products_qs=queryset)
         self.message_user(request, "Selected products have been deactivated.")
 
-    actions = (activate_products, deactivate_products)  # pyright: ignore[reportAssignmentType]
+    @admin.action(description="Enable sharded stock counters")
+    def enable_stock_sharding(self, request, queryset: QuerySet[Product]) -> None:  # noqa: ANN001
+        for product in queryset.filter(stock_shard_count=0):
+            set_product_stock_shards_service(
+                product=product,
+                shard_count=settings.PRODUCT_STOCK_SHARD_COUNT,
+            )
+        self.message_user(request, "Sharded stock enabled for selected products.")
+
+    @admin.action(description="Disable sharded stock counters")
+    def disable_stock_sharding(self, request, queryset: QuerySet[Product]) -> None:  # noqa: ANN001
+        for product in queryset.exclude(stock_shard_count=0):
+            set_product_stock_shards_service(product=product, shard_count=0)
+        self.message_user(request, "Sharded stock disabled for selected products.")
+
+    actions = (  # pyright: ignore[reportAssignmentType]
+        activate_products,
+        deactivate_products,
+        enable_stock_sharding,
+        disable_stock_sharding,
+    )
@@ -0,0 +1,109 @@
+"""
+Cached view of each product's availability: whether it is active and how
+many units are not reserved yet.
+
+Order creation reads it to turn away orders that obviously cannot succeed
+before they take a row lock or reach a worker. Entries are rewritten after
+every commit that adjusts the stock, releases a reservation or activates or
+deactivates the product. Reservations only lower the availability, so an
+entry they leave behind is optimistic and the reservation itself still
+rejects the order. Entries expire after PRODUCT_AVAILABILITY_CACHE_SECONDS,
+which bounds how long a missed update can mislead the check.
+"""
+
+from collections.abc import Iterable
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from django.db import transaction
+
+from .models import Product
+from .selectors import annotate_stock_totals
+
+
+class ProductAvailability(NamedTuple):
+    is_active: bool
+    available: int
+
+
+def _cache() -> BaseCache:
+    return caches[settings.PRODUCT_AVAILABILITY_CACHE]
+
+
+def _cache_key(product_id: int) -> str:
+    return f"products:availability:{product_id}"
+
+
+def _load_availability(product_ids: Iterable[int]) -> dict[int, ProductAvailability]:
+    products = annotate_stock_totals(
+        Product.objects.for_all_tenants().filter(pk__in=list(product_ids)),  # pyright: ignore[reportAttributeAccessIssue]
+    )
+    return {
+        product.pk: ProductAvailability(product.is_active, product.available_quantity)
+        for product in products
+    }
+
+
+def refresh_product_availability(product_ids: Iterable[int]) -> None:
+    """
+    Rewrites the cached availability of the products with one query once
+    the current transaction commits, so the cache never shows a change that
+    is rolled back.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+
+    def refresh() -> None:
+        _cache().set_many(
+            {
+                _cache_key(product_id): tuple(availability)
+                for product_id, availability in _load_availability(
+                    product_ids,
+                ).items()
+            },
+            timeout=settings.PRODUCT_AVAILABILITY_CACHE_SECONDS,
+        )
+
+    # A failure only leaves an entry to expire
+    transaction.on_commit(refresh, robust=True)
+
+
+def get_product_availability(*, product: Product) -> ProductAvailability:
+    """The product's cached availability, loaded on a miss."""
+    key = _cache_key(product.pk)
+    cached = _cache().get(key)
+    if cached is not None:
+        return ProductAvailability(*cached)
+
+    availability = _load_availability([product.pk]).get(
+        product.pk,
+        ProductAvailability(is_active=False, available=0),
+    )
+    # add, not set: an entry refreshed meanwhile is newer than this one
+    _cache().add(
+        key,
+        tuple(availability),
+        timeout=settings.PRODUCT_AVAILABILITY_CACHE_SECONDS,
+    )
+    return availability
+
+
+def check_product_availability(*, product: Product, quantity: int) -> None:
+    """
+    Raises ValueError if an order of `quantity` units of the product
+    obviously cannot succeed: the product is inactive, or it lacks the
+    stock and takes no backorders. Passing the check guarantees nothing;
+    the reservation decides.
+    """
+    availability = get_product_availability(product=product)
+    if not availability.is_active:
+        msg = "The product is not available."
+        raise ValueError(msg)
+    if availability.available < quantity and not product.backorders_enabled:
+        msg = (
+            f"Cannot reserve {quantity} items; "
+            f"only {max(availability.available, 0)} are available."
+        )
+        raise ValueError(msg)
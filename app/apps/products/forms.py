@@ -8,7 +8,32 @@ from .services import ProductData, create_product_service, update_product_servic
 class ProductAdminForm(forms.ModelForm):
     class Meta:
         model = Product
-        fields = ("name", "sku", "stock_quantity", "company", "is_active")
+        fields = (
+            "name",
+            "sku",
+            "stock_quantity",
+            "company",
+            "is_active",
+            "backorders_enabled",
+            "stock_shard_count",
+        )
+
+    def __init__(self, *args, **kwargs) -> None:  # noqa: ANN002, ANN003
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            # The row only holds part of the stock of a sharded product
+            self.initial["stock_quantity"] = self.instance.total_stock_quantity
+
+    def clean_stock_quantity(self) -> int:
+        stock_quantity = self.cleaned_data["stock_quantity"]
+        # Checked again under the product's lock when the form is saved
+        if self.instance.pk and stock_quantity < self.instance.total_reserved_quantity:
+            msg = (
+                f"Pending orders have reserved {self.instance.total_reserved_quantity} "
+                "items, the stock cannot be less."
+            )
+            raise forms.ValidationError(msg)
+        return stock_quantity
 
     def save(self, commit=True, request=None):  # noqa: ANN001, ANN201, ARG002, FBT002
         super().save(commit=False)
@@ -16,6 +41,8 @@ class ProductAdminForm(forms.ModelForm):
             "name": self.cleaned_data["name"],
             "is_active": self.cleaned_data["is_active"],
             "stock_quantity": self.cleaned_data["stock_quantity"],
+            "stock_shard_count": self.cleaned_data["stock_shard_count"],
+            "backorders_enabled": self.cleaned_data["backorders_enabled"],
         }
 
         if not self.instance.pk:
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def record_opening_balances(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    InventoryMovement = apps.get_model("products", "InventoryMovement")
+    InventoryMovement.objects.bulk_create(
+        InventoryMovement(
+            product_id=product_id,
+            company_id=company_id,
+            quantity_change=stock_quantity,
+            reason="opening_balance",
+        )
+        for product_id, company_id, stock_quantity in Product.objects.exclude(
+            stock_quantity=0,
+        ).values_list("pk", "company_id", "stock_quantity").iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0001_initial'),
+        ('products', '0002_product_reserved_quantity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity_change', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening_balance', 'Opening balance'), ('adjustment', 'Adjustment'), ('order_approved', 'Order approved')], max_length=20)),
+                ('reference', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='companies.company')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='products.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_quantity', models.IntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='companies.company')),
+                ('last_movement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.inventorymovement')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='products.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['product', 'created_at'], name='products_in_product_af8b5f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['product', 'id'], name='products_in_product_5ca663_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorysnapshot',
+            index=models.Index(fields=['product', 'taken_at'], name='products_in_product_5d1630_idx'),
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
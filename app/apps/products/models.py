@@ -1,6 +1,7 @@
 import uuid
 
 from django.db import models
+from django.db.models import Sum
 
 from apps.companies.managers import TenantManager
 
@@ -9,9 +10,156 @@ class Product(models.Model):
     name = models.CharField(max_length=50)
     sku = models.UUIDField(default=uuid.uuid4)
     stock_quantity = models.IntegerField(default=0)
+    # Units held by orders that were accepted but not yet approved
+    reserved_quantity = models.IntegerField(default=0)
     company = models.ForeignKey(to="companies.Company", on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
+    # Orders short of stock wait for a restock instead of failing, see
+    # apps.orders.services.fill_backorders_service
+    backorders_enabled = models.BooleanField(default=False)
+    # Number of ProductStockShard rows the stock is split across.
+    # 0 keeps all of it in stock_quantity and reserved_quantity above.
+    stock_shard_count = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Stock shards",
+        help_text="Split the stock across this many counters for hot products; "
+        "0 disables sharding.",
+    )
     objects = TenantManager()
 
     def __str__(self) -> str:
         return self.name
+
+    @property
+    def total_stock_quantity(self) -> int:
+        return self.stock_quantity + self._shard_totals()[0]
+
+    @property
+    def total_reserved_quantity(self) -> int:
+        return self.reserved_quantity + self._shard_totals()[1]
+
+    @property
+    def available_quantity(self) -> int:
+        return self.total_stock_quantity - self.total_reserved_quantity
+
+    def _shard_totals(self) -> tuple[int, int]:
+        """
+        Stock and reserved units held by the shards. Uses the annotations
+        added by `annotate_stock_totals` when present, else queries them.
+        """
+        if not self.stock_shard_count:
+            return 0, 0
+        if "shard_stock_quantity" in self.__dict__:
+            return self.shard_stock_quantity, self.shard_reserved_quantity
+        totals = (
+            ProductStockShard.objects.for_tenant(self.company_id)  # pyright: ignore[reportAttributeAccessIssue]
+            .filter(product=self)
+            .aggregate(stock=Sum("stock_quantity"), reserved=Sum("reserved_quantity"))
+        )
+        return totals["stock"] or 0, totals["reserved"] or 0
+
+
+class ProductStockShard(models.Model):
+    """
+    One of the counters a hot product's stock is split across, so that
+    concurrent orders update different rows instead of queueing on one.
+    Only the unreserved stock of a shard (stock minus reserved) is kept
+    non-negative; the product's totals are the sums over its shards.
+    """
+
+    product = models.ForeignKey(
+        to=Product,
+        on_delete=models.CASCADE,
+        related_name="stock_shards",
+    )
+    company = models.ForeignKey(to="companies.Company", on_delete=models.CASCADE)
+    index = models.PositiveSmallIntegerField()
+    stock_quantity = models.IntegerField(default=0)
+    reserved_quantity = models.IntegerField(default=0)
+    objects = TenantManager()
+
+    class Meta:
+        constraints = [  # noqa: RUF012
+            models.UniqueConstraint(
+                fields=["product", "index"],
+                name="unique_product_stock_shard",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.product_id} #{self.index}"  # pyright: ignore[reportAttributeAccessIssue]
+
+
+class InventoryMovement(models.Model):
+    """
+    Append-only ledger entry for a change of a product's stock_quantity.
+    Written in the same transaction as the change itself.
+    """
+
+    class Reason(models.TextChoices):
+        OPENING_BALANCE = "opening_balance", "Opening balance"
+        ADJUSTMENT = "adjustment", "Adjustment"
+        ORDER_APPROVED = "order_approved", "Order approved"
+
+    product = models.ForeignKey(
+        to=Product,
+        on_delete=models.CASCADE,
+        related_name="movements",
+    )
+    company = models.ForeignKey(to="companies.Company", on_delete=models.CASCADE)
+    quantity_change = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=Reason.choices)
+    # Free-form pointer to what caused the movement, e.g. an order reference code
+    reference = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    objects = TenantManager()
+
+    class Meta:
+        indexes = [  # noqa: RUF012
+            models.Index(fields=["product", "created_at"]),
+            models.Index(fields=["product", "id"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.product_id}: {self.quantity_change:+d} ({self.reason})"  # pyright: ignore[reportAttributeAccessIssue]
+
+    def save(self, *args, **kwargs) -> None:  # noqa: ANN002, ANN003
+        if self.pk is not None:
+            msg = "Inventory movements are append-only."
+            raise ValueError(msg)
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):  # noqa: ANN002, ANN003, ANN201, ARG002
+        msg = "Inventory movements are append-only."
+        raise ValueError(msg)
+
+
+class InventorySnapshot(models.Model):
+    """
+    The stock of a product after all movements up to `last_movement`.
+    Stock at any time is the nearest earlier snapshot plus the movements
+    recorded after it, so history never has to be replayed from the start.
+    """
+
+    product = models.ForeignKey(
+        to=Product,
+        on_delete=models.CASCADE,
+        related_name="snapshots",
+    )
+    company = models.ForeignKey(to="companies.Company", on_delete=models.CASCADE)
+    stock_quantity = models.IntegerField()
+    last_movement = models.ForeignKey(
+        to=InventoryMovement,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    taken_at = models.DateTimeField()
+    objects = TenantManager()
+
+    class Meta:
+        indexes = [  # noqa: RUF012
+            models.Index(fields=["product", "taken_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.product_id} @ {self.taken_at:%Y-%m-%d %H:%M:%S}"  # pyright: ignore[reportAttributeAccessIssue]
@@ -0,0 +1,146 @@
+import datetime as dt
+
+from django.db.models import (
+    BigIntegerField,
+    F,
+    Max,
+    Min,
+    OuterRef,
+    QuerySet,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
+
+from apps.companies.models import Company
+
+from .models import InventoryMovement, InventorySnapshot, Product, ProductStockShard
+
+
+def annotate_stock_totals(products: QuerySet[Product]) -> QuerySet[Product]:
+    """
+    Annotates the shard sums that the total stock properties of Product
+    need, so reading them does not cost a query per sharded product.
+    """
+    shards = (
+        ProductStockShard.objects.for_tenant(OuterRef("company"))  # pyright: ignore[reportAttributeAccessIssue]
+        .filter(product=OuterRef("pk"))
+        .order_by()
+        .values("product")
+    )
+    return products.annotate(
+        shard_stock_quantity=Coalesce(
+            Subquery(shards.annotate(total=Sum("stock_quantity")).values("total")),
+            Value(0),
+        ),
+        shard_reserved_quantity=Coalesce(
+            Subquery(shards.annotate(total=Sum("reserved_quantity")).values("total")),
+            Value(0),
+        ),
+    )
+
+
+def get_unbalanced_sharded_products(
+    *,
+    company: Company,
+    min_spread: int,
+) -> QuerySet[Product]:
+    """
+    The company's sharded products whose shards' unreserved stock differs
+    by more than `min_spread` units between the fullest and the emptiest,
+    found with one aggregate query and without locking anything.
+    """
+    available = F("stock_shards__stock_quantity") - F("stock_shards__reserved_quantity")
+    return (
+        Product.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+        .filter(stock_shard_count__gt=0)
+        .alias(spread=Max(available) - Min(available))
+        .filter(spread__gt=min_spread)
+    )
+
+
+def get_inventory_movements(
+    *,
+    product: Product,
+    start: dt.datetime | None = None,
+    end: dt.datetime | None = None,
+) -> QuerySet[InventoryMovement]:
+    """
+    Audit trail of a product's stock changes in [start, end], oldest first.
+    Served by the (product, created_at) index.
+    """
+    movements = InventoryMovement.objects.for_tenant(product.company).filter(  # pyright: ignore[reportAttributeAccessIssue]
+        product=product,
+    )
+    if start is not None:
+        movements = movements.filter(created_at__gte=start)
+    if end is not None:
+        movements = movements.filter(created_at__lte=end)
+    return movements.order_by("created_at", "pk")
+
+
+def get_stock_at(*, product: Product, at: dt.datetime) -> int:
+    """
+    The product's stock_quantity at time `at`: the latest snapshot taken
+    before it plus the ledger entries recorded after that snapshot. Only
+    the movements since one snapshot are summed, however long the history.
+    """
+    company = product.company
+    snapshot = (
+        InventorySnapshot.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+        .filter(product=product, taken_at__lte=at)
+        .order_by("-taken_at", "-pk")
+        .first()
+    )
+    movements = InventoryMovement.objects.for_tenant(company).filter(  # pyright: ignore[reportAttributeAccessIssue]
+        product=product,
+        created_at__lte=at,
+    )
+    stock = 0
+    if snapshot is not None:
+        movements = movements.filter(pk__gt=snapshot.last_movement_id)
+        stock = snapshot.stock_quantity
+    return stock + (movements.aggregate(total=Sum("quantity_change"))["total"] or 0)
+
+
+def get_products_with_ledger_stock(*, company: Company) -> QuerySet[Product]:
+    """
+    Annotates each of the company's products with `ledger_stock`, the stock
+    implied by its latest snapshot plus the movements recorded after it, and
+    `last_movement_id`, the newest ledger entry. Shard sums are annotated too.
+    """
+    snapshots = (
+        InventorySnapshot.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+        .filter(product=OuterRef("pk"))
+        .order_by("-taken_at", "-pk")
+    )
+    movements = InventoryMovement.objects.for_tenant(company).filter(  # pyright: ignore[reportAttributeAccessIssue]
+        product=OuterRef("pk"),
+    )
+    movements_since_snapshot = (
+        movements.filter(pk__gt=OuterRef("snapshot_movement_id"))
+        .order_by()
+        .values("product")
+        .annotate(total=Sum("quantity_change"))
+        .values("total")
+    )
+    return (
+        annotate_stock_totals(Product.objects.for_tenant(company))  # pyright: ignore[reportAttributeAccessIssue]
+        .annotate(
+            snapshot_movement_id=Coalesce(
+                Subquery(snapshots.values("last_movement_id")[:1]),
+                Value(0),
+                output_field=BigIntegerField(),
+            ),
+            last_movement_id=Subquery(movements.order_by("-pk").values("pk")[:1]),
+        )
+        .annotate(
+            ledger_stock=Coalesce(
+                Subquery(snapshots.values("stock_quantity")[:1]),
+                Value(0),
+            )
+            + Coalesce(Subquery(movements_since_snapshot), Value(0)),
+        )
+        .order_by("pk")
+    )
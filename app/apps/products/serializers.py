@@ -4,6 +4,16 @@ from .models import Product
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    # Totals over the product row and its stock shards
+    stock_quantity = serializers.IntegerField(
+        source="total_stock_quantity",
+        read_only=True,
+    )
+    reserved_quantity = serializers.IntegerField(
+        source="total_reserved_quantity",
+        read_only=True,
+    )
+
     class Meta:
         model = Product
-        fields = ["name", "sku", "stock_quantity", "is_active"]
+        fields = ["name", "sku", "stock_quantity", "reserved_quantity", "is_active"]  # noqa: RUF012
@@ -1,19 +1,38 @@
+import random
 from typing import NotRequired, TypedDict, Unpack
 
+from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import QuerySet
+from django.db.models import F, QuerySet
+from django.utils import timezone
 
 from apps.companies.models import Company
 
-from .models import Product
+from .availability import refresh_product_availability
+from .models import InventoryMovement, InventorySnapshot, Product, ProductStockShard
+from .selectors import get_products_with_ledger_stock
+from .signals import stock_added
+
+# Random shards a sharded decrement tries before locking all of them
+SHARD_ATTEMPTS = 2
 
 
 class ProductData(TypedDict):
     name: str
     stock_quantity: int
     is_active: NotRequired[bool]
+    stock_shard_count: NotRequired[int]
+    backorders_enabled: NotRequired[bool]
+
 
+class MovementData(TypedDict):
+    product: Product
+    quantity_change: int
+    reason: str
+    reference: NotRequired[str]
 
+
+@transaction.atomic
 def create_product_service(*, company: Company, **data: Unpack[ProductData]) -> Product:
     """
     Creates a new product for a specific company.
@@ -22,10 +41,24 @@ def create_product_service(*, company: Company, **data: Unpack[ProductData]) ->
         name=data["name"],
         stock_quantity=data["stock_quantity"],
         is_active=data.get("is_active", True),
+        backorders_enabled=data.get("backorders_enabled", False),
         company=company,
     )
     product.full_clean()
     product.save()
+    if product.stock_quantity:
+        record_inventory_movements_service(
+            company=company,
+            movements=[
+                {
+                    "product": product,
+                    "quantity_change": product.stock_quantity,
+                    "reason": InventoryMovement.Reason.OPENING_BALANCE,
+                },
+            ],
+        )
+    if data.get("stock_shard_count"):
+        _redistribute_stock(product=product, shard_count=data["stock_shard_count"])
     return product
 
 
@@ -36,44 +69,471 @@ def update_product_service(
     **data: Unpack[ProductData],
 ) -> Product:
     """
-    Updates an existing product's details.
+    Updates an existing product's details. stock_quantity is the new total
+    stock, wherever it is stored, and may not be less than the quantity
+    reserved by pending orders.
     """
     product.name = data.get("name", product.name)  # pyright: ignore[reportAttributeAccessIssue]
     product.is_active = data.get("is_active", product.is_active)  # pyright: ignore[reportAttributeAccessIssue]
-    product.stock_quantity = data.get("stock_quantity", product.stock_quantity)
+    product.backorders_enabled = data.get(  # pyright: ignore[reportAttributeAccessIssue]
+        "backorders_enabled",
+        product.backorders_enabled,
+    )
 
     product.full_clean()
-    product.save()
+    product.save(update_fields=["name", "is_active", "backorders_enabled"])
+    # Leave reserved_quantity alone, it is maintained by concurrent orders
+    previous_stock = _redistribute_stock(
+        product=product,
+        shard_count=data.get("stock_shard_count", product.stock_shard_count),
+        stock_quantity=data.get("stock_quantity"),
+    )
+    new_stock = data.get("stock_quantity", previous_stock)
+    if new_stock != previous_stock:
+        record_inventory_movements_service(
+            company=product.company,
+            movements=[
+                {
+                    "product": product,
+                    "quantity_change": new_stock - previous_stock,
+                    "reason": InventoryMovement.Reason.ADJUSTMENT,
+                },
+            ],
+        )
+    if new_stock > previous_stock:
+        stock_added.send(
+            sender=Product,
+            product=product,
+            quantity=new_stock - previous_stock,
+        )
+    refresh_product_availability([product.pk])
 
     return product
 
 
 def activate_products_service(*, products_qs: QuerySet[Product]) -> None:
+    product_ids = list(products_qs.values_list("pk", flat=True))
     products_qs.update(is_active=True)
+    refresh_product_availability(product_ids)
 
 
 def deactivate_products_service(*, products_qs: QuerySet[Product]) -> None:
+    product_ids = list(products_qs.values_list("pk", flat=True))
     products_qs.update(is_active=False)
+    refresh_product_availability(product_ids)
 
 
 @transaction.atomic
-def adjust_product_stock_service(*, product: Product, quantity_change: int) -> Product:
+def adjust_product_stock_service(
+    *,
+    product: Product,
+    quantity_change: int,
+    reason: str = InventoryMovement.Reason.ADJUSTMENT,
+    reference: str = "",
+    record_movement: bool = True,
+) -> Product:
     """
     Adjusts a product's stock quantity.
-    quantity_change can be positive or negative.
+    quantity_change can be positive or negative. Added stock is announced
+    with the `stock_added` signal.
+
+    The check and the write happen in one conditional UPDATE, so no row lock
+    is held between reading and writing the stock. Reserved units cannot be
+    removed. The returned product reloads its stock fields from the database
+    the next time they are accessed.
+
+    The change is written to the inventory ledger unless `record_movement`
+    is False, in which case the caller must record it in the same transaction.
+    """
+    if quantity_change < 0:
+        available = _take_available_stock(
+            product=product,
+            quantity=-quantity_change,
+            column="stock_quantity",
+        )
+        if available is not None:
+            msg = (
+                f"Cannot remove {abs(quantity_change)} items; "
+                f"only {available} are in stock."
+            )
+            raise ValueError(msg)
+    else:
+        _change_stock_counters(product=product, stock=quantity_change)
+        if quantity_change:
+            stock_added.send(sender=Product, product=product, quantity=quantity_change)
+
+    if record_movement:
+        record_inventory_movements_service(
+            company=product.company,
+            movements=[
+                {
+                    "product": product,
+                    "quantity_change": quantity_change,
+                    "reason": reason,
+                    "reference": reference,
+                },
+            ],
+        )
+    _expire_stock_fields(product)
+    refresh_product_availability([product.pk])
+    return product
+
+
+@transaction.atomic
+def reserve_product_stock_service(*, product: Product, quantity: int) -> None:
+    """
+    Reserves `quantity` units for an accepted order with one conditional
+    UPDATE. Raises ValueError if the product is inactive or not enough
+    unreserved stock is left.
+    """
+    if not product.is_active:
+        msg = "The product is not available."
+        raise ValueError(msg)
+    available = _take_available_stock(
+        product=product,
+        quantity=quantity,
+        column="reserved_quantity",
+    )
+    if available is not None:
+        msg = f"Cannot reserve {quantity} items; only {available} are available."
+        raise ValueError(msg)
+
+    _expire_stock_fields(product)
+
+
+@transaction.atomic
+def commit_product_reservation_service(
+    *,
+    product: Product,
+    quantity: int,
+    reference: str = "",
+    record_movement: bool = True,
+) -> None:
+    """
+    Turns a reservation into a stock deduction when its order is approved.
+    """
+    _change_stock_counters(product=product, stock=-quantity, reserved=-quantity)
+    if record_movement:
+        record_inventory_movements_service(
+            company=product.company,
+            movements=[
+                {
+                    "product": product,
+                    "quantity_change": -quantity,
+                    "reason": InventoryMovement.Reason.ORDER_APPROVED,
+                    "reference": reference,
+                },
+            ],
+        )
+    _expire_stock_fields(product)
+
+
+def release_product_reservation_service(*, product: Product, quantity: int) -> None:
+    """
+    Gives reserved units back when their order fails. The units become
+    available again and are announced with the `stock_added` signal.
+    """
+    _change_stock_counters(product=product, reserved=-quantity)
+    if quantity:
+        stock_added.send(sender=Product, product=product, quantity=quantity)
+    _expire_stock_fields(product)
+    refresh_product_availability([product.pk])
+
+
+def set_product_stock_shards_service(*, product: Product, shard_count: int) -> None:
+    """
+    Switches a product between a single stock counter (shard_count 0) and
+    `shard_count` sharded counters. The total stock does not change.
+    """
+    with transaction.atomic():
+        _redistribute_stock(product=product, shard_count=shard_count)
+
+
+def rebalance_product_stock_shards_service(*, product: Product) -> None:
+    """
+    Spreads a sharded product's stock evenly over its shards again, so that
+    decrements keep finding a shard with enough stock on the first try.
+    """
+    with transaction.atomic():
+        _redistribute_stock(product=product)
+
+
+def _product_stock_shards(product: Product) -> QuerySet[ProductStockShard]:
+    return ProductStockShard.objects.for_tenant(product.company).filter(  # pyright: ignore[reportAttributeAccessIssue]
+        product=product,
+    )
+
+
+def _change_stock_counters(
+    *,
+    product: Product,
+    stock: int = 0,
+    reserved: int = 0,
+) -> None:
+    """
+    Applies a change that cannot run out of stock with one UPDATE: to a
+    random shard of a sharded product, else to the product row. The row
+    counts toward the totals in both modes, so it is also the fallback when
+    sharding was switched off meanwhile.
+    """
+    changes = {}
+    if stock:
+        changes["stock_quantity"] = F("stock_quantity") + stock
+    if reserved:
+        changes["reserved_quantity"] = F("reserved_quantity") + reserved
+    if not changes:
+        return
+
+    if product.stock_shard_count:
+        index = random.randrange(product.stock_shard_count)
+        if _product_stock_shards(product).filter(index=index).update(**changes):
+            return
+    updated = (
+        Product.objects.for_tenant(product.company)  # pyright: ignore[reportAttributeAccessIssue]
+        .filter(pk=product.pk)
+        .update(**changes)
+    )
+    if not updated:
+        raise Product.DoesNotExist
+
+
+def _take_available_stock(
+    *,
+    product: Product,
+    quantity: int,
+    column: str,
+) -> int | None:
+    """
+    Takes `quantity` unreserved units by lowering stock_quantity or raising
+    reserved_quantity (`column`) with conditional UPDATEs, so unreserved
+    stock never goes negative. Returns None on success, or the number of
+    units that were available when there are not enough.
+
+    Sharded products try a couple of random shards first and only lock all
+    shards to take the units from several of them when that fails.
+    """
+    sign = -1 if column == "stock_quantity" else 1
+
+    def take(amount: int) -> dict[str, F]:
+        return {column: F(column) + sign * amount}
+
+    if not product.stock_shard_count:
+        products = Product.objects.for_tenant(product.company).filter(pk=product.pk)  # pyright: ignore[reportAttributeAccessIssue]
+        if products.filter(
+            stock_quantity__gte=F("reserved_quantity") + quantity,
+        ).update(**take(quantity)):
+            return None
+        # Raises DoesNotExist if the product does not exist for this tenant
+        in_stock, reserved = products.values_list(
+            "stock_quantity",
+            "reserved_quantity",
+        ).get()
+        return in_stock - reserved
+
+    shards = _product_stock_shards(product)
+    attempts = min(SHARD_ATTEMPTS, product.stock_shard_count)
+    for index in random.sample(range(product.stock_shard_count), attempts):
+        if shards.filter(
+            index=index,
+            stock_quantity__gte=F("reserved_quantity") + quantity,
+        ).update(**take(quantity)):
+            return None
+
+    locked = list(shards.select_for_update().order_by("index"))
+    available = {
+        shard.pk: shard.stock_quantity - shard.reserved_quantity
+        for shard in locked
+        if shard.stock_quantity > shard.reserved_quantity
+    }
+    if sum(available.values()) < quantity:
+        return sum(available.values())
+    remaining = quantity
+    for pk, shard_available in available.items():
+        amount = min(remaining, shard_available)
+        shards.filter(pk=pk).update(**take(amount))
+        remaining -= amount
+        if not remaining:
+            break
+    return None
+
+
+def _split_evenly(total: int, parts: int) -> list[int]:
+    base, extra = divmod(total, parts)
+    return [base + (index < extra) for index in range(parts)]
+
+
+def _redistribute_stock(
+    *,
+    product: Product,
+    shard_count: int | None = None,
+    stock_quantity: int | None = None,
+) -> int:
+    """
+    Locks the product row and its shards and stores the product's stock
+    either on the row (shard_count 0) or spread evenly over `shard_count`
+    shards, keeping the current shard count when it is None. The total
+    stock is replaced by `stock_quantity` when given; a ValidationError is
+    raised if that is less than the quantity reserved.
+    Returns the total stock from before the call.
     """
     company = product.company
-    # Lock the product row to prevent race conditions
-    product_to_update = (
-        Product.objects.for_tenant(company).select_for_update().get(pk=product.pk)
+    locked = (
+        Product.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+        .select_for_update()
+        .get(pk=product.pk)
     )
+    if shard_count is None:
+        shard_count = locked.stock_shard_count
+    shards = list(
+        _product_stock_shards(product).select_for_update().order_by("index"),
+    )
+    previous_stock = locked.stock_quantity + sum(
+        shard.stock_quantity for shard in shards
+    )
+    total_stock = previous_stock if stock_quantity is None else stock_quantity
+    total_reserved = locked.reserved_quantity + sum(
+        shard.reserved_quantity for shard in shards
+    )
+    if total_stock < total_reserved:
+        msg = (
+            f"The stock of {locked} cannot be set below the {total_reserved} "
+            "items reserved by pending orders."
+        )
+        raise ValidationError({"stock_quantity": msg})
+
+    if shard_count:
+        reserved = _split_evenly(total_reserved, shard_count)
+        available = _split_evenly(total_stock - total_reserved, shard_count)
+        if len(shards) != shard_count:
+            _product_stock_shards(product).delete()
+            shards = [
+                ProductStockShard(product=product, company=company, index=index)
+                for index in range(shard_count)
+            ]
+            create = True
+        else:
+            create = False
+        for shard in shards:
+            shard.reserved_quantity = reserved[shard.index]
+            shard.stock_quantity = available[shard.index] + reserved[shard.index]
+        if create:
+            ProductStockShard.objects.bulk_create(shards)
+        else:
+            ProductStockShard.objects.bulk_update(
+                shards,
+                ["stock_quantity", "reserved_quantity"],
+            )
+        row_stock = row_reserved = 0
+    else:
+        _product_stock_shards(product).delete()
+        row_stock, row_reserved = total_stock, total_reserved
+
+    Product.objects.for_tenant(company).filter(pk=product.pk).update(  # pyright: ignore[reportAttributeAccessIssue]
+        stock_quantity=row_stock,
+        reserved_quantity=row_reserved,
+        stock_shard_count=shard_count,
+    )
+    product.stock_shard_count = shard_count
+    _expire_stock_fields(product)
+    return previous_stock
 
-    if quantity_change < 0 and product_to_update.stock_quantity < abs(quantity_change):
-        raise ValueError(
-            f"Cannot remove {abs(quantity_change)} items; only {product_to_update.stock_quantity} are in stock."
+
+def record_inventory_movements_service(
+    *,
+    company: Company,
+    movements: list[MovementData],
+) -> list[InventoryMovement]:
+    """
+    Appends entries to the inventory ledger with a single INSERT. Must run in
+    the transaction that changes the stock, so the two never disagree.
+    """
+    return InventoryMovement.objects.bulk_create(
+        InventoryMovement(
+            product=movement["product"],
+            company=company,
+            quantity_change=movement["quantity_change"],
+            reason=movement["reason"],
+            reference=movement.get("reference", ""),
         )
+        for movement in movements
+    )
+
+
+def _locked_ledger_stock(*, company: Company, product_id: int) -> Product:
+    """
+    Locks one product row and its shards, which blocks until the product's
+    in-flight stock changes commit, and reads its ledger stock in a fresh
+    statement. Must run in a transaction; only this product is locked.
+    """
+    Product.objects.for_tenant(company).select_for_update().filter(  # pyright: ignore[reportAttributeAccessIssue]
+        pk=product_id,
+    ).values_list("pk", flat=True).get()
+    list(
+        ProductStockShard.objects.for_tenant(company)  # pyright: ignore[reportAttributeAccessIssue]
+        .select_for_update()
+        .filter(product_id=product_id)
+        .order_by("index")
+        .values_list("pk", flat=True),
+    )
+    return get_products_with_ledger_stock(company=company).get(pk=product_id)
+
+
+def take_inventory_snapshots_service(*, company: Company) -> list[InventorySnapshot]:
+    """
+    Snapshots the ledger stock of every company product that has moved since
+    its last snapshot, so later stock-at-time queries start from there.
+    The products that moved are found without locks, then each is locked
+    and snapshotted on its own, so stock changes of the others go on.
+    """
+    moved = [
+        product.pk
+        for product in get_products_with_ledger_stock(company=company)
+        if product.last_movement_id is not None
+        and product.last_movement_id != product.snapshot_movement_id
+    ]
+    snapshots: list[InventorySnapshot] = []
+    for product_id in moved:
+        with transaction.atomic():
+            product = _locked_ledger_stock(company=company, product_id=product_id)
+            snapshots.append(
+                InventorySnapshot.objects.create(
+                    product=product,
+                    company=company,
+                    stock_quantity=product.ledger_stock,
+                    last_movement_id=product.last_movement_id,
+                    taken_at=timezone.now(),
+                ),
+            )
+    return snapshots
+
+
+def reconcile_inventory_service(*, company: Company) -> list[Product]:
+    """
+    Returns the company products whose stock_quantity differs from their
+    latest snapshot plus the ledger entries recorded after it. Products
+    that differ in a read without locks are checked again, one at a time,
+    under their own lock, so changes still in flight are not reported.
+    """
+    suspects = [
+        product.pk
+        for product in get_products_with_ledger_stock(company=company)
+        if product.ledger_stock != product.total_stock_quantity
+    ]
+    mismatched: list[Product] = []
+    for product_id in suspects:
+        with transaction.atomic():
+            product = _locked_ledger_stock(company=company, product_id=product_id)
+        if product.ledger_stock != product.total_stock_quantity:
+            mismatched.append(product)
+    return mismatched
 
-    product_to_update.stock_quantity += quantity_change
-    product_to_update.save()
 
-    return product_to_update
+def _expire_stock_fields(product: Product) -> None:
+    # Deferred fields are loaded again on next access
+    for field in (
+        "stock_quantity",
+        "reserved_quantity",
+        "shard_stock_quantity",
+        "shard_reserved_quantity",
+    ):
+        product.__dict__.pop(field, None)
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent with `product` and `quantity` when units of a product become
+# available, because stock was added or a reservation released, inside the
+# transaction that frees them
+stock_added = Signal()
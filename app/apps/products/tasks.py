@@ -0,0 +1,67 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+
+from apps.companies.models import Company
+
+from .selectors import get_unbalanced_sharded_products
+from .services import (
+    rebalance_product_stock_shards_service,
+    reconcile_inventory_service,
+    take_inventory_snapshots_service,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def take_inventory_snapshots_task() -> int:
+    """
+    Periodic task that snapshots the stock of every product that moved since
+    its last snapshot. Returns the number of snapshots taken.
+    """
+    taken = 0
+    for company in Company.objects.order_by("pk"):
+        taken += len(take_inventory_snapshots_service(company=company))
+    logger.info("Took %d inventory snapshots.", taken)
+    return taken
+
+
+@shared_task
+def reconcile_inventory_task() -> list[int]:
+    """
+    Periodic task that checks snapshot plus ledger equals stock_quantity for
+    every product. Returns the ids of the products that do not match.
+    """
+    mismatched: list[int] = []
+    for company in Company.objects.order_by("pk"):
+        for product in reconcile_inventory_service(company=company):
+            logger.error(
+                "Inventory mismatch for product %s: stock is %s, ledger says %s.",
+                product.pk,
+                product.total_stock_quantity,
+                product.ledger_stock,
+            )
+            mismatched.append(product.pk)
+    return mismatched
+
+
+@shared_task
+def rebalance_stock_shards_task() -> int:
+    """
+    Periodic task that spreads the stock of the sharded products whose
+    shards drifted apart by more than STOCK_SHARD_REBALANCE_MIN_SPREAD units
+    evenly over their shards again; balanced products are not locked.
+    Returns the number of products rebalanced.
+    """
+    rebalanced = 0
+    for company in Company.objects.order_by("pk"):
+        unbalanced = get_unbalanced_sharded_products(
+            company=company,
+            min_spread=settings.STOCK_SHARD_REBALANCE_MIN_SPREAD,
+        )
+        for product in unbalanced.order_by("pk"):
+            rebalance_product_stock_shards_service(product=product)
+            rebalanced += 1
+    return rebalanced
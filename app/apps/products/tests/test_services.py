@@ -1,13 +1,24 @@
 import pytest
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from apps.companies.models import Company
 
-from ..models import Product
+from ..availability import ProductAvailability, get_product_availability
+from ..models import InventoryMovement, Product, ProductStockShard
 from ..services import (
     ProductData,
     activate_products_service,
+    adjust_product_stock_service,
+    commit_product_reservation_service,
     create_product_service,
     deactivate_products_service,
+    rebalance_product_stock_shards_service,
+    release_product_reservation_service,
+    reserve_product_stock_service,
+    set_product_stock_shards_service,
     update_product_service,
 )
 
@@ -61,3 +72,220 @@ def test_update_product_service(product: Product):
     assert product.stock_quantity == 75
     assert product.is_active is False
     assert updated_product == product
+
+
+@pytest.mark.django_db
+def test_update_product_service_keeps_reserved_stock(product: Product):
+    reserve_product_stock_service(product=product, quantity=30)
+
+    with pytest.raises(ValidationError, match="30 items reserved"):
+        update_product_service(product=product, name=product.name, stock_quantity=29)
+
+    product.refresh_from_db()
+    assert product.stock_quantity == 100
+    update_product_service(product=product, name=product.name, stock_quantity=30)
+    product.refresh_from_db()
+    assert (product.stock_quantity, product.available_quantity) == (30, 0)
+
+
+@pytest.mark.django_db
+def test_adjust_product_stock_service_uses_single_update(product: Product):
+    with CaptureQueriesContext(connection) as queries:
+        adjust_product_stock_service(product=product, quantity_change=-30)
+
+    statements = [
+        query["sql"]
+        for query in queries.captured_queries
+        if "SAVEPOINT" not in query["sql"]
+    ]
+    # The stock change and its ledger entry
+    assert len(statements) == 2
+    assert statements[0].startswith("UPDATE")
+    assert statements[1].startswith("INSERT")
+    assert product.stock_quantity == 70
+
+
+@pytest.mark.django_db
+def test_adjust_product_stock_service_insufficient_stock(product: Product):
+    with pytest.raises(ValueError, match="Cannot remove 101 items; only 100"):
+        adjust_product_stock_service(product=product, quantity_change=-101)
+
+    product.refresh_from_db()
+    assert product.stock_quantity == 100
+
+
+@pytest.mark.django_db
+def test_adjust_product_stock_service_other_tenant(product: Product, company_b):
+    product.company = company_b
+
+    with pytest.raises(Product.DoesNotExist):
+        adjust_product_stock_service(product=product, quantity_change=5)
+
+
+@pytest.mark.django_db
+def test_reservation_lifecycle(product: Product):
+    reserve_product_stock_service(product=product, quantity=70)
+    assert (product.stock_quantity, product.reserved_quantity) == (100, 70)
+
+    with pytest.raises(ValueError, match="only 30 are available"):
+        reserve_product_stock_service(product=product, quantity=31)
+    # Reserved units cannot be removed by a plain adjustment either
+    with pytest.raises(ValueError, match="only 30 are in stock"):
+        adjust_product_stock_service(product=product, quantity_change=-31)
+
+    commit_product_reservation_service(product=product, quantity=50)
+    assert (product.stock_quantity, product.reserved_quantity) == (50, 20)
+
+    release_product_reservation_service(product=product, quantity=20)
+    assert (product.stock_quantity, product.reserved_quantity) == (50, 0)
+
+
+@pytest.mark.django_db
+def test_stock_changes_are_recorded_in_ledger(product: Product):
+    update_product_service(product=product, name=product.name, stock_quantity=120)
+    adjust_product_stock_service(product=product, quantity_change=-15)
+    reserve_product_stock_service(product=product, quantity=5)
+    commit_product_reservation_service(product=product, quantity=5, reference="X1")
+    with pytest.raises(ValueError, match="Cannot remove 500 items"):
+        adjust_product_stock_service(product=product, quantity_change=-500)
+
+    ledger = InventoryMovement.objects.for_tenant(product.company).order_by("pk")  # pyright: ignore[reportAttributeAccessIssue]
+    assert list(ledger.values_list("reason", "quantity_change", "reference")) == [
+        (InventoryMovement.Reason.OPENING_BALANCE, 100, ""),
+        (InventoryMovement.Reason.ADJUSTMENT, 20, ""),
+        (InventoryMovement.Reason.ADJUSTMENT, -15, ""),
+        (InventoryMovement.Reason.ORDER_APPROVED, -5, "X1"),
+    ]
+    assert sum(ledger.values_list("quantity_change", flat=True)) == 100
+
+
+@pytest.mark.django_db
+def test_inventory_movements_are_append_only(product: Product):
+    movement = InventoryMovement.objects.for_tenant(product.company).get()  # pyright: ignore[reportAttributeAccessIssue]
+    movement.quantity_change = 0
+
+    with pytest.raises(ValueError, match="append-only"):
+        movement.save()
+    with pytest.raises(ValueError, match="append-only"):
+        movement.delete()
+
+
+def shard_counters(product: Product) -> list[tuple[int, int]]:
+    return list(
+        ProductStockShard.objects.for_tenant(product.company)  # pyright: ignore[reportAttributeAccessIssue]
+        .filter(product=product)
+        .order_by("index")
+        .values_list("stock_quantity", "reserved_quantity"),
+    )
+
+
+@pytest.mark.django_db
+def test_set_product_stock_shards_service(product: Product):
+    reserve_product_stock_service(product=product, quantity=10)
+
+    set_product_stock_shards_service(product=product, shard_count=4)
+
+    product.refresh_from_db()
+    assert (product.stock_quantity, product.reserved_quantity) == (0, 0)
+    assert shard_counters(product) == [(26, 3), (26, 3), (24, 2), (24, 2)]
+    assert product.total_stock_quantity == 100
+    assert product.total_reserved_quantity == 10
+
+    set_product_stock_shards_service(product=product, shard_count=0)
+
+    product.refresh_from_db()
+    assert (product.stock_quantity, product.reserved_quantity) == (100, 10)
+    assert shard_counters(product) == []
+
+
+@pytest.mark.django_db
+def test_sharded_stock_changes(product: Product):
+    set_product_stock_shards_service(product=product, shard_count=4)
+
+    reserve_product_stock_service(product=product, quantity=5)
+    commit_product_reservation_service(product=product, quantity=5)
+    reserve_product_stock_service(product=product, quantity=7)
+    release_product_reservation_service(product=product, quantity=7)
+    adjust_product_stock_service(product=product, quantity_change=-20)
+    adjust_product_stock_service(product=product, quantity_change=3)
+
+    assert product.total_stock_quantity == 78
+    assert product.total_reserved_quantity == 0
+    # Every shard keeps a non-negative unreserved stock
+    assert all(stock >= reserved for stock, reserved in shard_counters(product))
+
+
+@pytest.mark.django_db
+def test_sharded_decrement_spans_shards_when_needed(product: Product):
+    set_product_stock_shards_service(product=product, shard_count=4)
+
+    # No single shard holds 90 units, so they are taken from several
+    adjust_product_stock_service(product=product, quantity_change=-90)
+    assert product.total_stock_quantity == 10
+
+    with pytest.raises(ValueError, match="Cannot reserve 11 items; only 10"):
+        reserve_product_stock_service(product=product, quantity=11)
+    with pytest.raises(ValueError, match="Cannot remove 11 items; only 10"):
+        adjust_product_stock_service(product=product, quantity_change=-11)
+
+
+@pytest.mark.django_db
+def test_update_sharded_product_sets_total_stock(product: Product):
+    set_product_stock_shards_service(product=product, shard_count=2)
+
+    update_product_service(product=product, name=product.name, stock_quantity=40)
+
+    assert shard_counters(product) == [(20, 0), (20, 0)]
+    ledger = InventoryMovement.objects.for_tenant(product.company)  # pyright: ignore[reportAttributeAccessIssue]
+    assert ledger.latest("pk").quantity_change == -60
+
+
+@pytest.mark.django_db
+def test_rebalance_product_stock_shards_service(product: Product):
+    set_product_stock_shards_service(product=product, shard_count=2)
+    ProductStockShard.objects.for_tenant(product.company).filter(  # pyright: ignore[reportAttributeAccessIssue]
+        product=product,
+        index=0,
+    ).update(stock_quantity=90, reserved_quantity=4)
+    ProductStockShard.objects.for_tenant(product.company).filter(  # pyright: ignore[reportAttributeAccessIssue]
+        product=product,
+        index=1,
+    ).update(stock_quantity=10, reserved_quantity=0)
+
+    rebalance_product_stock_shards_service(product=product)
+
+    assert shard_counters(product) == [(50, 2), (50, 2)]
+
+
+@pytest.mark.django_db
+def test_product_availability_is_kept_current(
+    product: Product,
+    django_capture_on_commit_callbacks,
+):
+    cache.clear()
+    products = Product.objects.for_tenant(product.company).filter(pk=product.pk)  # pyright: ignore[reportAttributeAccessIssue]
+    assert get_product_availability(product=product) == ProductAvailability(
+        is_active=True,
+        available=100,
+    )
+
+    # Reservations leave the entry alone; it only gets optimistic
+    reserve_product_stock_service(product=product, quantity=30)
+    assert get_product_availability(product=product).available == 100
+
+    with django_capture_on_commit_callbacks(execute=True):
+        adjust_product_stock_service(product=product, quantity_change=-50)
+    assert get_product_availability(product=product).available == 20
+
+    with django_capture_on_commit_callbacks(execute=True):
+        release_product_reservation_service(product=product, quantity=30)
+    assert get_product_availability(product=product).available == 50
+
+    with django_capture_on_commit_callbacks(execute=True):
+        deactivate_products_service(products_qs=products)
+    assert not get_product_availability(product=product).is_active
+
+    with django_capture_on_commit_callbacks(execute=True):
+        activate_products_service(products_qs=products)
+        update_product_service(product=product, name=product.name, stock_quantity=80)
+    assert get_product_availability(product=product) == (True, 80)
@@ -0,0 +1,106 @@
+import datetime as dt
+
+import pytest
+from django.db.models import F
+from django.utils import timezone
+
+from apps.companies.models import Company
+
+from ..models import InventoryMovement, InventorySnapshot, Product, ProductStockShard
+from ..selectors import get_inventory_movements, get_stock_at
+from ..services import adjust_product_stock_service, set_product_stock_shards_service
+from ..tasks import (
+    rebalance_stock_shards_task,
+    reconcile_inventory_task,
+    take_inventory_snapshots_task,
+)
+
+
+@pytest.mark.django_db
+def test_take_inventory_snapshots_task(products, company: Company):
+    assert take_inventory_snapshots_task() == 5
+    # Nothing moved since, so no new snapshots are needed
+    assert take_inventory_snapshots_task() == 0
+
+    product = products.first()
+    adjust_product_stock_service(product=product, quantity_change=-10)
+
+    assert take_inventory_snapshots_task() == 1
+    snapshot = InventorySnapshot.objects.for_tenant(company).latest("pk")  # pyright: ignore[reportAttributeAccessIssue]
+    assert snapshot.product == product
+    assert snapshot.stock_quantity == 90
+
+
+@pytest.mark.django_db
+def test_get_stock_at(product: Product, mocker):
+    start = timezone.now()
+    times = [start + dt.timedelta(hours=hour) for hour in range(1, 5)]
+    now = mocker.patch("django.utils.timezone.now")
+
+    now.return_value = times[0]
+    adjust_product_stock_service(product=product, quantity_change=-10)
+    take_inventory_snapshots_task()
+    now.return_value = times[1]
+    adjust_product_stock_service(product=product, quantity_change=-20)
+    now.return_value = times[2]
+    adjust_product_stock_service(product=product, quantity_change=5)
+    take_inventory_snapshots_task()
+    now.return_value = times[3]
+    adjust_product_stock_service(product=product, quantity_change=-1)
+
+    assert get_stock_at(product=product, at=start) == 100
+    assert get_stock_at(product=product, at=times[0]) == 90
+    assert get_stock_at(product=product, at=times[1]) == 70
+    assert get_stock_at(product=product, at=times[2]) == 75
+    assert get_stock_at(product=product, at=times[3]) == 74
+    assert [
+        movement.quantity_change
+        for movement in get_inventory_movements(
+            product=product,
+            start=times[1],
+            end=times[2],
+        )
+    ] == [-20, 5]
+
+
+@pytest.mark.django_db
+def test_reconcile_inventory_task(products, company: Company):
+    take_inventory_snapshots_task()
+    product = products.first()
+    adjust_product_stock_service(product=product, quantity_change=7)
+    assert reconcile_inventory_task() == []
+
+    # A write that bypasses the services is caught
+    Product.objects.for_tenant(company).filter(pk=product.pk).update(  # pyright: ignore[reportAttributeAccessIssue]
+        stock_quantity=1,
+    )
+
+    assert reconcile_inventory_task() == [product.pk]
+    movements = InventoryMovement.objects.for_tenant(company).filter(product=product)  # pyright: ignore[reportAttributeAccessIssue]
+    assert movements.count() == 2
+
+
+@pytest.mark.django_db
+def test_reconcile_inventory_task_with_sharded_stock(products):
+    product = products.first()
+    set_product_stock_shards_service(product=product, shard_count=3)
+    adjust_product_stock_service(product=product, quantity_change=-10)
+    take_inventory_snapshots_task()
+    adjust_product_stock_service(product=product, quantity_change=-1)
+
+    assert reconcile_inventory_task() == []
+
+
+@pytest.mark.django_db
+def test_rebalance_stock_shards_task(products, company: Company):
+    balanced, drifted = products.order_by("pk")[:2]
+    set_product_stock_shards_service(product=balanced, shard_count=3)
+    set_product_stock_shards_service(product=drifted, shard_count=3)
+    shards = ProductStockShard.objects.for_tenant(company).filter(product=drifted)  # pyright: ignore[reportAttributeAccessIssue]
+    shards.filter(index=0).update(stock_quantity=F("stock_quantity") + 20)
+    shards.filter(index=1).update(stock_quantity=F("stock_quantity") - 20)
+
+    # Only the product whose shards drifted apart is rebalanced
+    assert rebalance_stock_shards_task() == 1
+    assert sorted(shards.values_list("stock_quantity", flat=True)) == [34, 34, 35]
+    assert rebalance_stock_shards_task() == 0
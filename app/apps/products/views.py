@@ -3,6 +3,7 @@ from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated, DjangoModelPermissions
 
 from .models import Product
+from .selectors import annotate_stock_totals
 from .serializers import ProductSerializer
 
 
@@ -17,4 +18,6 @@ class ProductListView(generics.ListAPIView):
         for the currently authenticated user's company.
         """
         user = self.request.user
-        return Product.objects.filter(company=user.profile.company)  # pyright: ignore[reportAttributeAccessIssue]
+        return annotate_stock_totals(
+            Product.objects.filter(company=user.profile.company),  # pyright: ignore[reportAttributeAccessIssue]
+        )
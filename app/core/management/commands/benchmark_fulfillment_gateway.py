@@ -0,0 +1,96 @@
+import statistics
+import time
+import uuid
+
+from apps.orders.fulfillment import (
+    AsyncFulfillmentGateway,
+    CircuitBreaker,
+    FakeFulfillmentBackend,
+    FulfillmentRequest,
+)
+from django.core.management.base import BaseCommand
+
+
+class TimedBackend:
+    """Wraps a backend and records the latency of every call."""
+
+    def __init__(self, backend: FakeFulfillmentBackend) -> None:
+        self.backend = backend
+        self.latencies: list[float] = []
+
+    async def fulfill(self, request: FulfillmentRequest) -> None:
+        started = time.perf_counter()
+        await self.backend.fulfill(request)
+        self.latencies.append(time.perf_counter() - started)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the asyncio fulfillment gateway against the fake backend. "
+        "No network or database is used."
+    )
+
+    def add_arguments(self, parser) -> None:  # noqa: ANN001
+        parser.add_argument("--calls", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=200)
+        parser.add_argument("--timeout", type=float, default=30.0)
+        parser.add_argument(
+            "--latency",
+            choices=["constant", "uniform", "lognormal"],
+            default="lognormal",
+        )
+        parser.add_argument("--median", type=float, default=0.05)
+        parser.add_argument("--sigma", type=float, default=0.5)
+        parser.add_argument("--failure-rate", type=float, default=0.0)
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options) -> None:  # noqa: ANN002, ANN003, ARG002
+        latency_options = {
+            "constant": {"seconds": options["median"]},
+            "uniform": {"low": 0.0, "high": options["median"] * 2},
+            "lognormal": {"median": options["median"], "sigma": options["sigma"]},
+        }[options["latency"]]
+        backend = TimedBackend(
+            FakeFulfillmentBackend(
+                latency=options["latency"],
+                latency_options=latency_options,
+                failure_rate=options["failure_rate"],
+                seed=options["seed"],
+            ),
+        )
+        gateway = AsyncFulfillmentGateway(
+            backend=backend,
+            max_concurrency=options["concurrency"],
+            timeout=options["timeout"],
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=options["calls"] + 1,
+                reset_timeout=0,
+            ),
+        )
+        requests = [
+            FulfillmentRequest(
+                order_id=index,
+                reference_code=uuid.uuid4(),
+                product_id=0,
+                quantity=1,
+            )
+            for index in range(options["calls"])
+        ]
+
+        started = time.perf_counter()
+        errors = gateway.fulfill_many_sync(requests)
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(backend.latencies)
+        p50 = statistics.median(latencies)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        throughput = len(requests) / elapsed
+        self.stdout.write(f"calls:           {len(requests):,}")
+        self.stdout.write(f"failures:        {sum(e is not None for e in errors):,}")
+        self.stdout.write(f"wall time:       {elapsed:.2f}s")
+        self.stdout.write(f"sequential time: {sum(latencies):.2f}s")
+        self.stdout.write(f"p50 latency:     {p50 * 1000:.1f}ms")
+        self.stdout.write(f"p99 latency:     {p99 * 1000:.1f}ms")
+        self.stdout.write(
+            self.style.SUCCESS(f"throughput:      {throughput:,.1f} calls/sec"),
+        )
@@ -0,0 +1,92 @@
+import time
+import uuid
+
+from apps.companies.services import create_company
+from apps.orders.models import Order
+from apps.orders.tasks import process_order_task, process_pending_orders_batch_task
+from apps.products.services import create_product_service
+from apps.users.roles import Role
+from apps.users.services import create_profile_service
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the throughput (orders/sec) of per-order processing against "
+        "batch processing. All data is rolled back when the command finishes."
+    )
+
+    def add_arguments(self, parser) -> None:  # noqa: ANN001
+        parser.add_argument("--orders", type=int, default=1000)
+        parser.add_argument("--products", type=int, default=5)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.ORDER_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options) -> None:  # noqa: ANN002, ANN003, ARG002
+        # The external call is not what is being measured
+        with override_settings(ORDER_EXTERNAL_CALL_SECONDS=0):
+            single = self._run(options, batched=False)
+            batched = self._run(options, batched=True)
+
+        self.stdout.write(f"per-order path: {single:,.1f} orders/sec")
+        self.stdout.write(f"batched path:   {batched:,.1f} orders/sec")
+        self.stdout.write(self.style.SUCCESS(f"speedup: {batched / single:.1f}x"))
+
+    def _run(self, options: dict, *, batched: bool) -> float:
+        with transaction.atomic():
+            company, order_ids = self._seed(options)
+
+            started = time.perf_counter()
+            if batched:
+                while process_pending_orders_batch_task(
+                    company_id=company.pk,
+                    batch_size=options["batch_size"],
+                ):
+                    pass
+            else:
+                for order_id in order_ids:
+                    process_order_task(order_id, company_id=company.pk)
+            elapsed = time.perf_counter() - started
+
+            transaction.set_rollback(True)
+
+        return len(order_ids) / elapsed
+
+    def _seed(self, options: dict) -> tuple:
+        suffix = uuid.uuid4().hex[:8]
+        company = create_company(name=f"bench {suffix}", domain=f"bench-{suffix}")
+        role, _ = Group.objects.get_or_create(name=Role.OPERATOR)
+        profile = create_profile_service(
+            email=f"bench-{suffix}@example.com",
+            password=uuid.uuid4().hex,
+            company=company,
+            role=role,
+            first_name="Bench",
+            last_name="Mark",
+        )
+        products = [
+            create_product_service(
+                company=company,
+                name=f"Bench {index}",
+                stock_quantity=options["orders"],
+            )
+            for index in range(options["products"])
+        ]
+        orders = Order.objects.bulk_create(
+            Order(
+                product=products[index % len(products)],
+                quantity=1,
+                created_by=profile,
+                company=company,
+                status=Order.Status.PENDING,
+            )
+            for index in range(options["orders"])
+        )
+        return company, [order.pk for order in orders]
@@ -0,0 +1,92 @@
+import threading
+import time
+import uuid
+from collections import Counter
+
+from apps.companies.services import create_company
+from apps.products.models import Product
+from apps.products.services import adjust_product_stock_service, create_product_service
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+
+
+def locked_adjustment(*, product: Product, quantity_change: int) -> None:
+    """The previous read-check-save implementation, kept for comparison."""
+    with transaction.atomic():
+        locked = (
+            Product.objects.for_tenant(product.company)  # pyright: ignore[reportAttributeAccessIssue]
+            .select_for_update()
+            .get(pk=product.pk)
+        )
+        if locked.stock_quantity < abs(quantity_change):
+            msg = "insufficient stock"
+            raise ValueError(msg)
+        locked.stock_quantity += quantity_change
+        locked.save()
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammers a single product from many threads and compares the "
+        "conditional-UPDATE stock adjustment with the select_for_update one. "
+        "Both should end at zero stock with exactly half of the adjustments "
+        "approved. Run it against PostgreSQL; the data is deleted afterwards."
+    )
+
+    def add_arguments(self, parser) -> None:  # noqa: ANN001
+        parser.add_argument("--threads", type=int, default=32)
+        parser.add_argument("--adjustments", type=int, default=200)
+
+    def handle(self, *args, **options) -> None:  # noqa: ANN002, ANN003, ARG002
+        suffix = uuid.uuid4().hex[:8]
+        company = create_company(name=f"bench {suffix}", domain=f"bench-{suffix}")
+        try:
+            for name, adjust in (
+                ("select_for_update", locked_adjustment),
+                ("conditional update", adjust_product_stock_service),
+            ):
+                self._run(name, adjust, company=company, options=options)
+        finally:
+            company.delete()
+
+    def _run(self, name: str, adjust, *, company, options: dict) -> None:  # noqa: ANN001
+        total = options["threads"] * options["adjustments"]
+        # Stock runs out halfway, so both outcomes are exercised
+        product = create_product_service(
+            company=company,
+            name=f"Hot SKU ({name})",
+            stock_quantity=total // 2,
+        )
+        outcomes: Counter[str] = Counter()
+        lock = threading.Lock()
+
+        def worker() -> None:
+            local: Counter[str] = Counter()
+            try:
+                for _ in range(options["adjustments"]):
+                    try:
+                        adjust(product=product, quantity_change=-1)
+                        local["approved"] += 1
+                    except ValueError:
+                        local["rejected"] += 1
+                    except DatabaseError:
+                        local["errors"] += 1
+            finally:
+                connection.close()
+                with lock:
+                    outcomes.update(local)
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        self.stdout.write(
+            f"{name:<20} {total / elapsed:>10,.1f} adjustments/sec "
+            f"({outcomes['approved']:,} approved, {outcomes['rejected']:,} rejected, "
+            f"{outcomes['errors']:,} errors, final stock {product.stock_quantity})",
+        )
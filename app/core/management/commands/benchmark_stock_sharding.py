@@ -0,0 +1,85 @@
+import threading
+import time
+import uuid
+from collections import Counter
+
+from apps.companies.services import create_company
+from apps.products.services import (
+    adjust_product_stock_service,
+    create_product_service,
+)
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures stock decrements/sec on one hot product from many threads "
+        "for several shard counts (0 means unsharded). Run it against "
+        "PostgreSQL, SQLite serializes all writes. The data is deleted afterwards."
+    )
+
+    def add_arguments(self, parser) -> None:  # noqa: ANN001
+        parser.add_argument("--threads", type=int, default=32)
+        parser.add_argument("--adjustments", type=int, default=200)
+        parser.add_argument(
+            "--shards",
+            type=int,
+            nargs="+",
+            default=[0, 1, 2, 4, 8, 16],
+        )
+
+    def handle(self, *args, **options) -> None:  # noqa: ANN002, ANN003, ARG002
+        suffix = uuid.uuid4().hex[:8]
+        company = create_company(name=f"bench {suffix}", domain=f"bench-{suffix}")
+        try:
+            baseline = None
+            for shard_count in options["shards"]:
+                throughput = self._run(shard_count, company=company, options=options)
+                baseline = baseline or throughput
+                self.stdout.write(
+                    f"{shard_count:>3} shards {throughput:>10,.1f} adjustments/sec "
+                    f"({throughput / baseline:.1f}x)",
+                )
+        finally:
+            company.delete()
+
+    def _run(self, shard_count: int, *, company, options: dict) -> float:  # noqa: ANN001
+        total = options["threads"] * options["adjustments"]
+        product = create_product_service(
+            company=company,
+            name=f"Hot SKU ({shard_count} shards)",
+            stock_quantity=total,
+            stock_shard_count=shard_count,
+        )
+        outcomes: Counter[str] = Counter()
+        lock = threading.Lock()
+
+        def worker() -> None:
+            local: Counter[str] = Counter()
+            try:
+                for _ in range(options["adjustments"]):
+                    try:
+                        adjust_product_stock_service(
+                            product=product,
+                            quantity_change=-1,
+                        )
+                        local["approved"] += 1
+                    except (ValueError, DatabaseError):
+                        local["errors"] += 1
+            finally:
+                connection.close()
+                with lock:
+                    outcomes.update(local)
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if outcomes["errors"]:
+            self.stderr.write(f"{outcomes['errors']:,} adjustments failed")
+        return outcomes["approved"] / elapsed
@@ -0,0 +1,45 @@
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently as PostgresAddIndexConcurrently,
+)
+from django.db.migrations.operations import AddIndex
+
+
+class AddIndexConcurrently(PostgresAddIndexConcurrently):
+    """
+    Builds the index with CREATE INDEX CONCURRENTLY on PostgreSQL, so writes
+    to a large table go on while it is built, and with a plain AddIndex on
+    the SQLite database used in development and tests. Migrations using it
+    must set `atomic = False`.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):  # noqa: ANN001, ANN201
+        if schema_editor.connection.vendor == "postgresql":
+            return super().database_forwards(
+                app_label,
+                schema_editor,
+                from_state,
+                to_state,
+            )
+        return AddIndex.database_forwards(
+            self,
+            app_label,
+            schema_editor,
+            from_state,
+            to_state,
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):  # noqa: ANN001, ANN201
+        if schema_editor.connection.vendor == "postgresql":
+            return super().database_backwards(
+                app_label,
+                schema_editor,
+                from_state,
+                to_state,
+            )
+        return AddIndex.database_backwards(
+            self,
+            app_label,
+            schema_editor,
+            from_state,
+            to_state,
+        )
@@ -160,10 +160,219 @@ REDIS_PORT = config("REDIS_PORT", default="6379", cast=int)
 CELERY_BROKER_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
 CELERY_RESULT_BACKEND = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
 
+# --- Cache ---
+# Shared by all web and worker processes, e.g. for the order rate limits
+if config("ENVIRONMENT") == "TESTING":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/1",
+        },
+    }
+
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 
+CELERY_BEAT_SCHEDULE = {
+    "relay-outbox": {
+        "task": "apps.orders.tasks.relay_outbox_task",
+        "schedule": config("OUTBOX_RELAY_INTERVAL", default=10, cast=int),
+    },
+    "schedule-orders": {
+        "task": "apps.orders.tasks.schedule_orders_task",
+        "schedule": config("ORDER_SCHEDULER_INTERVAL", default=5, cast=int),
+    },
+    "reap-stuck-orders": {
+        "task": "apps.orders.tasks.reap_stuck_orders_task",
+        "schedule": config("ORDER_REAPER_INTERVAL", default=60, cast=int),
+    },
+    "purge-idempotency-keys": {
+        "task": "apps.orders.tasks.purge_idempotency_keys_task",
+        "schedule": config("ORDER_IDEMPOTENCY_PURGE_INTERVAL", default=3600, cast=int),
+    },
+    "take-inventory-snapshots": {
+        "task": "apps.products.tasks.take_inventory_snapshots_task",
+        "schedule": config("INVENTORY_SNAPSHOT_INTERVAL", default=3600, cast=int),
+    },
+    "rebalance-stock-shards": {
+        "task": "apps.products.tasks.rebalance_stock_shards_task",
+        "schedule": config("STOCK_SHARD_REBALANCE_INTERVAL", default=600, cast=int),
+    },
+    "reconcile-inventory": {
+        "task": "apps.products.tasks.reconcile_inventory_task",
+        "schedule": config(
+            "INVENTORY_RECONCILIATION_INTERVAL",
+            default=86400,
+            cast=int,
+        ),
+    },
+}
+
+# --- Products ---
+# Number of stock counters used when sharding is enabled from the admin
+PRODUCT_STOCK_SHARD_COUNT = config("PRODUCT_STOCK_SHARD_COUNT", default=8, cast=int)
+# The rebalancing task only locks and evens out sharded products whose
+# shards' unreserved stock differs by more than this many units
+STOCK_SHARD_REBALANCE_MIN_SPREAD = config(
+    "STOCK_SHARD_REBALANCE_MIN_SPREAD",
+    default=10,
+    cast=int,
+)
+# Cache holding each product's availability for the order creation
+# pre-check, and how long an entry may live without being refreshed
+PRODUCT_AVAILABILITY_CACHE = "default"
+PRODUCT_AVAILABILITY_CACHE_SECONDS = config(
+    "PRODUCT_AVAILABILITY_CACHE_SECONDS",
+    default=30,
+    cast=int,
+)
+
+# --- Order Processing ---
+# Maximum number of PENDING orders claimed by one batch processing task
+ORDER_BATCH_SIZE = config("ORDER_BATCH_SIZE", default=100, cast=int)
+# Admin approve and retry actions on more orders than this run in the
+# background, with their progress shown under "Bulk order actions"
+ORDER_ADMIN_SYNC_LIMIT = config("ORDER_ADMIN_SYNC_LIMIT", default=200, cast=int)
+# How scarce stock is shared between orders without a reservation: "fifo"
+# or "max_orders", see apps.orders.allocation
+ORDER_ALLOCATION_POLICY = config("ORDER_ALLOCATION_POLICY", default="fifo")
+# Reject orders for inactive or obviously out-of-stock products at creation,
+# from the cached availability, before any lock is taken
+ORDER_AVAILABILITY_PRECHECK = config(
+    "ORDER_AVAILABILITY_PRECHECK",
+    default=True,
+    cast=bool,
+)
+# Number of orders per Celery message when bulk-created orders are dispatched
+ORDER_DISPATCH_CHUNK_SIZE = config("ORDER_DISPATCH_CHUNK_SIZE", default=100, cast=int)
+# Orders in flight on the shared queue, across companies, and the orders
+# per unit of Company.order_weight granted in each round-robin pass of the
+# fair scheduler
+ORDER_SCHEDULER_CAPACITY = config("ORDER_SCHEDULER_CAPACITY", default=1000, cast=int)
+ORDER_SCHEDULER_QUANTUM = config("ORDER_SCHEDULER_QUANTUM", default=100, cast=int)
+# At most one extra scheduler run is queued at a time, on top of the beat;
+# the guard expires after this many seconds should that run be lost
+ORDER_SCHEDULER_WAKE_SECONDS = config(
+    "ORDER_SCHEDULER_WAKE_SECONDS",
+    default=30,
+    cast=int,
+)
+# Duration of the simulated external API call made for every order
+ORDER_EXTERNAL_CALL_SECONDS = config(
+    "ORDER_EXTERNAL_CALL_SECONDS",
+    default=5.0,
+    cast=float,
+)
+
+# Orders read, and written to the file, at a time by the export task; peak
+# memory of an export grows with this, not with the number of orders
+ORDER_EXPORT_CHUNK_SIZE = config("ORDER_EXPORT_CHUNK_SIZE", default=2000, cast=int)
+# Exports of more orders than this are split into shards of this many
+# orders, written in parallel by several workers and merged at the end
+ORDER_EXPORT_SHARD_SIZE = config(
+    "ORDER_EXPORT_SHARD_SIZE",
+    default=250_000,
+    cast=int,
+)
+
+# Orders hitting transient errors are retried up to ORDER_MAX_ATTEMPTS
+# attempts in all, after a jittered backoff starting at
+# ORDER_RETRY_BACKOFF_SECONDS and doubling up to the maximum
+ORDER_MAX_ATTEMPTS = config("ORDER_MAX_ATTEMPTS", default=5, cast=int)
+ORDER_RETRY_BACKOFF_SECONDS = config(
+    "ORDER_RETRY_BACKOFF_SECONDS",
+    default=10.0,
+    cast=float,
+)
+ORDER_RETRY_BACKOFF_MAX_SECONDS = config(
+    "ORDER_RETRY_BACKOFF_MAX_SECONDS",
+    default=600.0,
+    cast=float,
+)
+
+# Orders PROCESSING, or dispatched but still PENDING, for longer than this
+# lease are considered abandoned by their worker and reaped in batches of
+# ORDER_REAPER_BATCH_SIZE; keep it well above the slowest external call
+ORDER_LEASE_SECONDS = config("ORDER_LEASE_SECONDS", default=900, cast=int)
+ORDER_REAPER_BATCH_SIZE = config("ORDER_REAPER_BATCH_SIZE", default=1000, cast=int)
+
+# How long the responses of order creation requests sent with an
+# Idempotency-Key header are kept for replay, and where they are cached
+ORDER_IDEMPOTENCY_KEY_TTL_SECONDS = config(
+    "ORDER_IDEMPOTENCY_KEY_TTL_SECONDS",
+    default=86400,
+    cast=int,
+)
+ORDER_IDEMPOTENCY_CACHE = "default"
+
+# Token buckets limiting order creation per company and per user: RATE
+# orders per second on average, bursts of up to BURST orders
+ORDER_RATE_LIMITS = {
+    "TENANT": {
+        "RATE": config("ORDER_RATE_LIMIT_TENANT_RATE", default=50.0, cast=float),
+        "BURST": config("ORDER_RATE_LIMIT_TENANT_BURST", default=1000, cast=int),
+    },
+    "USER": {
+        "RATE": config("ORDER_RATE_LIMIT_USER_RATE", default=10.0, cast=float),
+        "BURST": config("ORDER_RATE_LIMIT_USER_BURST", default=500, cast=int),
+    },
+}
+ORDER_RATE_LIMIT_CACHE = "default"
+# Order creation is refused while a company has this many PENDING orders,
+# with a Retry-After of ORDER_ADMISSION_RETRY_AFTER seconds
+ORDER_ADMISSION_MAX_BACKLOG = config(
+    "ORDER_ADMISSION_MAX_BACKLOG",
+    default=50000,
+    cast=int,
+)
+ORDER_ADMISSION_RETRY_AFTER = config(
+    "ORDER_ADMISSION_RETRY_AFTER",
+    default=30,
+    cast=int,
+)
+ORDER_ADMISSION_BACKLOG_CACHE_SECONDS = config(
+    "ORDER_ADMISSION_BACKLOG_CACHE_SECONDS",
+    default=5,
+    cast=int,
+)
+
+# Outbox messages published per relay transaction, and how long published
+# messages are kept
+OUTBOX_RELAY_BATCH_SIZE = config("OUTBOX_RELAY_BATCH_SIZE", default=500, cast=int)
+OUTBOX_RETENTION_SECONDS = config("OUTBOX_RETENTION_SECONDS", default=86400, cast=int)
+
+# Gateway used for the external call of the order pipeline
+ORDER_FULFILLMENT = {
+    "BACKEND": config(
+        "ORDER_FULFILLMENT_BACKEND",
+        default="apps.orders.fulfillment.FakeFulfillmentBackend",
+    ),
+    "OPTIONS": {},
+    "MAX_CONCURRENCY": config(
+        "ORDER_FULFILLMENT_MAX_CONCURRENCY",
+        default=200,
+        cast=int,
+    ),
+    "TIMEOUT": config("ORDER_FULFILLMENT_TIMEOUT", default=30.0, cast=float),
+    "CIRCUIT_BREAKER_THRESHOLD": config(
+        "ORDER_FULFILLMENT_CIRCUIT_BREAKER_THRESHOLD",
+        default=5,
+        cast=int,
+    ),
+    "CIRCUIT_BREAKER_RESET_TIMEOUT": config(
+        "ORDER_FULFILLMENT_CIRCUIT_BREAKER_RESET_TIMEOUT",
+        default=30.0,
+        cast=float,
+    ),
+}
+
 
 LOGGING = {
     "version": 1,